@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the inner product kernel backends
+
+Times the `inner` and `filter` kernels of every available backend on a
+16384 Hz x 64 s frequency grid and prints the speedup over numpy.
+
+Example usage:
+    python examples/benchmark_kernels.py
+
+"""
+import timeit
+
+import numpy as np
+
+from gw_waveform_overlapper import kernels
+
+SAMPLING_FREQUENCY = 16384
+DURATION = 64
+NUM_T0S = 100
+REPEATS = 5
+
+
+def make_grid():
+    frequency = np.arange(0, SAMPLING_FREQUENCY / 2 + 1 / DURATION, 1 / DURATION)
+    rng = np.random.default_rng(0)
+    a = rng.normal(size=len(frequency)) + 1j * rng.normal(size=len(frequency))
+    b = rng.normal(size=len(frequency)) + 1j * rng.normal(size=len(frequency))
+    weights = rng.uniform(size=len(frequency))
+    t0s = np.linspace(-DURATION / 2, DURATION / 2, num=NUM_T0S)
+    return a, b, weights, frequency, t0s
+
+
+def main():
+    a, b, weights, frequency, t0s = make_grid()
+    print(f"Grid: {len(frequency)} frequencies, {NUM_T0S} filter times")
+    kernels.check_backends(a, b, weights, frequency, t0s[:5])
+    times = {}
+    for name in kernels.available_backends():
+        backend = kernels.load_backend(name)
+        backend.filter(a, b, weights, frequency, t0s[:1])  # warm up (JIT)
+        times[name] = (
+            min(timeit.repeat(lambda: backend.inner(a, b, weights),
+                              number=1, repeat=REPEATS)),
+            min(timeit.repeat(lambda: backend.filter(a, b, weights, frequency, t0s),
+                              number=1, repeat=REPEATS)),
+        )
+    numpy_inner, numpy_filter = times["numpy"]
+    for name, (inner_time, filter_time) in times.items():
+        print(f"{name:>8}: inner {inner_time * 1e3:8.2f} ms "
+              f"(x{numpy_inner / inner_time:5.1f}), "
+              f"filter {filter_time * 1e3:8.2f} ms "
+              f"(x{numpy_filter / filter_time:5.1f})")
+
+
+if __name__ == "__main__":
+    main()
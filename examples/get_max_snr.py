@@ -10,6 +10,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 import numpy as np
 
+from gw_waveform_overlapper.matched_filter import N_REALISATIONS, noise_realisation_study
 from gw_waveform_overlapper.overlap_computer import plot_overlap
 from gw_waveform_overlapper.waveform import Waveform
 
@@ -44,6 +45,12 @@ def main():
     w1 = Waveform.inject_signal(get_injection_params(a_2=0))
     w2 = Waveform.inject_signal(get_injection_params(a_2=0.2))
     plot_overlap(w1, w2, filename="max_snr_for_different_a2.png")
+    # empirical distributions over noise realisations, filtering w2 injected in noise with w1
+    results = noise_realisation_study(template=w1, injection=w2, n_realisations=N_REALISATIONS)
+    print(f"Zero noise: SNR {results['expected_snr']:.2f}, "
+          f"overlap {results['expected_overlap']:.4f}")
+    print(f"SNR: {results['snr'].summary()}")
+    print(f"Overlap: {results['overlap'].summary()}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
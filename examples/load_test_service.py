@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Load test of the local overlap service
+
+Starts the service on a Unix socket (or uses a running one given with
+--address), sends overlap requests from concurrent client threads, drawn from
+a small set of spin values so some requests repeat, and prints the latency
+percentiles, the throughput and the service's batching and cache counters.
+
+Example usage:
+    python examples/load_test_service.py --clients 8 --requests 50
+    python -m gw_waveform_overlapper serve --socket /tmp/overlaps.sock &
+    python examples/load_test_service.py --address /tmp/overlaps.sock
+
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from gw_waveform_overlapper.service import OverlapClient, OverlapService, create_server
+
+PERCENTILES = [50, 90, 99]
+N_POINTS = 20
+
+
+def get_injection_params(a_2):
+    return dict(
+        mass_1=36,
+        mass_2=29,
+        a_1=0.4,
+        a_2=a_2,
+        tilt_1=0.5,
+        tilt_2=1,
+        phi_12=1.7,
+        phi_jl=0.3,
+        luminosity_distance=400,
+        dec=-1.2208,
+        ra=1.375,
+        theta_jn=0.4,
+        psi=2.659,
+        phase=1.3,
+        geocent_time=0,
+    )
+
+
+def run_client(client, n_requests, seed, latencies, approximant):
+    rng = np.random.default_rng(seed)
+    spins = np.linspace(0, 0.9, N_POINTS)
+    for _ in range(n_requests):
+        start = time.perf_counter()
+        client.compute_overlap(get_injection_params(0), get_injection_params(rng.choice(spins)),
+                               approximant=approximant)
+        latencies.append(time.perf_counter() - start)
+
+
+def load_test(address, n_clients, n_requests, approximant):
+    client = OverlapClient(address)
+    latencies = []
+    threads = [
+        threading.Thread(target=run_client,
+                         args=(client, n_requests, seed, latencies, approximant))
+        for seed in range(n_clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies = np.array(latencies) * 1e3
+    print(f"{len(latencies)} requests from {n_clients} clients in {elapsed:.2f} s "
+          f"({len(latencies) / elapsed:.1f} requests/s)")
+    for q, value in zip(PERCENTILES, np.percentile(latencies, PERCENTILES)):
+        print(f"p{q}: {value:8.2f} ms")
+    print(f"max: {latencies.max():8.2f} ms")
+    print(f"service: {client.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--address", default=None,
+                        help="host:port or Unix socket of a running service")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=25, help="requests per client")
+    parser.add_argument("--approximant", default="IMRPhenomPv2")
+    args = parser.parse_args()
+    if args.address is not None:
+        load_test(args.address, args.clients, args.requests, args.approximant)
+        return
+    socket_path = os.path.join(tempfile.mkdtemp(), "overlaps.sock")
+    server = create_server(OverlapService(), socket_path=socket_path)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        load_test(socket_path, args.clients, args.requests, args.approximant)
+    finally:
+        server.shutdown()
+        server.server_close()
+        server.service.close()
+        os.remove(socket_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,9 +8,12 @@ Example usage:
 """
 import numpy as np
 
+from gw_waveform_overlapper.executors import executor_scope
 from gw_waveform_overlapper.multiple_overlaps import plot_overlaps
 from gw_waveform_overlapper.waveform import Waveform
 
+EXECUTOR = "serial"  # or e.g. dict(backend="process", max_workers=4)
+
 
 def get_injection_params(a_2, distance):
     """
@@ -38,11 +41,12 @@ def get_injection_params(a_2, distance):
     )
 
 
-def create_waveforms(dist_range):
-    w1s, w2s = [], []
-    for d in dist_range:
-        w1s.append(Waveform.inject_signal(get_injection_params(a_2=0, distance=d)))
-        w2s.append(Waveform.inject_signal(get_injection_params(a_2=0.1, distance=d)))
+def create_waveforms(dist_range, executor=EXECUTOR):
+    with executor_scope(executor) as pool:
+        w1s = pool.map(Waveform.inject_signal,
+                       [get_injection_params(a_2=0, distance=d) for d in dist_range])
+        w2s = pool.map(Waveform.inject_signal,
+                       [get_injection_params(a_2=0.1, distance=d) for d in dist_range])
     return w1s, w2s
 
 
@@ -50,7 +54,7 @@ def main():
     dist_range = np.linspace(300, 1500, num=50)
     w1s, w2s = create_waveforms(dist_range)
     overlap_x_data = dict(label='Distance [Mpc]', data=dist_range)
-    plot_overlaps(w1s, w2s, overlap_x_data, filename='distance_overlap.mp4')
+    plot_overlaps(w1s, w2s, overlap_x_data, executor=EXECUTOR, filename='distance_overlap.mp4')
 
 
 if __name__ == "__main__":
@@ -9,9 +9,12 @@ Example usage:
 import bilby
 import numpy as np
 
+from gw_waveform_overlapper.executors import executor_scope
 from gw_waveform_overlapper.multiple_overlaps import plot_overlaps
 from gw_waveform_overlapper.waveform import Waveform
 
+EXECUTOR = "serial"  # or e.g. dict(backend="process", max_workers=4)
+
 
 def get_injection_params(total_mass, a_2):
     """
@@ -45,11 +48,12 @@ def get_injection_params(total_mass, a_2):
     )
 
 
-def create_waveforms(mass_range):
-    w1s, w2s = [], []
-    for m in mass_range:
-        w1s.append(Waveform.inject_signal(get_injection_params(a_2=0, total_mass=m)))
-        w2s.append(Waveform.inject_signal(get_injection_params(a_2=0.1, total_mass=m)))
+def create_waveforms(mass_range, executor=EXECUTOR):
+    with executor_scope(executor) as pool:
+        w1s = pool.map(Waveform.inject_signal,
+                       [get_injection_params(a_2=0, total_mass=m) for m in mass_range])
+        w2s = pool.map(Waveform.inject_signal,
+                       [get_injection_params(a_2=0.1, total_mass=m) for m in mass_range])
     return w1s, w2s
 
 
@@ -57,7 +61,7 @@ def main():
     mass_range = np.linspace(40, 120, num=50)
     w1s, w2s = create_waveforms(mass_range)
     overlap_x_data = dict(label='Mass [Msun]', data=mass_range)
-    plot_overlaps(w1s, w2s, overlap_x_data, filename='mass_overlap.mp4')
+    plot_overlaps(w1s, w2s, overlap_x_data, executor=EXECUTOR, filename='mass_overlap.mp4')
 
 
 if __name__ == "__main__":
@@ -0,0 +1,146 @@
+"""
+
+A file for the caches of the gw_waveform_overlapper package.
+
+"""
+
+import threading
+from collections import OrderedDict
+
+from .executors import executor_scope
+from .waveform import Waveform, DEFAULT_SAMPLING_FREQ, REF_FREQ, MIN_FREQ
+
+CACHE_SIZE = 256
+TASK_SIZE = 16  # waveforms generated per worker task
+
+
+class LRUCache:
+    def __init__(self, maxsize=CACHE_SIZE):
+        """A bounded least-recently-used cache that counts its hits and misses
+
+        It is safe to share between threads; processes get their own copy.
+
+        :param maxsize: int max number of entries
+        """
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    @property
+    def stats(self):
+        """dict of hits, misses, hit_rate and size"""
+        with self._lock:
+            hits, misses, size = self.hits, self.misses, len(self._data)
+        calls = hits + misses
+        return dict(hits=hits, misses=misses, hit_rate=hits / calls if calls else 0.0, size=size)
+
+
+def parameters_key(parameters):
+    return tuple(sorted((k, float(v)) for k, v in parameters.items()))
+
+
+class WaveformCache(LRUCache):
+    def __init__(self, maxsize=CACHE_SIZE, duration=4,
+                 sampling_frequency=DEFAULT_SAMPLING_FREQ, reference_frequency=REF_FREQ,
+                 minimum_frequency=MIN_FREQ):
+        """Waveforms generated by `Waveform.inject_signal`, keyed by
+        (approximant, parameters) for a fixed grid
+
+        The cached Waveforms are shared, copy them before shifting them.
+        """
+        super().__init__(maxsize)
+        self.injection_kwargs = dict(
+            duration=duration, sampling_frequency=sampling_frequency,
+            reference_frequency=reference_frequency, minimum_frequency=minimum_frequency
+        )
+
+    def get_waveform(self, parameters, approximant='IMRPhenomPv2'):
+        key = (approximant, parameters_key(parameters))
+        wf = self.get(key)
+        if wf is None:
+            wf = Waveform.inject_signal(dict(parameters), approximant=approximant,
+                                        **self.injection_kwargs)
+            self[key] = wf
+        return wf
+
+    def generate(self, requests, executor=None):
+        """Looks up (approximant, parameters) requests, generating the missing
+        ones in parallel batches of `TASK_SIZE` points per approximant
+
+        :param requests: list of (approximant, param dict) tuples
+        :param executor: see `executors.get_executor`
+        :return: dict of cache key: Waveform for every request
+        """
+        found, missing = {}, {}
+        for approximant, parameters in requests:
+            key = (approximant, parameters_key(parameters))
+            if key in found or key in missing:
+                continue
+            wf = self.get(key)
+            if wf is None:
+                missing[key] = dict(parameters)
+            else:
+                found[key] = wf
+        tasks = []
+        for approximant in dict.fromkeys(key[0] for key in missing):
+            keys = [key for key in missing if key[0] == approximant]
+            for start in range(0, len(keys), TASK_SIZE):
+                tasks.append((approximant, keys[start:start + TASK_SIZE]))
+        with executor_scope(executor) as pool:
+            results = pool.starmap(_inject_signals, [
+                ([missing[key] for key in keys], approximant, self.injection_kwargs)
+                for approximant, keys in tasks
+            ])
+        for (_, keys), wfs in zip(tasks, results):
+            for key, wf in zip(keys, wfs):
+                self[key] = wf
+                found[key] = wf
+        return found
+
+    def get_waveforms(self, parameters_list, approximant='IMRPhenomPv2', executor=None):
+        """Like `get_waveform` for many points (see `generate`)"""
+        found = self.generate([(approximant, p) for p in parameters_list], executor)
+        return [found[(approximant, parameters_key(p))] for p in parameters_list]
+
+
+def _inject_signals(parameters_list, approximant, injection_kwargs):
+    return Waveform.inject_signals(parameters_list, approximant=approximant, **injection_kwargs)
@@ -0,0 +1,279 @@
+"""
+
+A file for the command line interface of the gw_waveform_overlapper package.
+
+A study is described by a json config, e.g.
+
+    {
+        "label": "spin_study",
+        "outdir": "outdir",
+        "approximant": "IMRPhenomPv2",
+        "duration": 4,
+        "sampling_frequency": 2048,
+        "psd": null,
+        "optimizer": "none",
+        "executor": "serial",
+        "checkpoint_interval": 10,
+        "parameters": {"mass_1": 36, "mass_2": 29, "a_2": 0, ...},
+        "grid": {"luminosity_distance": {"start": 300, "stop": 1500, "num": 50}},
+        "waveform_2": {"a_2": 0.1}
+    }
+
+where each study point is `parameters` updated by one point of the `grid`
+(the cartesian product of explicit lists or `np.linspace` kwargs), or by a draw
+from a bilby prior file given as `"prior": {"file": ..., "n_samples": ..., "seed": ...}`.
+The second waveform of each pair also has the `waveform_2` values, and
+"approximant" may be a pair of approximants. "optimizer" is one of 'none',
+'fft' or 'basinhopping'.
+
+Usage:
+    python -m gw_waveform_overlapper run study.json --shard 0 --n-shards 4
+    python -m gw_waveform_overlapper merge study.json --n-shards 4
+
+Each shard writes (and resumes from) a columnar npz checkpoint in the outdir,
+`merge` combines them into `<label>_result.npz`.
+
+    python -m gw_waveform_overlapper serve --socket /tmp/overlaps.sock
+
+runs the overlap service of `service.py` until interrupted.
+
+"""
+
+import argparse
+import functools
+import glob
+import itertools
+import json
+import os
+import re
+
+import numpy as np
+
+from . import overlap_optimizer
+from .executors import executor_scope
+from .overlap_computer import combine_polarisations, compute_overlap, \
+    fft_maximised_overlaps, get_weights
+from .service import DEFAULT_HOST, DEFAULT_PORT, serve
+from .waveform import Waveform
+
+OPTIMIZERS = ['none', 'fft', 'basinhopping']
+DEFAULT_CONFIG = dict(
+    label="study",
+    outdir="outdir",
+    approximant="IMRPhenomPv2",
+    duration=4,
+    sampling_frequency=2048,
+    psd=None,
+    optimizer="none",
+    executor="serial",
+    checkpoint_interval=10,
+    parameters={},
+    waveform_2={},
+)
+
+
+def load_config(filename):
+    with open(filename) as f:
+        config = dict(DEFAULT_CONFIG, **json.load(f))
+    if config["optimizer"] not in OPTIMIZERS:
+        raise ValueError(f"Unknown optimizer {config['optimizer']}, choose from {OPTIMIZERS}")
+    if ("grid" in config) == ("prior" in config):
+        raise ValueError("The config needs exactly one of 'grid' or 'prior'")
+    return config
+
+
+def get_study_points(config):
+    """
+    :return: list of the varied param dicts of every study point
+    """
+    if "grid" in config:
+        keys = list(config["grid"])
+        values = [
+            np.linspace(**v) if isinstance(v, dict) else v
+            for v in config["grid"].values()
+        ]
+        return [dict(zip(keys, map(float, point))) for point in itertools.product(*values)]
+    import bilby
+    prior = config["prior"]
+    priors = bilby.core.prior.PriorDict(filename=prior["file"])
+    # bilby priors draw from bilby's own generator, so every shard (and resumed
+    # run) must seed that one to get the same points under the same indices
+    bilby.core.utils.random.seed(prior.get("seed", 0))
+    samples = priors.sample(prior["n_samples"])
+    return [
+        {k: float(samples[k][i]) for k in samples}
+        for i in range(prior["n_samples"])
+    ]
+
+
+def get_shard_filename(config, shard, n_shards):
+    return os.path.join(config["outdir"], f"{config['label']}_shard{shard}of{n_shards}.npz")
+
+
+def get_result_filename(config):
+    return os.path.join(config["outdir"], f"{config['label']}_result.npz")
+
+
+def evaluate_point(config, point):
+    """
+    :return: dict of the overlap (and time, phase shift for optimizers) of a point
+    """
+    approximants = config["approximant"]
+    if isinstance(approximants, str):
+        approximants = [approximants] * 2
+    parameters = dict(config["parameters"], **point)
+    wfs = [
+        Waveform.inject_signal(
+            p, approximant=approximant, duration=config["duration"],
+            sampling_frequency=config["sampling_frequency"]
+        )
+        for p, approximant in zip(
+            [parameters, dict(parameters, **config["waveform_2"])], approximants)
+    ]
+    if config["optimizer"] == "none":
+        return dict(overlap=compute_overlap(*wfs, psd=config["psd"]))
+    if config["optimizer"] == "fft":
+        # maximised on the waveforms generated above, `fft_overlap_optimizer`
+        # would regenerate them with the default approximant and grid
+        overlap, time, phase = fft_maximised_overlaps(
+            *[combine_polarisations(wf) for wf in wfs],
+            get_weights(config["psd"], wfs[0].frequency), wfs[0].sampling_frequency)
+        overlap, time, phase = float(overlap), float(time), float(phase)
+    else:
+        time, phase, overlap, _ = overlap_optimizer.overlap_optimizer(*wfs, psd=config["psd"])
+    return dict(overlap=overlap, time_shift=time, phase_shift=phase)
+
+
+def _load_columns(filename):
+    if not os.path.exists(filename):
+        return {}
+    with np.load(filename) as data:
+        return {k: data[k] for k in data.files}
+
+
+def _save_columns(filename, columns):
+    # write then rename so a killed job never leaves a partial checkpoint
+    tmp_filename = os.path.join(
+        os.path.dirname(filename), f".{os.path.basename(filename)}.tmp.npz")
+    np.savez_compressed(tmp_filename, **columns)
+    os.replace(tmp_filename, filename)
+
+
+def run_shard(config, shard=0, n_shards=1):
+    """Evaluates every `n_shards`th study point starting at `shard`
+
+    Results are checkpointed every `checkpoint_interval` points, and points
+    already in the shard file are skipped, so a killed job can be rerun.
+
+    :return: dict of result columns
+    """
+    if not 0 <= shard < n_shards:
+        raise ValueError(f"Shard {shard} is not in [0, {n_shards})")
+    os.makedirs(config["outdir"], exist_ok=True)
+    filename = get_shard_filename(config, shard, n_shards)
+    points = get_study_points(config)
+    columns = _load_columns(filename)
+    done = set(columns.get("index", []))
+    todo = [i for i in range(shard, len(points), n_shards) if i not in done]
+    evaluate = functools.partial(evaluate_point, config)
+    interval = config["checkpoint_interval"]
+    with executor_scope(config["executor"]) as pool:
+        for start in range(0, len(todo), interval):
+            indices = todo[start:start + interval]
+            results = pool.map(evaluate, [points[i] for i in indices])
+            new_columns = dict(index=np.array(indices))
+            for key in points[0]:
+                new_columns[key] = np.array([points[i][key] for i in indices])
+            for key in results[0]:
+                new_columns[key] = np.array([r[key] for r in results])
+            columns = {
+                k: np.concatenate([columns[k], v]) if k in columns else v
+                for k, v in new_columns.items()
+            }
+            _save_columns(filename, columns)
+            print(f"Shard {shard}/{n_shards}: {len(columns['index'])} points saved to {filename}")
+    return columns
+
+
+def get_shard_filenames(config, n_shards=None):
+    """
+    :param n_shards: int number of shards of the run, or None to accept any
+        if all the shard files of the study agree on it
+    :return: list of the shard filenames of the study, in shard order
+    :raises ValueError: if shard files of several shard counts are found and
+        `n_shards` is not given
+    """
+    pattern = re.compile(rf"{re.escape(config['label'])}_shard(\d+)of(\d+)\.npz")
+    shards = {}
+    for filename in glob.glob(os.path.join(config["outdir"], f"{config['label']}_shard*of*.npz")):
+        match = pattern.fullmatch(os.path.basename(filename))
+        if match:
+            shard, n = map(int, match.groups())
+            shards.setdefault(n, []).append((shard, filename))
+    if n_shards is None:
+        if len(shards) > 1:
+            raise ValueError(
+                f"Shard files of {sorted(shards)} shards found for {config['label']}, "
+                f"choose one with n_shards (--n-shards)")
+        n_shards = next(iter(shards), None)
+    return [filename for _, filename in sorted(shards.get(n_shards, []))]
+
+
+def merge_shards(config, n_shards=None):
+    """Combines the shard files of a study into one result file ordered by point
+
+    :param n_shards: int number of shards of the run to merge, see `get_shard_filenames`
+    :return: dict of result columns
+    """
+    filenames = get_shard_filenames(config, n_shards)
+    if not filenames:
+        raise FileNotFoundError(f"No shard files for {config['label']} in {config['outdir']}")
+    shards = [_load_columns(f) for f in filenames]
+    columns = {k: np.concatenate([s[k] for s in shards]) for k in shards[0]}
+    _, order = np.unique(columns["index"], return_index=True)  # sorted, no repeats
+    columns = {k: v[order] for k, v in columns.items()}
+    n_points = len(get_study_points(config))
+    if len(columns["index"]) != n_points:
+        print(f"Warning: {len(columns['index'])} of {n_points} points have results")
+    filename = get_result_filename(config)
+    _save_columns(filename, columns)
+    print(f"Merged {len(filenames)} shards into {filename}")
+    return columns
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        prog="gw_waveform_overlapper", description="Run sharded waveform overlap studies")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="Evaluate one shard of a study")
+    run_parser.add_argument("config", help="json study config")
+    run_parser.add_argument("--shard", type=int, default=0, help="index of the shard to run")
+    run_parser.add_argument("--n-shards", type=int, default=1, help="number of shards")
+    merge_parser = subparsers.add_parser("merge", help="Merge the shard results of a study")
+    merge_parser.add_argument("config", help="json study config")
+    merge_parser.add_argument("--n-shards", type=int, default=None,
+                              help="number of shards of the run to merge")
+    serve_parser = subparsers.add_parser("serve", help="Run the local overlap service")
+    serve_parser.add_argument("--host", default=DEFAULT_HOST, help="host to serve on")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port to serve on")
+    serve_parser.add_argument("--socket", default=None,
+                              help="Unix socket to serve on instead of host:port")
+    serve_parser.add_argument("--executor", default=None,
+                              help="executor backend used for waveform generation")
+    return parser
+
+
+def main(args=None):
+    args = create_parser().parse_args(args)
+    if args.command == "serve":
+        serve(args.host, args.port, args.socket, executor=args.executor)
+        return
+    config = load_config(args.config)
+    if args.command == "run":
+        run_shard(config, args.shard, args.n_shards)
+    else:
+        merge_shards(config, args.n_shards)
+
+
+if __name__ == "__main__":
+    main()
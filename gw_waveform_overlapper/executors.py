@@ -0,0 +1,233 @@
+"""
+
+A file for running batches of tasks in parallel for the gw_waveform_overlapper
+package.
+
+Every batch function of the package takes an `executor` argument, which is
+passed through `get_executor`, so a study moves from a laptop to a cluster by
+changing that one argument, e.g.
+
+    calculate_multiple_overlaps(w1s, w2s, executor="serial")
+    calculate_multiple_overlaps(w1s, w2s, executor=dict(backend="process", max_workers=8))
+    calculate_multiple_overlaps(w1s, w2s, executor="mpi")
+
+The process backend starts its workers with `DEFAULT_START_METHOD`
+('forkserver' where available), so scripts using it need an
+`if __name__ == "__main__":` guard. The MPI backend uses `mpi4py.futures`, so
+scripts using it are launched with
+    mpirun -n 4 python -m mpi4py.futures script.py
+
+"""
+
+import abc
+import concurrent.futures
+import contextlib
+import math
+import multiprocessing
+import os
+import traceback
+
+DEFAULT_EXECUTOR = os.environ.get("GW_OVERLAP_EXECUTOR", "serial")
+# forking a process whose threads are running (e.g. the numba kernels' TBB
+# pool) can leave the workers or the interpreter hanging, so workers are
+# started from a clean process unless another start method is asked for
+DEFAULT_START_METHOD = os.environ.get(
+    "GW_OVERLAP_START_METHOD",
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+CHUNKS_PER_WORKER = 4
+
+
+class TaskFailure:
+    def __init__(self, index, exception, traceback_text):
+        """Placeholder for the result of a task that raised an exception
+
+        :param index: int position of the task in the batch
+        :param exception: the exception raised by the task
+        :param traceback_text: str of the formatted traceback
+        """
+        self.index = index
+        self.exception = exception
+        self.traceback = traceback_text
+
+    def __repr__(self):
+        return f"TaskFailure(index={self.index}, exception={self.exception!r})"
+
+
+def _run_chunk(func, chunk, capture_failures):
+    results = []
+    for index, args in chunk:
+        try:
+            results.append((index, func(*args)))
+        except Exception as e:
+            if not capture_failures:
+                raise
+            results.append((index, TaskFailure(index, e, traceback.format_exc())))
+    return results
+
+
+class Executor:
+    def __init__(self, max_workers=None, chunksize=None, capture_failures=False):
+        """
+
+        :param max_workers: int number of workers (ignored when running serially)
+        :param chunksize: int number of tasks sent to a worker at once
+            (defaults to splitting the batch into `CHUNKS_PER_WORKER` chunks per worker)
+        :param capture_failures: bool, if True failed tasks return a `TaskFailure`
+            instead of raising
+        """
+        self.chunksize = chunksize
+        self.capture_failures = capture_failures
+
+    @property
+    def num_workers(self):
+        return 1
+
+    def map(self, func, *iterables):
+        """Like the builtin `map`, but returns a list in input order"""
+        return self.starmap(func, zip(*iterables))
+
+    def starmap(self, func, iterable):
+        tasks = list(enumerate(tuple(args) for args in iterable))
+        if not tasks:
+            return []
+        chunksize = self.chunksize or math.ceil(
+            len(tasks) / (self.num_workers * CHUNKS_PER_WORKER))
+        chunks = [tasks[i:i + chunksize] for i in range(0, len(tasks), chunksize)]
+        results = [None] * len(tasks)
+        for chunk_result in self._run_chunks(func, chunks):
+            for index, result in chunk_result:
+                results[index] = result
+        return results
+
+    def _run_chunks(self, func, chunks):
+        for chunk in chunks:
+            yield _run_chunk(func, chunk, self.capture_failures)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class SerialExecutor(Executor):
+    pass
+
+
+class PoolExecutor(Executor, abc.ABC):
+    def __init__(self, max_workers=None, chunksize=None, capture_failures=False):
+        """Runs chunks on a `concurrent.futures` pool.
+
+        Chunks are queued on the pool and picked up by whichever worker is
+        idle, so uneven tasks balance out; results are reordered to input order.
+        """
+        super().__init__(max_workers, chunksize, capture_failures)
+        self.max_workers = max_workers or os.cpu_count()
+        self._pool = None
+
+    @property
+    def num_workers(self):
+        return self.max_workers
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = self._make_pool()
+        return self._pool
+
+    @abc.abstractmethod
+    def _make_pool(self):
+        """:return: the `concurrent.futures.Executor` the chunks are submitted to"""
+
+    def _run_chunks(self, func, chunks):
+        futures = [
+            self.pool.submit(_run_chunk, func, chunk, self.capture_failures)
+            for chunk in chunks
+        ]
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+class ThreadExecutor(PoolExecutor):
+    def _make_pool(self):
+        return concurrent.futures.ThreadPoolExecutor(self.max_workers)
+
+
+class ProcessExecutor(PoolExecutor):
+    def __init__(self, max_workers=None, chunksize=None, capture_failures=False,
+                 start_method=None):
+        """
+
+        :param start_method: str `multiprocessing` start method of the workers
+            ('fork', 'forkserver' or 'spawn'), defaults to `DEFAULT_START_METHOD`
+        """
+        super().__init__(max_workers, chunksize, capture_failures)
+        self.start_method = start_method or DEFAULT_START_METHOD
+
+    def _make_pool(self):
+        return concurrent.futures.ProcessPoolExecutor(
+            self.max_workers, mp_context=multiprocessing.get_context(self.start_method))
+
+
+class MPIExecutor(PoolExecutor):
+    def __init__(self, max_workers=None, chunksize=None, capture_failures=False):
+        from mpi4py import MPI
+        max_workers = max_workers or max(MPI.COMM_WORLD.Get_size() - 1, 1)
+        super().__init__(max_workers, chunksize, capture_failures)
+
+    def _make_pool(self):
+        from mpi4py.futures import MPIPoolExecutor
+        return MPIPoolExecutor(self.max_workers)
+
+
+EXECUTORS = dict(
+    serial=SerialExecutor,
+    thread=ThreadExecutor,
+    process=ProcessExecutor,
+    mpi=MPIExecutor,
+)
+
+
+def get_executor(executor=None):
+    """
+    :param executor: an Executor, the name of a backend ('serial', 'thread',
+        'process' or 'mpi'), a dict with a 'backend' key and the Executor
+        kwargs, or None for `DEFAULT_EXECUTOR`
+    :return: Executor
+    """
+    if isinstance(executor, Executor):
+        return executor
+    if executor is None:
+        executor = DEFAULT_EXECUTOR
+    if isinstance(executor, str):
+        executor = dict(backend=executor)
+    kwargs = dict(executor)
+    backend = kwargs.pop("backend", "serial")
+    if backend not in EXECUTORS:
+        raise ValueError(f"Unknown executor {backend}, choose from {list(EXECUTORS)}")
+    return EXECUTORS[backend](**kwargs)
+
+
+@contextlib.contextmanager
+def executor_scope(executor=None):
+    """Yields `get_executor(executor)`, closing it afterwards only if it was
+    created here (executors passed in by the caller are left open for reuse)."""
+    owned = not isinstance(executor, Executor)
+    executor = get_executor(executor)
+    try:
+        yield executor
+    finally:
+        if owned:
+            executor.close()
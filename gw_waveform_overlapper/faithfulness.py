@@ -0,0 +1,116 @@
+"""
+
+A file for surveying the faithfulness between approximants for the
+gw_waveform_overlapper package.
+
+Every parameter point is generated under each approximant on one shared
+frequency grid, and each pair of approximants is compared by the overlap
+maximised over time and phase (`fft_maximised_overlaps`) with one set of PSD
+weights. Points are processed in blocks, so the waveforms in memory are
+bounded by `BLOCK_SIZE` times the number of approximants; generated waveforms
+are kept in a `WaveformCache` shared between surveys.
+
+    table = faithfulness_survey(points, ["IMRPhenomPv2", "IMRPhenomXPHM"], executor="process")
+    for row in rank_worst_cases(table, n=5):
+        print(row)
+
+"""
+
+import itertools
+
+import bilby
+import numpy as np
+
+from .cache import WaveformCache, parameters_key
+from .overlap_computer import combine_polarisations, fft_maximised_overlaps, \
+    get_zero_noise_psd
+from .psd import interpolate_psd
+from .waveform import AUTO, DEFAULT_SAMPLING_FREQ, REF_FREQ, MIN_FREQ, get_common_grid
+
+BLOCK_SIZE = 64
+WORST_CASES = 10
+MIN_COLUMN = "min_faithfulness"
+
+
+def get_pair_label(approximant_1, approximant_2):
+    return f"{approximant_1}_vs_{approximant_2}"
+
+
+def faithfulness_survey(points, approximants, reference=None, psd=None, duration=4,
+                        sampling_frequency=DEFAULT_SAMPLING_FREQ,
+                        reference_frequency=REF_FREQ, minimum_frequency=MIN_FREQ,
+                        executor=None, cache=None):
+    """Time and phase maximised overlaps of each point under pairs of approximants
+
+    :param points: list of injection param dicts
+    :param approximants: list of str approximants
+    :param reference: str approximant every other approximant is compared
+        to (default: every pair of approximants)
+    :param psd: bilby PowerSpectralDensity, PSD filename or (frequency, psd) tuple
+    :param duration: float, or 'auto' for the smallest grid fitting every point
+    :param sampling_frequency: float, or 'auto' (see `waveform.get_common_grid`)
+    :param executor: see `executors.get_executor`, used for waveform generation
+    :param cache: WaveformCache (on the same grid) to reuse waveforms from
+    :return: dict of columns: index, the params, one overlap column per pair
+        of approximants and `MIN_COLUMN`, the smallest overlap of each point
+    """
+    points = [dict(p) for p in points]
+    if duration == AUTO or sampling_frequency == AUTO:
+        auto_duration, auto_sampling_frequency = get_common_grid(points, minimum_frequency)
+        duration = auto_duration if duration == AUTO else duration
+        sampling_frequency = (auto_sampling_frequency if sampling_frequency == AUTO
+                              else sampling_frequency)
+    if cache is None:
+        cache = WaveformCache(
+            len(approximants) * BLOCK_SIZE, duration=duration,
+            sampling_frequency=sampling_frequency, reference_frequency=reference_frequency,
+            minimum_frequency=minimum_frequency)
+    if reference is None:
+        pairs = list(itertools.combinations(approximants, 2))
+    else:
+        pairs = [(reference, a) for a in approximants if a != reference]
+    frequency = bilby.core.utils.create_frequency_series(sampling_frequency, duration)
+    weights = 1 / interpolate_psd(get_zero_noise_psd() if psd is None else psd, frequency)
+    overlaps = {pair: [] for pair in pairs}
+    for start in range(0, len(points), BLOCK_SIZE):
+        block = points[start:start + BLOCK_SIZE]
+        found = cache.generate(
+            [(a, p) for a in approximants for p in block], executor=executor)
+        keys = [parameters_key(p) for p in block]
+        signals = {
+            a: np.array([combine_polarisations(found[(a, key)]) for key in keys])
+            for a in approximants
+        }
+        for a, b in pairs:
+            overlap, _, _ = fft_maximised_overlaps(signals[a], signals[b], weights,
+                                                  sampling_frequency)
+            overlaps[(a, b)].append(overlap)
+
+    table = dict(index=np.arange(len(points)))
+    for key in points[0]:
+        table[key] = np.array([p[key] for p in points])
+    for pair in pairs:
+        table[get_pair_label(*pair)] = np.concatenate(overlaps[pair])
+    table[MIN_COLUMN] = np.min([table[get_pair_label(*pair)] for pair in pairs], axis=0)
+    return table
+
+
+def rank_worst_cases(table, n=WORST_CASES, column=MIN_COLUMN):
+    """
+    :return: list of the n rows (dicts) of the table with the lowest `column`
+    """
+    order = np.argsort(table[column])[:n]
+    return [{k: v[i].item() for k, v in table.items()} for i in order]
+
+
+def format_table(rows, columns=None):
+    """:return: str of the rows as aligned text columns"""
+    if not rows:
+        return ""
+    columns = columns or list(rows[0])
+    cells = [[f"{row[c]:.6g}" if isinstance(row[c], float) else str(row[c]) for c in columns]
+             for row in rows]
+    widths = [max(len(c), *(len(r[i]) for r in cells)) for i, c in enumerate(columns)]
+    lines = ["  ".join(c.rjust(w) for c, w in zip(columns, widths))]
+    lines += ["  ".join(c.rjust(w) for c, w in zip(r, widths)) for r in cells]
+    return "\n".join(lines)
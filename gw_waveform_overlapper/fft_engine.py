@@ -0,0 +1,168 @@
+"""
+
+A file for the Fourier transforms of the gw_waveform_overlapper package.
+
+Transforms run along the last axis, so a (M, 2, N) array of the polarisations
+of M waveforms is one batched call. The `scipy` engine uses `scipy.fft` with
+worker threads; the `pyfftw` engine (used when the package is installed)
+keeps an FFTW plan with aligned input and output buffers per (kind, shape,
+dtype) and reuses them for every later transform of that shape. The engine is
+picked at runtime with `set_engine` (or the GW_OVERLAP_FFT_ENGINE environment
+variable).
+
+"""
+
+import abc
+import contextlib
+import os
+import threading
+
+import numpy as np
+import scipy.fft
+
+DEFAULT_ENGINE = os.environ.get("GW_OVERLAP_FFT_ENGINE", "scipy")
+PLAN_CACHE_SIZE = 32
+
+
+class FFTEngine(abc.ABC):
+    name = None
+
+    def __init__(self, workers=None):
+        """
+
+        :param workers: int number of threads per transform (default: all CPUs)
+        """
+        self.workers = workers or os.cpu_count() or 1
+
+    @abc.abstractmethod
+    def _transform(self, kind, x, n, scale, out):
+        """`kind` ('irfft' or 'ifft') of x along the last axis, times scale"""
+
+    def irfft(self, x, n=None, scale=1, out=None):
+        """Real inverse FFT along the last axis
+
+        :param x: ndarray (..., N) of complex
+        :param n: int length of the output (default 2 (N - 1))
+        :param scale: float the result is multiplied by
+        :param out: optional float ndarray (..., n) to write the result to
+        """
+        return self._transform("irfft", x, n, scale, out)
+
+    def ifft(self, x, n=None, scale=1, out=None):
+        """Complex inverse FFT along the last axis, see `irfft`"""
+        return self._transform("ifft", x, n, scale, out)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(workers={self.workers})"
+
+
+class ScipyEngine(FFTEngine):
+    name = "scipy"
+
+    def _transform(self, kind, x, n, scale, out):
+        result = getattr(scipy.fft, kind)(x, n=n, axis=-1, workers=self.workers)
+        if out is None:
+            return result if scale == 1 else np.multiply(result, scale, out=result)
+        return np.multiply(result, scale, out=out)
+
+
+class PyFFTWEngine(FFTEngine):
+    name = "pyfftw"
+
+    def __init__(self, workers=None, planner_effort="FFTW_ESTIMATE"):
+        import pyfftw
+        super().__init__(workers)
+        self.pyfftw = pyfftw
+        self.planner_effort = planner_effort
+        self.plans = {}
+
+    def get_plan(self, kind, shape, dtype, n=None):
+        """The cached (plan, lock) of a transform of an input of this shape and dtype"""
+        n = n or (2 * (shape[-1] - 1) if kind == "irfft" else shape[-1])
+        key = (kind, tuple(shape), np.dtype(dtype).str, n)
+        plan = self.plans.get(key)
+        if plan is None:
+            if len(self.plans) >= PLAN_CACHE_SIZE:
+                self.plans.pop(next(iter(self.plans)))
+            input_shape = tuple(shape[:-1]) + ((n // 2 + 1) if kind == "irfft" else n,)
+            output_shape = tuple(shape[:-1]) + (n,)
+            output_dtype = float if kind == "irfft" else complex
+            plan = (self.pyfftw.FFTW(
+                self.pyfftw.empty_aligned(input_shape, dtype=complex),
+                self.pyfftw.empty_aligned(output_shape, dtype=output_dtype),
+                axes=(-1,), direction="FFTW_BACKWARD", flags=(self.planner_effort,),
+                threads=self.workers
+            ), threading.Lock())
+            self.plans[key] = plan
+        return plan
+
+    def _transform(self, kind, x, n, scale, out):
+        x = np.asarray(x)
+        plan, lock = self.get_plan(kind, x.shape, x.dtype, n)
+        with lock:
+            length = min(x.shape[-1], plan.input_array.shape[-1])
+            plan.input_array[..., :length] = x[..., :length]  # crops or zero pads as numpy
+            plan.input_array[..., length:] = 0
+            plan(normalise_idft=True)
+            # the plan's output buffer is reused, so the result is scaled into a new array or out
+            return np.multiply(plan.output_array, scale, out=out)
+
+
+ENGINES = dict(scipy=ScipyEngine, pyfftw=PyFFTWEngine)
+_current_engine = None
+
+
+def available_engines():
+    """
+    :return: list of the names of the engines that can be built
+    """
+    names = []
+    for name, engine in ENGINES.items():
+        try:
+            engine()
+            names.append(name)
+        except ImportError:
+            pass
+    return names
+
+
+def get_engine():
+    global _current_engine
+    if _current_engine is None:
+        _current_engine = ENGINES[DEFAULT_ENGINE]()
+    return _current_engine
+
+
+def set_engine(name, workers=None):
+    """Sets the engine used by the package's transforms
+
+    :param name: one of 'scipy' or 'pyfftw'
+    :param workers: int number of threads per transform
+    :return: the previously used FFTEngine
+    :raises ImportError: if pyfftw is requested but not installed
+    """
+    global _current_engine
+    if name not in ENGINES:
+        raise ValueError(f"Unknown engine {name}, choose from {list(ENGINES)}")
+    previous = get_engine()
+    _current_engine = ENGINES[name](workers)
+    return previous
+
+
+@contextlib.contextmanager
+def use_engine(name, workers=None):
+    global _current_engine
+    previous = set_engine(name, workers)
+    try:
+        yield _current_engine
+    finally:
+        _current_engine = previous
+
+
+def infft(frequency_series, sampling_frequency, out=None):
+    """Batched `bilby.core.utils.infft`: irfft along the last axis times the sampling frequency"""
+    return get_engine().irfft(frequency_series, scale=sampling_frequency, out=out)
+
+
+def ifft(x, n=None):
+    return get_engine().ifft(x, n=n)
@@ -0,0 +1,165 @@
+"""
+
+A file for fitting factor searches over template banks for the
+gw_waveform_overlapper package.
+
+The fitting factor of a signal s is its overlap with the best template,
+maximised over time, phase and the intrinsic parameters θ,
+
+    FF(s) = max_θ max_(t, φ) O(s, h(θ)).
+
+The search is hierarchical: the whole bank is scored with one inverse FFT
+per template (`fft_maximised_overlaps`), then the `top_k` templates are
+refined with a Nelder-Mead search over `keys`. Templates generated during
+the refinement are kept in a `WaveformCache`.
+
+"""
+
+import numpy as np
+from scipy.optimize import minimize
+
+from .cache import CACHE_SIZE, WaveformCache
+from .executors import executor_scope
+from .overlap_computer import combine_polarisations, fft_maximised_overlaps, \
+    get_zero_noise_psd
+from .psd import interpolate_psd
+from .waveform import Waveform, DEFAULT_SAMPLING_FREQ, REF_FREQ, MIN_FREQ
+
+TOP_K = 3
+BANK_CHUNK = 64  # templates scored per inverse FFT batch
+MAX_ITER = 200
+TOLERANCE = 1e-4
+RELATIVE_STEP = 0.05
+STEP_SIZES = dict(mass_1=1, mass_2=1, chirp_mass=0.5, total_mass=2, mass_ratio=0.05,
+                  a_1=0.1, a_2=0.1, tilt_1=0.2, tilt_2=0.2)
+MASSES = ['mass_1', 'mass_2', 'chirp_mass', 'total_mass', 'mass_ratio']
+SPINS = ['a_1', 'a_2']
+
+
+def _is_physical(parameters):
+    return (all(parameters[k] > 0 for k in MASSES if k in parameters)
+            and all(0 <= parameters[k] <= 1 for k in SPINS if k in parameters)
+            and parameters.get('mass_ratio', 0) <= 1)
+
+
+class FittingFactorSearch:
+    def __init__(self, bank_parameters, keys=('mass_1', 'mass_2'), psd=None, top_k=TOP_K,
+                 approximant='IMRPhenomPv2', signal_approximant=None, duration=4,
+                 sampling_frequency=DEFAULT_SAMPLING_FREQ, reference_frequency=REF_FREQ,
+                 minimum_frequency=MIN_FREQ, cache_size=CACHE_SIZE):
+        """
+
+        :param bank_parameters: list of the injection param dicts of the templates
+        :param keys: list of the params varied when refining a template
+        :param psd: bilby PowerSpectralDensity, PSD filename or (frequency, psd) tuple
+        :param top_k: int number of coarse templates that are refined
+        :param approximant: str approximant of the templates
+        :param signal_approximant: str approximant of the signals (defaults to `approximant`)
+        :param cache_size: int max number of refinement templates kept in memory
+        """
+        self.keys = list(keys)
+        self.top_k = top_k
+        self.approximant = approximant
+        self.signal_approximant = signal_approximant or approximant
+        self.injection_kwargs = dict(
+            duration=duration, sampling_frequency=sampling_frequency,
+            reference_frequency=reference_frequency, minimum_frequency=minimum_frequency
+        )
+        self.cache = WaveformCache(cache_size, **self.injection_kwargs)
+        self.bank_parameters = [dict(p) for p in bank_parameters]
+        bank = Waveform.inject_signals(self.bank_parameters, approximant=approximant,
+                                       **self.injection_kwargs)
+        self.frequency = bank[0].frequency
+        self.sampling_frequency = bank[0].sampling_frequency
+        self.weights = 1 / interpolate_psd(
+            get_zero_noise_psd() if psd is None else psd, self.frequency)
+        self.bank = np.array([combine_polarisations(wf) for wf in bank])
+
+    def _get_signal(self, signal):
+        if isinstance(signal, np.ndarray):
+            return signal
+        if isinstance(signal, dict):
+            signal = Waveform.inject_signal(dict(signal), approximant=self.signal_approximant,
+                                            **self.injection_kwargs)
+        return combine_polarisations(signal)
+
+    def coarse_search(self, signal):
+        """Scores every template of the bank against the signal
+
+        :param signal: Waveform, dict of injection params or ndarray of the
+            combined polarisations of the signal
+        :return: tuple of ndarrays (overlap, time, phase) for each template
+        """
+        h = self._get_signal(signal)
+        results = [
+            fft_maximised_overlaps(h, self.bank[start:start + BANK_CHUNK], self.weights,
+                                   self.sampling_frequency)
+            for start in range(0, len(self.bank), BANK_CHUNK)
+        ]
+        return tuple(np.concatenate(r) for r in zip(*results))
+
+    def template_overlap(self, h, parameters):
+        """:return: tuple of (overlap, time, phase) of the template at `parameters`"""
+        if not _is_physical(parameters):
+            return 0., 0., 0.
+        template = combine_polarisations(
+            self.cache.get_waveform(parameters, approximant=self.approximant))
+        return tuple(float(x) for x in fft_maximised_overlaps(
+            h, template, self.weights, self.sampling_frequency))
+
+    def refine(self, h, start_parameters):
+        """Nelder-Mead search over `keys` starting at `start_parameters`
+
+        :param h: ndarray of the combined polarisations of the signal
+        :return: dict of the best params and its (overlap, time, phase)
+        """
+        x0 = np.array([start_parameters[k] for k in self.keys], dtype=float)
+        steps = [STEP_SIZES.get(k, RELATIVE_STEP * (abs(x) or 1)) for k, x in zip(self.keys, x0)]
+        simplex = np.vstack([x0, x0 + np.diag(steps)])
+
+        def to_parameters(x):
+            return dict(start_parameters, **dict(zip(self.keys, map(float, x))))
+
+        result = minimize(
+            lambda x: -self.template_overlap(h, to_parameters(x))[0], x0,
+            method='Nelder-Mead',
+            options=dict(initial_simplex=simplex, maxiter=MAX_ITER, xatol=TOLERANCE,
+                         fatol=TOLERANCE)
+        )
+        parameters = to_parameters(result.x)
+        overlap, time, phase = self.template_overlap(h, parameters)
+        return dict(parameters=parameters, overlap=overlap, time=time, phase=phase)
+
+    def search(self, signal):
+        """Fitting factor of one signal
+
+        :param signal: Waveform or dict of injection params
+        :return: dict of fitting_factor, parameters, time, phase of the best
+            template, and the coarse_fitting_factor and template_index of the bank
+        """
+        h = self._get_signal(signal)
+        overlaps, _, _ = self.coarse_search(h)
+        top = np.argsort(overlaps)[::-1][:self.top_k]
+        best = max((self.refine(h, self.bank_parameters[i]) for i in top),
+                   key=lambda r: r['overlap'])
+        return dict(
+            fitting_factor=best['overlap'],
+            parameters=best['parameters'],
+            time=best['time'],
+            phase=best['phase'],
+            coarse_fitting_factor=float(overlaps[top[0]]),
+            template_index=int(top[0]),
+        )
+
+    def search_many(self, signals, executor=None):
+        """`search` for each signal
+
+        With a process executor each worker gets its own copy of the bank and
+        template cache.
+
+        :param signals: list of Waveforms or dicts of injection params
+        :param executor: executor name, config dict or Executor (see `executors.get_executor`)
+        :return: list of the `search` result dicts
+        """
+        with executor_scope(executor) as pool:
+            return pool.map(self.search, signals)
@@ -0,0 +1,225 @@
+"""
+
+A file for the numerical kernels behind the inner products of the
+gw_waveform_overlapper package.
+
+Each backend provides two kernels,
+    inner(a, b, weights) = Σ a*(f) b(f) w(f)
+    filter(a, b, weights, frequency, t0s) = Σ a*(f) b(f) w(f) exp(2πi f t0)
+where w(f) = 1/PSD(f). The `numpy` backend is always available, the `numexpr`
+and `numba` backends are used when the packages are installed. The backend
+is picked at runtime with `set_backend` (or the GW_OVERLAP_KERNEL_BACKEND
+environment variable).
+
+"""
+
+import contextlib
+import os
+
+import numpy as np
+
+DEFAULT_BACKEND = os.environ.get("GW_OVERLAP_KERNEL_BACKEND", "numpy")
+FILTER_BYTES = 2 ** 24  # size of the block of phases held by the numpy filter kernel
+
+
+class KernelBackend:
+    def __init__(self, name, inner, filter, set_num_threads=None, get_num_threads=None):
+        """
+
+        :param name: str name of the backend
+        :param inner: func(a, b, weights) -> complex
+        :param filter: func(a, b, weights, frequency, t0s) -> ndarray of complex
+        :param set_num_threads: func(int) setting the threads used by the backend
+        :param get_num_threads: func() -> int of the threads used by the backend
+        """
+        self.name = name
+        self.inner = inner
+        self.filter = filter
+        self.set_num_threads = set_num_threads
+        self.get_num_threads = get_num_threads
+
+    def __repr__(self):
+        return f"KernelBackend({self.name})"
+
+
+def _numpy_backend():
+    def inner(a, b, weights):
+        return np.vdot(a, b * weights)
+
+    def filter(a, b, weights, frequency, t0s):
+        t0s = np.asarray(t0s, dtype=float)
+        integrand = np.conj(a)
+        integrand *= b
+        integrand *= weights
+        zs = np.empty(len(t0s), dtype=complex)
+        if len(t0s) == 0:
+            return zs
+        # the phases of `chunk` t0s are held at once, at most FILTER_BYTES
+        chunk = min(max(1, FILTER_BYTES // (16 * len(frequency))), len(t0s))
+        phases = np.empty((chunk, len(frequency)), dtype=complex)
+        omega = 2j * np.pi * np.asarray(frequency, dtype=float)
+        steps = np.diff(t0s)
+        # evenly spaced t0s: each row is the previous one times exp(2πi f dt)
+        step = np.exp(omega * steps[0]) if len(steps) and np.allclose(steps, steps[0]) else None
+        for i in range(0, len(t0s), chunk):
+            rows = phases[:min(chunk, len(t0s) - i)]
+            np.exp(omega * t0s[i], out=rows[0])
+            for j in range(1, len(rows)):
+                if step is None:
+                    np.exp(omega * t0s[i + j], out=rows[j])
+                else:
+                    np.multiply(rows[j - 1], step, out=rows[j])
+            np.matmul(rows, integrand, out=zs[i:i + len(rows)])
+        return zs
+
+    return KernelBackend("numpy", inner, filter)
+
+
+def _numexpr_backend():
+    import numexpr
+
+    def inner(a, b, weights):
+        return complex(numexpr.evaluate("sum(conj(a) * b * weights)"))
+
+    def filter(a, b, weights, frequency, t0s):
+        integrand = numexpr.evaluate("conj(a) * b * weights")
+        omega = 2 * np.pi * frequency
+        return np.array([
+            complex(numexpr.evaluate(
+                "sum(integrand * exp(1j * omega * t0))",
+                local_dict=dict(integrand=integrand, omega=omega, t0=t0)))
+            for t0 in t0s
+        ])
+
+    return KernelBackend("numexpr", inner, filter, numexpr.set_num_threads,
+                         numexpr.get_num_threads)
+
+
+def _numba_backend():
+    import numba
+
+    @numba.njit(parallel=True)
+    def _inner(a, b, weights):
+        real, imag = 0.0, 0.0
+        for i in numba.prange(len(a)):
+            ab = a[i].conjugate() * b[i] * weights[i]
+            real += ab.real
+            imag += ab.imag
+        return real, imag
+
+    @numba.njit(parallel=True)
+    def _filter(a, b, weights, frequency, t0s):
+        zs = np.empty(len(t0s), dtype=np.complex128)
+        for j in numba.prange(len(t0s)):
+            z = 0j
+            for i in range(len(a)):
+                z += a[i].conjugate() * b[i] * weights[i] * np.exp(
+                    2j * np.pi * frequency[i] * t0s[j])
+            zs[j] = z
+        return zs
+
+    def inner(a, b, weights):
+        real, imag = _inner(a, b, weights)
+        return complex(real, imag)
+
+    def filter(a, b, weights, frequency, t0s):
+        return _filter(a, b, weights, frequency, np.asarray(t0s, dtype=float))
+
+    return KernelBackend("numba", inner, filter, numba.set_num_threads,
+                         numba.get_num_threads)
+
+
+BACKEND_FACTORIES = dict(
+    numpy=_numpy_backend,
+    numexpr=_numexpr_backend,
+    numba=_numba_backend,
+)
+_backends = {}
+_current_backend = None
+
+
+def load_backend(name):
+    """Builds (once) and returns the backend `name`.
+
+    :raises ImportError: if the package behind the backend is not installed
+    """
+    if name not in BACKEND_FACTORIES:
+        raise ValueError(f"Unknown backend {name}, choose from {list(BACKEND_FACTORIES)}")
+    if name not in _backends:
+        _backends[name] = BACKEND_FACTORIES[name]()
+    return _backends[name]
+
+
+def available_backends():
+    """
+    :return: list of the names of the backends that can be loaded
+    """
+    names = []
+    for name in BACKEND_FACTORIES:
+        try:
+            load_backend(name)
+            names.append(name)
+        except ImportError:
+            pass
+    return names
+
+
+def get_backend():
+    global _current_backend
+    if _current_backend is None:
+        _current_backend = load_backend(DEFAULT_BACKEND)
+    return _current_backend
+
+
+def set_backend(name, num_threads=None):
+    """Sets the backend used by `inner_product` and `complex_filter`.
+
+    :param name: one of 'numpy', 'numexpr' or 'numba'
+    :param num_threads: int number of threads for the backend (if supported)
+    :return: the previously used KernelBackend
+    """
+    global _current_backend
+    previous = get_backend()
+    _current_backend = load_backend(name)
+    if num_threads is not None and _current_backend.set_num_threads is not None:
+        _current_backend.set_num_threads(num_threads)
+    return previous
+
+
+@contextlib.contextmanager
+def use_backend(name, num_threads=None):
+    """Uses a backend (and thread count) inside the block, restoring the
+    previous backend and the backend's previous thread count afterwards"""
+    backend = load_backend(name)
+    previous_threads = None
+    if num_threads is not None and backend.get_num_threads is not None:
+        previous_threads = backend.get_num_threads()
+    previous = set_backend(name, num_threads)
+    try:
+        yield _current_backend
+    finally:
+        if previous_threads is not None:
+            backend.set_num_threads(previous_threads)
+        set_backend(previous.name)
+
+
+def check_backends(a, b, weights, frequency, t0s, rtol=1e-8):
+    """Cross-checks every available backend against the numpy backend.
+
+    :return: dict of backend name to the max relative error of its kernels
+    :raises AssertionError: if any error exceeds `rtol`
+    """
+    reference = load_backend("numpy")
+    expected_inner = reference.inner(a, b, weights)
+    expected_filter = reference.filter(a, b, weights, frequency, t0s)
+    errors = {}
+    for name in available_backends():
+        backend = load_backend(name)
+        inner_error = abs(backend.inner(a, b, weights) - expected_inner) / abs(expected_inner)
+        filter_error = np.max(
+            np.abs(backend.filter(a, b, weights, frequency, t0s) - expected_filter)
+        ) / np.max(np.abs(expected_filter))
+        errors[name] = max(inner_error, filter_error)
+    failed = {k: v for k, v in errors.items() if v > rtol}
+    assert not failed, f"Backends disagree with numpy: {failed}"
+    return errors
@@ -0,0 +1,213 @@
+"""
+
+A file for matched filtering waveforms in Gaussian noise realisations for the
+gw_waveform_overlapper package.
+
+An injection is added to many realisations of Gaussian noise coloured by a
+PSD, and each realisation is filtered with a template, giving the empirical
+distribution of the matched-filter SNR (maximised over time and phase) rather
+than the zero-noise bound of `get_snr_for_overlap`. Everything is done in
+whitened form: the template and injection are whitened once, the whitened
+noise is white (sqrt(duration) / 2 (x + iy) for standard normal x, y), and a
+block of realisations is filtered with one batched inverse FFT. The data is
+also filtered with the injection itself, and the ratio of the two SNRs is the
+overlap recovered in that realisation. Only the running distributions are
+kept, so the memory used is set by `block_size` (by default as many
+realisations as fit in `BLOCK_BYTES` of temporaries, see `get_block_size`),
+not by the number of realisations. Realisation i is the same for any
+`block_size` with one seed.
+
+    results = noise_realisation_study(template, injection, n_realisations=10000)
+    print(results["snr"].summary(), results["overlap"].summary())
+
+"""
+
+import numpy as np
+
+from . import fft_engine
+from .monte_carlo import OverlapStatistics
+from .overlap_computer import combine_polarisations, fft_maximised_overlaps, get_weights
+
+N_REALISATIONS = 10000
+BLOCK_BYTES = 2 ** 28  # temporaries of one block of realisations
+SNR_BINS = np.linspace(0, 100, 1001)
+DETECTION_THRESHOLDS = [8, 12]
+
+
+class SNRDistribution:
+    def __init__(self, bins=SNR_BINS, thresholds=DETECTION_THRESHOLDS):
+        """Running mean, variance, extremes and histogram of SNRs
+
+        :param bins: ndarray of histogram bin edges (SNRs outside go to the end bins)
+        :param thresholds: list of SNRs to count the realisations above
+        """
+        self.bins = np.asarray(bins, dtype=float)
+        self.thresholds = np.asarray(thresholds, dtype=float)
+        self.n = 0
+        self.mean = 0.
+        self.m2 = 0.
+        self.minimum = np.inf
+        self.maximum = -np.inf
+        self.histogram = np.zeros(len(self.bins) - 1, dtype=int)
+        self.above_threshold = np.zeros(len(self.thresholds), dtype=int)
+
+    def update(self, snrs):
+        """Adds a batch of SNRs to the distribution"""
+        snrs = np.asarray(snrs, dtype=float).ravel()
+        if len(snrs) == 0:
+            return
+        n_batch = len(snrs)
+        mean_batch = snrs.mean()
+        delta = mean_batch - self.mean
+        total = self.n + n_batch
+        self.m2 += np.sum((snrs - mean_batch) ** 2) + delta ** 2 * self.n * n_batch / total
+        self.mean += delta * n_batch / total
+        self.n = total
+        self.minimum = min(self.minimum, snrs.min())
+        self.maximum = max(self.maximum, snrs.max())
+        idx = np.clip(np.searchsorted(self.bins, snrs, side='right') - 1,
+                      0, len(self.histogram) - 1)
+        self.histogram += np.bincount(idx, minlength=len(self.histogram))
+        self.above_threshold += np.sum(snrs[:, None] > self.thresholds, axis=0)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else np.nan
+
+    @property
+    def fractions_above_threshold(self):
+        """dict of SNR threshold: fraction of realisations above it"""
+        return {float(snr): count / max(self.n, 1)
+                for snr, count in zip(self.thresholds, self.above_threshold)}
+
+    def quantile(self, q):
+        """SNR quantile, interpolated within the histogram bins"""
+        if self.n == 0:
+            return np.nan
+        cdf = np.concatenate([[0], np.cumsum(self.histogram)]) / self.n
+        i = int(np.clip(np.searchsorted(cdf, q), 1, len(self.histogram)))
+        fraction = (q - cdf[i - 1]) / (cdf[i] - cdf[i - 1]) if cdf[i] > cdf[i - 1] else 0
+        snr = self.bins[i - 1] + fraction * (self.bins[i] - self.bins[i - 1])
+        return float(np.clip(snr, self.minimum, self.maximum))
+
+    def summary(self):
+        return dict(
+            n=self.n, mean=self.mean, std=np.sqrt(self.variance), minimum=self.minimum,
+            maximum=self.maximum, median=self.quantile(0.5), quantile_05=self.quantile(0.05),
+            quantile_95=self.quantile(0.95),
+            fractions_above_threshold=self.fractions_above_threshold,
+        )
+
+
+def get_snr_bins(expected_snr):
+    """:return: `SNR_BINS`, stretched to twice the expected SNR for loud signals"""
+    return np.linspace(0, max(SNR_BINS[-1], 2 * expected_snr), len(SNR_BINS))
+
+
+def whiten(h, weights, band):
+    """:return: h(f) / sqrt(PSD(f)) on the frequencies of the band"""
+    return h[..., band] * np.sqrt(weights[band])
+
+
+def get_block_size(n_templates, n_band, n_frequencies, maximise_time=True,
+                   block_bytes=BLOCK_BYTES):
+    """Realisations per block keeping the temporaries of `matched_filter_snrs`
+    (and the noise draws) within `block_bytes`
+
+    :param n_templates: int K templates filtered per realisation
+    :param n_band: int M frequencies in the band
+    :param n_frequencies: int N of the full frequency grid
+    :return: int, at least 1
+    """
+    # noise draws and data (M) and integrand (K M), then the zero padded
+    # integrand (K N), its inverse FFT (K 2(N - 1)) and the abs of that
+    n_complex = (2 + n_templates) * n_band
+    if maximise_time:
+        n_complex += n_templates * 4 * n_frequencies
+    return max(1, block_bytes // (16 * n_complex))
+
+
+def matched_filter_snrs(whitened_templates, whitened_data, band, n_frequencies, duration,
+                        maximise_time=True):
+    """Matched-filter SNRs of whitened data blocks against whitened templates
+
+    :param whitened_templates: ndarray (K, M) of K templates on the M band frequencies
+    :param whitened_data: ndarray (B, M) of B data realisations
+    :param band: ndarray of the M indices of the band in the frequency grid
+    :param n_frequencies: int N of the full frequency grid
+    :param maximise_time: bool, if False the SNRs are only maximised over phase
+    :return: ndarray (K, B) of the SNRs, maximised over time and phase
+    """
+    constant = 4 / duration
+    sigmas = np.sqrt(constant * np.sum(np.abs(whitened_templates) ** 2, axis=-1))
+    integrand = np.conj(whitened_templates)[:, None, :] * whitened_data[None]
+    if not maximise_time:
+        z_max = np.abs(np.sum(integrand, axis=-1))
+    else:
+        n = 2 * (n_frequencies - 1)
+        full = np.zeros(integrand.shape[:-1] + (n_frequencies,), dtype=complex)
+        full[..., band] = integrand
+        z_max = np.max(np.abs(fft_engine.ifft(full, n=n)), axis=-1) * n
+    return constant * z_max / sigmas[:, None]
+
+
+def noise_realisation_study(template, injection, psd=None, n_realisations=N_REALISATIONS,
+                            block_size=None, seed=0, maximise_time=True,
+                            snr_kwargs=None, overlap_kwargs=None):
+    """SNR and overlap distributions of a template over Gaussian noise realisations
+
+    :param template: Waveform filtering the data
+    :param injection: Waveform added to the noise, on the grid of the template
+    :param psd: bilby PowerSpectralDensity, PSD filename or (frequency, psd) tuple
+    :param n_realisations: int number of noise realisations
+    :param block_size: int realisations filtered at once, or None for `get_block_size`
+    :param seed: int seed of the noise
+    :param maximise_time: bool, if False the SNRs are only maximised over phase
+    :param snr_kwargs: dict passed to each `SNRDistribution` (the bins default
+        to `get_snr_bins` of the expected SNR)
+    :param overlap_kwargs: dict passed to `OverlapStatistics`
+    :return: dict of the template "snr" and injection "optimal_snr"
+        SNRDistributions, the "overlap" (template SNR / injection SNR)
+        OverlapStatistics, and the zero-noise "expected_snr" (the optimal SNR
+        of the injection) and "expected_overlap"
+    """
+    frequency = template.frequency
+    if len(injection.frequency) != len(frequency):
+        raise ValueError("The template and injection must share a frequency grid")
+    weights = get_weights(psd, frequency)
+    band = np.flatnonzero(weights > 0)
+    duration = template.duration
+    h_template = combine_polarisations(template)
+    h_injection = combine_polarisations(injection)
+    # whitened once, reused by every block
+    templates = np.array([whiten(h_template, weights, band),
+                          whiten(h_injection, weights, band)])
+    signal = templates[1]
+    noise_scale = np.sqrt(duration) / 2
+    expected_snr = np.sqrt(4 / duration * np.sum(np.abs(signal) ** 2))
+
+    snr_kwargs = {"bins": get_snr_bins(expected_snr), **(snr_kwargs or {})}
+    snrs, optimal_snrs = SNRDistribution(**snr_kwargs), SNRDistribution(**snr_kwargs)
+    overlaps = OverlapStatistics(**(overlap_kwargs or {}))
+    if block_size is None:
+        block_size = get_block_size(len(templates), len(band), len(frequency), maximise_time)
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_realisations, block_size):
+        n_block = min(block_size, n_realisations - start)
+        noise = rng.standard_normal((n_block, len(band), 2))
+        data = signal + noise_scale * (noise[..., 0] + 1j * noise[..., 1])
+        template_snrs, injection_snrs = matched_filter_snrs(
+            templates, data, band, len(frequency), duration, maximise_time)
+        snrs.update(template_snrs)
+        optimal_snrs.update(injection_snrs)
+        overlaps.update(template_snrs / injection_snrs)
+
+    if maximise_time:
+        expected_overlap, _, _ = fft_maximised_overlaps(
+            h_template, h_injection, weights, template.sampling_frequency)
+    else:
+        inner = [np.sum(np.conj(x) * y * weights) for x, y in [
+            (h_template, h_injection), (h_template, h_template), (h_injection, h_injection)]]
+        expected_overlap = np.abs(inner[0]) / np.sqrt(inner[1].real * inner[2].real)
+    return dict(snr=snrs, optimal_snr=optimal_snrs, overlap=overlaps,
+                expected_snr=float(expected_snr), expected_overlap=float(expected_overlap))
@@ -0,0 +1,132 @@
+"""
+
+A file for predicting overlaps of nearby waveforms from the overlap metric
+for the gw_waveform_overlapper package.
+
+For a reference point θ and a nearby point θ + Δθ,
+
+    O(θ, θ + Δθ) ≈ 1 - g_ij Δθ^i Δθ^j,   g_ij = ½ Re <∂_i ĥ|∂_j ĥ>
+
+where ĥ = h / sqrt(<h|h>). The metric costs 2 waveform generations per
+parameter, after which any number of nearby overlaps are a matrix product.
+
+"""
+
+import numpy as np
+
+from .executors import TaskFailure, executor_scope
+from .overlap_computer import compute_overlap, combine_polarisations, \
+    get_zero_noise_psd, noise_weighted_inner_product
+from .psd import interpolate_psd
+from .waveform import Waveform
+
+RELATIVE_STEP = 1e-3
+MAX_MISMATCH = 0.05
+NON_NEGATIVE = ['mass_1', 'mass_2', 'chirp_mass', 'total_mass', 'mass_ratio',
+                'a_1', 'a_2', 'luminosity_distance']
+
+
+class OverlapMetric:
+    def __init__(self, reference_parameters, keys, psd=None, step_sizes=None,
+                 max_mismatch=MAX_MISMATCH, **injection_kwargs):
+        """
+
+        :param reference_parameters: dict of the injection params at the reference point
+        :param keys: list of the params the metric is computed for
+        :param psd: bilby PowerSpectralDensity, PSD filename or (frequency, psd) tuple
+        :param step_sizes: dict of finite difference steps (defaults to
+            `RELATIVE_STEP` times the param value, or `RELATIVE_STEP` if it is 0)
+        :param max_mismatch: float, predictions above this mismatch are
+            replaced by exact overlaps in `compute_overlaps`
+        :param injection_kwargs: passed to `Waveform.inject_signal`
+        """
+        self.reference_parameters = dict(reference_parameters)
+        self.keys = list(keys)
+        self.psd = get_zero_noise_psd() if psd is None else psd
+        self.step_sizes = {
+            k: RELATIVE_STEP * (abs(self.reference_parameters[k]) or 1) for k in self.keys
+        }
+        self.step_sizes.update(step_sizes or {})
+        self.max_mismatch = max_mismatch
+        self.injection_kwargs = injection_kwargs
+        self.reference_waveform = self._inject(self.reference_parameters)
+        self.weights = 1 / interpolate_psd(self.psd, self.reference_waveform.frequency)
+        self._signals = {}
+        self._metric = None
+
+    def _inject(self, parameters):
+        return Waveform.inject_signal(dict(parameters), **self.injection_kwargs)
+
+    def _inner(self, a, b):
+        return noise_weighted_inner_product(
+            a, b, self.weights, self.reference_waveform.duration)
+
+    def _get_normalised_signal(self, shifts):
+        """Cached ĥ at the reference point shifted by the dict `shifts`"""
+        cache_key = tuple(sorted(shifts.items()))
+        if cache_key not in self._signals:
+            parameters = self.reference_parameters.copy()
+            for k, shift in shifts.items():
+                parameters[k] += shift
+            h = combine_polarisations(self._inject(parameters))
+            self._signals[cache_key] = h / np.sqrt(self._inner(h, h).real)
+        return self._signals[cache_key]
+
+    def derivative(self, key):
+        """Finite difference ∂ĥ/∂key (one sided at the edge of non-negative params)"""
+        step = self.step_sizes[key]
+        forward = self._get_normalised_signal({key: step})
+        if key in NON_NEGATIVE and self.reference_parameters[key] - step < 0:
+            return (forward - self._get_normalised_signal({})) / step
+        return (forward - self._get_normalised_signal({key: -step})) / (2 * step)
+
+    @property
+    def metric(self):
+        """ndarray of g_ij for the `keys`"""
+        if self._metric is None:
+            derivatives = [self.derivative(k) for k in self.keys]
+            self._metric = np.array([
+                [0.5 * self._inner(di, dj).real for dj in derivatives]
+                for di in derivatives
+            ])
+        return self._metric
+
+    def _get_deltas(self, points):
+        if isinstance(points, np.ndarray):
+            values = np.atleast_2d(points)
+        else:
+            values = np.array([[p[k] for k in self.keys] for p in points])
+        return values - np.array([self.reference_parameters[k] for k in self.keys])
+
+    def predict_overlaps(self, points):
+        """
+        :param points: list of param dicts, or ndarray of shape (M, len(keys))
+        :return: ndarray of the M predicted overlaps with the reference point
+        """
+        deltas = self._get_deltas(points)
+        return 1 - np.einsum('mi,ij,mj->m', deltas, self.metric, deltas)
+
+    def compute_overlaps(self, points, executor=None):
+        """Predicts overlaps, falling back to exact overlaps outside the validity range
+
+        :param points: list of param dicts, or ndarray of shape (M, len(keys))
+        :param executor: see `executors.get_executor`, runs the exact overlaps
+        :return: tuple of (ndarray of overlaps, bool ndarray marking exact overlaps),
+            exact overlaps whose task failed (with `capture_failures`) are NaN
+        """
+        overlaps = self.predict_overlaps(points)
+        exact = 1 - overlaps > self.max_mismatch
+        deltas = self._get_deltas(points)
+        parameters_list = []
+        for i in np.flatnonzero(exact):
+            parameters = self.reference_parameters.copy()
+            for k, delta in zip(self.keys, deltas[i]):
+                parameters[k] += delta
+            parameters_list.append(parameters)
+        with executor_scope(executor) as pool:
+            results = pool.map(self._exact_overlap, parameters_list)
+        overlaps[exact] = [np.nan if isinstance(r, TaskFailure) else r for r in results]
+        return overlaps, exact
+
+    def _exact_overlap(self, parameters):
+        return compute_overlap(self.reference_waveform, self._inject(parameters), self.psd)
@@ -0,0 +1,240 @@
+"""
+
+A file for Monte Carlo overlap studies over prior draws for the
+gw_waveform_overlapper package.
+
+Prior samples are drawn in batches, turned into waveform pairs and overlaps
+by the workers, and folded into an `OverlapStatistics` aggregate, so the
+memory used does not grow with the number of draws:
+
+- the running mean and variance (Welford/Chan updates),
+- a fixed histogram of the overlaps,
+- a quantile sketch of the mismatch 1 - O with log-spaced buckets (any
+  quantile is within `relative_accuracy` of the exact mismatch quantile),
+- the fraction of draws distinguishable at each SNR threshold, i.e. with
+  `get_snr_for_overlap(O)` below the threshold.
+
+The aggregate is checkpointed to an npz file, and the run stops early once
+the standard errors of the mean and of the fractions drop below a tolerance.
+
+"""
+
+import functools
+import os
+
+import bilby
+import numpy as np
+
+from .executors import executor_scope
+from .multiple_overlaps import calculate_multiple_overlaps_for_psds
+from .overlap_computer import get_snr_for_overlap, get_zero_noise_psd
+from .waveform import Waveform, DEFAULT_SAMPLING_FREQ
+
+BATCH_SIZE = 256
+TASK_SIZE = 16  # waveform pairs per worker task
+MAX_SAMPLES = 10 ** 6
+MIN_SAMPLES = 1000
+HIST_BINS = np.linspace(0, 1, 101)
+SNR_THRESHOLDS = [10, 20, 50]
+SKETCH_ACCURACY = 0.01
+MIN_MISMATCH = 1e-12  # smaller mismatches fall into the zero bucket of the sketch
+MAX_MISMATCH = 2
+
+
+class OverlapStatistics:
+    def __init__(self, bins=HIST_BINS, snr_thresholds=SNR_THRESHOLDS,
+                 relative_accuracy=SKETCH_ACCURACY):
+        """
+
+        :param bins: ndarray of histogram bin edges (overlaps outside go to the end bins)
+        :param snr_thresholds: list of SNRs to count the distinguishable draws at
+        :param relative_accuracy: float relative error of the mismatch quantiles
+        """
+        self.bins = np.asarray(bins, dtype=float)
+        self.snr_thresholds = np.asarray(snr_thresholds, dtype=float)
+        self.relative_accuracy = relative_accuracy
+        self.n = 0
+        self.mean = 0.
+        self.m2 = 0.
+        self.minimum = np.inf
+        self.maximum = -np.inf
+        self.histogram = np.zeros(len(self.bins) - 1, dtype=int)
+        self.below_threshold = np.zeros(len(self.snr_thresholds), dtype=int)
+        self._log_gamma = np.log((1 + relative_accuracy) / (1 - relative_accuracy))
+        self._min_bucket = int(np.ceil(np.log(MIN_MISMATCH) / self._log_gamma))
+        n_buckets = int(np.ceil(np.log(MAX_MISMATCH) / self._log_gamma)) - self._min_bucket + 1
+        self.sketch = np.zeros(n_buckets + 1, dtype=int)  # sketch[0] is the zero bucket
+
+    def update(self, overlaps):
+        """Adds a batch of overlaps to the aggregate"""
+        overlaps = np.asarray(overlaps, dtype=float).ravel()
+        if len(overlaps) == 0:
+            return
+        n_batch = len(overlaps)
+        mean_batch = overlaps.mean()
+        delta = mean_batch - self.mean
+        total = self.n + n_batch
+        self.m2 += np.sum((overlaps - mean_batch) ** 2) + delta ** 2 * self.n * n_batch / total
+        self.mean += delta * n_batch / total
+        self.n = total
+        self.minimum = min(self.minimum, overlaps.min())
+        self.maximum = max(self.maximum, overlaps.max())
+
+        idx = np.clip(np.searchsorted(self.bins, overlaps, side='right') - 1,
+                      0, len(self.histogram) - 1)
+        self.histogram += np.bincount(idx, minlength=len(self.histogram))
+
+        with np.errstate(divide='ignore'):
+            snrs = get_snr_for_overlap(np.minimum(overlaps, 1))
+        self.below_threshold += np.sum(snrs[:, None] < self.snr_thresholds, axis=0)
+
+        mismatch = np.clip(1 - overlaps, 0, MAX_MISMATCH)
+        buckets = np.zeros(n_batch, dtype=int)
+        nonzero = mismatch > MIN_MISMATCH
+        buckets[nonzero] = (np.ceil(np.log(mismatch[nonzero]) / self._log_gamma).astype(int)
+                            - self._min_bucket + 1)
+        self.sketch += np.bincount(np.clip(buckets, 0, len(self.sketch) - 1),
+                                   minlength=len(self.sketch))
+
+    @property
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else np.nan
+
+    @property
+    def standard_error(self):
+        return np.sqrt(self.variance / self.n) if self.n > 1 else np.inf
+
+    @property
+    def fractions_below_threshold(self):
+        """dict of SNR threshold: fraction of draws distinguishable at that SNR"""
+        return {float(snr): count / max(self.n, 1)
+                for snr, count in zip(self.snr_thresholds, self.below_threshold)}
+
+    def mismatch_quantile(self, q):
+        if self.n == 0:
+            return np.nan
+        bucket = int(np.searchsorted(np.cumsum(self.sketch), q * (self.n - 1), side='right'))
+        if bucket == 0:
+            return 0.
+        gamma = np.exp(self._log_gamma)
+        return 2 * gamma ** (bucket - 1 + self._min_bucket) / (gamma + 1)
+
+    def quantile(self, q):
+        """Overlap quantile, from the mismatch sketch"""
+        return 1 - self.mismatch_quantile(1 - q)
+
+    def converged(self, tolerance, min_samples=MIN_SAMPLES):
+        """True once the standard errors of the mean overlap and of the
+        threshold fractions are below `tolerance`"""
+        if self.n < max(min_samples, 2):
+            return False
+        fractions = self.below_threshold / self.n
+        fraction_errors = np.sqrt(fractions * (1 - fractions) / self.n)
+        return self.standard_error < tolerance and np.all(fraction_errors < tolerance)
+
+    def summary(self):
+        return dict(
+            n=self.n, mean=self.mean, std=np.sqrt(self.variance),
+            standard_error=self.standard_error, minimum=self.minimum, maximum=self.maximum,
+            median=self.quantile(0.5), quantile_05=self.quantile(0.05),
+            fractions_below_threshold=self.fractions_below_threshold,
+        )
+
+    def to_dict(self):
+        return dict(
+            bins=self.bins, snr_thresholds=self.snr_thresholds,
+            relative_accuracy=self.relative_accuracy, n=self.n, mean=self.mean, m2=self.m2,
+            minimum=self.minimum, maximum=self.maximum, histogram=self.histogram,
+            below_threshold=self.below_threshold, sketch=self.sketch,
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        statistics = cls(data['bins'], data['snr_thresholds'], float(data['relative_accuracy']))
+        statistics.n = int(data['n'])
+        for key in ['mean', 'm2', 'minimum', 'maximum']:
+            setattr(statistics, key, float(data[key]))
+        for key in ['histogram', 'below_threshold', 'sketch']:
+            setattr(statistics, key, np.array(data[key]))
+        return statistics
+
+    def save(self, filename, **extra):
+        # write then rename so a killed job never leaves a partial checkpoint
+        tmp_filename = os.path.join(
+            os.path.dirname(filename), f".{os.path.basename(filename)}.tmp.npz")
+        np.savez(tmp_filename, **self.to_dict(), **extra)
+        os.replace(tmp_filename, filename)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as data:
+            return cls.from_dict(data), {k: data[k] for k in data.files}
+
+
+def compute_overlap_batch(points, waveform_2=None, approximants=('IMRPhenomPv2',) * 2,
+                          psd=None, **injection_kwargs):
+    """Overlaps of the pairs (points[i], points[i] updated by waveform_2)
+
+    :return: ndarray of overlaps
+    """
+    w1s = Waveform.inject_signals(points, approximant=approximants[0], **injection_kwargs)
+    w2s = Waveform.inject_signals([dict(p, **(waveform_2 or {})) for p in points],
+                                  approximant=approximants[1], **injection_kwargs)
+    psd = get_zero_noise_psd() if psd is None else psd
+    return calculate_multiple_overlaps_for_psds(w1s, w2s, [psd])[:, 0]
+
+
+def draw_points(priors, n_samples, seed):
+    """Draws n_samples prior samples as param dicts with mass_1 and mass_2"""
+    bilby.core.utils.random.seed(seed)
+    samples = priors.sample(n_samples)
+    samples, _ = bilby.gw.conversion.convert_to_lal_binary_black_hole_parameters(samples)
+    return [{k: float(np.atleast_1d(v)[i]) for k, v in samples.items()}
+            for i in range(n_samples)]
+
+
+def run_monte_carlo(priors, waveform_2=None, n_samples=MAX_SAMPLES, batch_size=BATCH_SIZE,
+                    approximant='IMRPhenomPv2', psd=None, duration=4,
+                    sampling_frequency=DEFAULT_SAMPLING_FREQ, executor=None,
+                    checkpoint=None, tolerance=None, min_samples=MIN_SAMPLES, seed=0,
+                    **statistics_kwargs):
+    """Streams prior draws through waveform generation and overlaps
+
+    :param priors: bilby PriorDict or prior filename
+    :param waveform_2: dict of the params changed for the second waveform
+    :param n_samples: int max number of draws
+    :param batch_size: int draws between checkpoints and convergence checks
+    :param approximant: str or pair of str approximants of the two waveforms
+    :param executor: see `executors.get_executor`
+    :param checkpoint: str npz filename, resumed from if it exists
+    :param tolerance: float, stop once `OverlapStatistics.converged(tolerance)`
+    :param seed: int, batch i is drawn with seed + i so resumed runs repeat the draws
+    :param statistics_kwargs: passed to `OverlapStatistics`
+    :return: OverlapStatistics
+    """
+    if isinstance(priors, str):
+        priors = bilby.core.prior.PriorDict(filename=priors)
+    approximants = (approximant,) * 2 if isinstance(approximant, str) else tuple(approximant)
+    statistics, n_batches = OverlapStatistics(**statistics_kwargs), 0
+    if checkpoint is not None and os.path.exists(checkpoint):
+        statistics, data = OverlapStatistics.load(checkpoint)
+        n_batches = int(data['n_batches'])
+    evaluate = functools.partial(
+        compute_overlap_batch, waveform_2=waveform_2, approximants=approximants, psd=psd,
+        duration=duration, sampling_frequency=sampling_frequency)
+    with executor_scope(executor) as pool:
+        while statistics.n < n_samples:
+            if tolerance is not None and statistics.converged(tolerance, min_samples):
+                print(f"Converged after {statistics.n} samples")
+                break
+            points = draw_points(priors, min(batch_size, n_samples - statistics.n),
+                                 seed + n_batches)
+            tasks = [points[i:i + TASK_SIZE] for i in range(0, len(points), TASK_SIZE)]
+            for overlaps in pool.map(evaluate, tasks):
+                statistics.update(overlaps)
+            n_batches += 1
+            if checkpoint is not None:
+                statistics.save(checkpoint, n_batches=n_batches)
+            print(f"{statistics.n} samples: mean overlap {statistics.mean:.6f} "
+                  f"± {statistics.standard_error:.2e}")
+    return statistics
@@ -1,14 +1,51 @@
 import os
 
+import numpy as np
 from celluloid import Camera
 from matplotlib import pyplot as plt
 from matplotlib.lines import Line2D
 
-from .overlap_computer import compute_overlap
+from .executors import executor_scope
+from .overlap_computer import compute_overlap, combine_polarisations
+from .psd import get_psd_weights
+from .waveform import compute_time_domain_signals
 
 
-def calculate_multiple_overlaps(w1s, w2s):
-    return [compute_overlap(w1, w2) for w1, w2 in zip(w1s, w2s)]
+def calculate_multiple_overlaps(w1s, w2s, executor=None):
+    """
+    :param executor: see `executors.get_executor`
+    :return: list of the overlaps of each (w1, w2) pair
+    """
+    with executor_scope(executor) as pool:
+        return pool.map(compute_overlap, w1s, w2s)
+
+
+def calculate_multiple_overlaps_for_psds(w1s, w2s, psds):
+    """Computes the overlap of every (w1, w2) pair against every PSD.
+
+    The K PSDs are interpolated once onto the common frequency grid of the
+    waveforms as a K x N weight matrix, and the inner products of all M pairs
+    are then evaluated as (M x N) @ (N x K) matrix products.
+
+    :param w1s: list of M Waveforms
+    :param w2s: list of M Waveforms
+    :param psds: list of K bilby PowerSpectralDensity, PSD filenames or
+        (frequency, psd) tuples
+    :return: ndarray of shape (M, K) of overlaps
+    """
+    frequency = w1s[0].frequency
+    for wf in [*w1s, *w2s]:
+        if not np.array_equal(wf.frequency, frequency):
+            raise ValueError("All waveforms must share the same frequency grid")
+    weights = get_psd_weights(psds, frequency).T
+    a = np.array([combine_polarisations(wf) for wf in w1s])
+    b = np.array([combine_polarisations(wf) for wf in w2s])
+
+    # the 4/duration normalisation cancels in the overlap
+    inner_a = (a.real ** 2 + a.imag ** 2) @ weights
+    inner_b = (b.real ** 2 + b.imag ** 2) @ weights
+    inner_ab = (np.conj(a) * b) @ weights
+    return inner_ab.real / np.sqrt(inner_a * inner_b)
 
 
 def plot_overlap_line(overlap, x_data_dict, ax=None):
@@ -21,8 +58,9 @@ def plot_overlap_line(overlap, x_data_dict, ax=None):
     return ax
 
 
-def plot_overlaps(w1s, w2s, overlap_x_data=None, filename='overlap.mp4'):
-    overlaps = calculate_multiple_overlaps(w1s, w2s)
+def plot_overlaps(w1s, w2s, overlap_x_data=None, filename='overlap.mp4',
+                  executor=None):
+    overlaps = calculate_multiple_overlaps(w1s, w2s, executor)
     fig, ax = plt.subplots(3, 1, figsize=(5, 10))
     camera = Camera(fig)
     time_ax, freq_ax, overlap_ax = ax[0], ax[1], ax[2]
@@ -32,6 +70,7 @@ def plot_overlaps(w1s, w2s, overlap_x_data=None, filename='overlap.mp4'):
     w1_kwargs = dict(color='orange', label=f"Waveform 1")
     w2_kwargs = dict(color='blue', label=f"Waveform 2")
 
+    compute_time_domain_signals([*w1s, *w2s])
     for w1, w2, o, ox in zip(w1s, w2s, overlaps, overlap_x_data['data']):
         time_ax = w1.plot_time_domain_data(time_ax, **w1_kwargs)
         freq_ax = w1.plot_frequency_domain_data(freq_ax, **w1_kwargs)
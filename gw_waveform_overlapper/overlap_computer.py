@@ -4,12 +4,26 @@ A file for maximising overlaps for the pycentricity package.
 
 """
 
+import hashlib
+import os
+
 import bilby
 import numpy as np
 from matplotlib import pyplot as plt
 
+from . import fft_engine, kernels
+from .cache import LRUCache
+from .psd import get_psd_file, interpolate_psd
 from .waveform import Waveform, plot_multiple_waveform_objects, POLARISATION
 
+CHUNK_SIZE = 2 ** 16
+ZERO_NOISE = "zero_noise"
+
+# caches of compute_overlap, keyed by Waveform.fingerprint and get_psd_key
+WEIGHTS_CACHE = LRUCache(maxsize=8)
+NORM_CACHE = LRUCache(maxsize=1024)
+OVERLAP_CACHE = LRUCache(maxsize=4096)
+
 
 def get_zero_noise_psd():
     ifos = bilby.gw.detector.InterferometerList(['H1'])
@@ -17,7 +31,7 @@ def get_zero_noise_psd():
     return ifos[0].power_spectral_density
 
 
-def compute_overlap(wf1: Waveform, wf2: Waveform, psd=None):
+def compute_overlap(wf1: Waveform, wf2: Waveform, psd=None, chunk_size=None, cache=False):
     """
     Eq1 https://arxiv.org/pdf/1806.05350.pdf
 
@@ -30,14 +44,30 @@ def compute_overlap(wf1: Waveform, wf2: Waveform, psd=None):
 
     :param wf1:
     :param wf2:
-    :param psd:
+    :param psd: bilby PowerSpectralDensity, PSD filename, (filename, is_asd)
+        or (frequency, psd) tuple, see `psd.interpolate_psd`
+    :param chunk_size: int, if given the inner products are accumulated over
+        frequency blocks of this size (see `chunked_inner_products`)
+    :param cache: bool, if True the norms and overlaps of `Waveform`s are
+        cached by their fingerprint (see `get_cache_stats`). Worth it when the
+        same waveforms are compared repeatedly, not for waveforms built once
+        per call (e.g. in the shift loops of `overlap_optimizer`). The
+        fingerprint is only reset by `reset`, `time_shift` and `phase_shift`,
+        so a Waveform whose arrays are changed in place otherwise gets stale
+        cached results.
     :return: Overlap
         The overlap takes on values between -1 (corresponding to waveforms 180◦
         out of phase) and 1 (for identical waveforms).
     """
-    inner_a = inner_product(wf1, wf1)
-    inner_b = inner_product(wf2, wf2)
-    inner_ab = inner_product(wf1, wf2)
+    if cache and chunk_size is None and hasattr(wf1, "fingerprint") \
+            and hasattr(wf2, "fingerprint"):
+        return _cached_overlap(wf1, wf2, psd)
+    if chunk_size is None:
+        inner_a = inner_product(wf1, wf1, psd)
+        inner_b = inner_product(wf2, wf2, psd)
+        inner_ab = inner_product(wf1, wf2, psd)
+    else:
+        inner_a, inner_b, inner_ab = chunked_inner_products(wf1, wf2, psd, chunk_size)
     overlap = inner_ab / np.sqrt(inner_a * inner_b)
     overlap = overlap.real
     if round(overlap, 2) > 1 or round(overlap, 2) < -1:
@@ -45,18 +75,97 @@ def compute_overlap(wf1: Waveform, wf2: Waveform, psd=None):
     return overlap
 
 
+def get_psd_key(psd):
+    """:return: a hashable key identifying the contents of a PSD (see `interpolate_psd`)"""
+    if psd is None:
+        return ZERO_NOISE
+    psd_file = get_psd_file(psd)
+    if psd_file is not None:
+        filename = os.path.abspath(psd_file[0])
+        return filename, os.path.getmtime(filename), psd_file[1]
+    if isinstance(psd, bilby.gw.detector.PowerSpectralDensity):
+        psd = (psd.frequency_array, psd.psd_array)
+    digest = hashlib.blake2b(digest_size=16)
+    for array in psd:
+        digest.update(np.ascontiguousarray(array, dtype=float).data)
+    return digest.hexdigest()
+
+
+def get_weights(psd, frequency, psd_key=None):
+    """Cached 1/PSD on a frequency grid
+
+    :param psd: bilby PowerSpectralDensity, PSD filename, (filename, is_asd)
+        or (frequency, psd) tuple, or None for `get_zero_noise_psd`
+    :param psd_key: the `get_psd_key` of the psd, if already known
+    """
+    if psd_key is None:
+        psd_key = get_psd_key(psd)
+    key = (psd_key, len(frequency), frequency[0], frequency[-1])
+    weights = WEIGHTS_CACHE.get(key)
+    if weights is None:
+        weights = 1 / interpolate_psd(get_zero_noise_psd() if psd is None else psd, frequency)
+        WEIGHTS_CACHE[key] = weights
+    return weights
+
+
+def _get_norm(wf, h, weights, psd_key):
+    key = (wf.fingerprint, psd_key)
+    norm = NORM_CACHE.get(key)
+    if norm is None:
+        norm = noise_weighted_inner_product(h, h, weights, wf.duration).real
+        NORM_CACHE[key] = norm
+    return norm
+
+
+def _cached_overlap(wf1, wf2, psd=None):
+    """`compute_overlap` with the norms cached per (waveform, PSD) and the
+    overlaps per (pair, PSD), so comparing one waveform with many others costs
+    one inner product per pair"""
+    psd_key = get_psd_key(psd)
+    key = (*sorted([wf1.fingerprint, wf2.fingerprint]), psd_key)
+    overlap = OVERLAP_CACHE.get(key)
+    if overlap is None:
+        weights = get_weights(psd, wf1.frequency, psd_key)
+        a, b = combine_polarisations(wf1), combine_polarisations(wf2)
+        inner_ab = noise_weighted_inner_product(a, b, weights, wf1.duration)
+        overlap = inner_ab.real / np.sqrt(
+            _get_norm(wf1, a, weights, psd_key) * _get_norm(wf2, b, weights, psd_key))
+        if round(overlap, 2) > 1 or round(overlap, 2) < -1:
+            raise ValueError(f"Overlap of {overlap} is out of bound [-1, 1]")
+        OVERLAP_CACHE[key] = overlap
+    return overlap
+
+
+def get_cache_stats():
+    """:return: dict of the `LRUCache.stats` of the weights, norm and overlap caches"""
+    return dict(weights=WEIGHTS_CACHE.stats, norms=NORM_CACHE.stats,
+                overlaps=OVERLAP_CACHE.stats)
+
+
+def clear_caches():
+    for cache in [WEIGHTS_CACHE, NORM_CACHE, OVERLAP_CACHE]:
+        cache.clear()
+
+
+def combine_polarisations(wf: Waveform, block=slice(None)):
+    """
+    :param block: slice of the frequency array to combine
+    :return: the frequency domain signal h+(f) + hx(f) used in the inner products
+    """
+    return (wf.frequency_domain_signal["plus"][block]
+            + wf.frequency_domain_signal["cross"][block])
+
+
 def _unpack_data(wf1, wf2, psd=None):
     if psd is None:
         psd = get_zero_noise_psd()
     freq, dur = wf1.frequency, wf1.duration
 
-    psd_interp = psd.power_spectral_density_interpolated(freq)
-    a = {p: wf1.frequency_domain_signal[p] for p in POLARISATION}
-    b = {p: wf2.frequency_domain_signal[p] for p in POLARISATION}
+    psd_interp = interpolate_psd(psd, freq)
 
     # Doing the calculation
-    a = a["plus"] + a["cross"]
-    b = b["plus"] + b["cross"]
+    a = combine_polarisations(wf1)
+    b = combine_polarisations(wf2)
 
     lens = [len(k) for k in [a, b, freq, psd_interp] ]
     assert len(set(lens)) == 1, f"a, b, freq, psd_interp = {lens}"
@@ -68,8 +177,45 @@ def inner_product(wf_a, wf_b, psd=None):
     :return: (4/duration) Σ [a*(f) b(f) / PSD]
     """
     a, b, freq, dur, psd = _unpack_data(wf_a, wf_b, psd)
-    integrand = np.conj(a) * b / psd
-    return 4 / dur * np.sum(integrand)
+    return noise_weighted_inner_product(a, b, 1 / psd, dur)
+
+
+def noise_weighted_inner_product(a, b, weights, duration):
+    """
+    :param a: ndarray of a(f)
+    :param b: ndarray of b(f)
+    :param weights: ndarray of 1/PSD(f)
+    :return: (4/duration) Σ [a*(f) b(f) / PSD]
+    """
+    return 4 / duration * kernels.get_backend().inner(a, b, weights)
+
+
+def chunked_inner_products(wf_a, wf_b, psd=None, chunk_size=CHUNK_SIZE):
+    """Computes <a|a>, <b|b> and <a|b> in one pass over frequency blocks.
+
+    Only `chunk_size` frequencies of each waveform (and of the interpolated
+    PSD) are held in memory at once, so memory-mapped waveforms (see
+    `storage.open_waveform`) are streamed from disk rather than loaded.
+
+    :return: tuple of (<a|a>, <b|b>, <a|b>)
+    """
+    if psd is None:
+        psd = get_zero_noise_psd()
+    freq, dur = wf_a.frequency, wf_a.duration
+    if len(freq) != len(wf_b.frequency):
+        raise ValueError(f"a, b have {len(freq)}, {len(wf_b.frequency)} frequencies")
+    backend = kernels.get_backend()
+    inner_a, inner_b, inner_ab = 0j, 0j, 0j
+    for start in range(0, len(freq), chunk_size):
+        block = slice(start, start + chunk_size)
+        a = combine_polarisations(wf_a, block)
+        b = combine_polarisations(wf_b, block)
+        weights = 1 / interpolate_psd(psd, np.asarray(freq[block]))
+        inner_a += backend.inner(a, a, weights)
+        inner_b += backend.inner(b, b, weights)
+        inner_ab += backend.inner(a, b, weights)
+    constant = 4 / dur
+    return constant * inner_a, constant * inner_b, constant * inner_ab
 
 
 def complex_filter(t0, wf_a: Waveform, wf_b: Waveform, psd=None):
@@ -78,12 +224,165 @@ def complex_filter(t0, wf_a: Waveform, wf_b: Waveform, psd=None):
     - phase for a(f) and b(f) to 0
     - time t0 for b(f) == 0 (hence b0)
 
+    :param t0: float or ndarray of times, the waveforms are unpacked once for all
     :returns z(t0) = 4 int [a *b0 * exp(2*pi*i*f*t0) / psd(f)] df
     """
     a, b, freq, dur, psd = _unpack_data(wf_a, wf_b, psd)
-    integrand = np.conj(a) * b * np.exp(2 * np.pi * freq * t0 * 1j) / psd
+    t0s = np.atleast_1d(t0)
     constant = 4 / dur
-    return constant * np.sum(integrand)
+    zs = constant * kernels.get_backend().filter(a, b, 1 / psd, freq, t0s.ravel())
+    return zs.reshape(t0s.shape) if np.ndim(t0) else zs[0]
+
+
+def fft_maximised_overlaps(a, b, weights, sampling_frequency):
+    """Overlaps of a(f) and b(f) maximised over time and phase with one inverse FFT
+
+    z(t) = Σ a*(f) b(f) exp(2πi f t) / PSD(f) (as in `complex_filter`) is
+    evaluated on every sample time of the signal, for batches of waveforms
+    broadcast along the leading axes.
+
+    :param a: ndarray (..., N) of a(f)
+    :param b: ndarray (..., N) of b(f)
+    :param weights: ndarray (N,) of 1/PSD(f)
+    :param sampling_frequency: float, sets the time resolution of the search
+    :return: tuple of ndarrays (...) of (overlap, time, phase)
+    """
+    integrand = np.conj(a) * b * weights
+    n = 2 * (integrand.shape[-1] - 1)
+    zs = fft_engine.ifft(integrand, n=n)
+    abs_zs = np.abs(zs)
+    max_idx = np.argmax(abs_zs, axis=-1)
+    z_max = np.take_along_axis(zs, max_idx[..., None], axis=-1)[..., 0] * n
+    norm = np.sqrt(np.sum((a.real ** 2 + a.imag ** 2) * weights, axis=-1) *
+                   np.sum((b.real ** 2 + b.imag ** 2) * weights, axis=-1))
+    time = np.where(max_idx > n // 2, max_idx - n, max_idx) / sampling_frequency
+    phase = np.mod(np.angle(z_max), 2 * np.pi)
+    return np.abs(z_max) / norm, time, phase
+
+
+def cumulative_inner_products(a, b, weights, duration):
+    """<a|a>, <b|b> and <a|b> over [f_0, f_k] for every frequency f_k, from
+    one cumulative sum along the last axis
+
+    :param a: ndarray (..., N) of a(f)
+    :param b: ndarray (..., N) of b(f)
+    :param weights: ndarray (N,) of 1/PSD(f)
+    :return: tuple of ndarrays (..., N) of (<a|a>, <b|b>, <a|b>)
+    """
+    constant = 4 / duration
+    return (constant * np.cumsum((a.real ** 2 + a.imag ** 2) * weights, axis=-1),
+            constant * np.cumsum((b.real ** 2 + b.imag ** 2) * weights, axis=-1),
+            constant * np.cumsum(np.conj(a) * b * weights, axis=-1))
+
+
+class CumulativeOverlap:
+    def __init__(self, frequency, inner_a, inner_b, inner_ab, maximised=False,
+                 time=None, phase=None):
+        """The cumulative inner products of (batches of) pairs of waveforms
+
+        The inner products over any band [f_i, f_j] are differences of two
+        entries of the cumulative sums, so the overlap against every upper
+        (or lower) frequency cut, or for any band, needs no new pass over
+        the data. Overlaps of bands without signal are nan.
+
+        :param frequency: ndarray (N,)
+        :param inner_a: ndarray (..., N) of cumulative <a|a> (see `cumulative_inner_products`)
+        :param maximised: bool, if True the overlaps are maximised over phase in
+            each band (|<a|b>|), and b was shifted by the time maximising the
+            overlap of the full band
+        :param time: ndarray (...) of the time shift of b when maximised
+        :param phase: ndarray (...) of the phase maximising the full band overlap
+        """
+        self.frequency = frequency
+        self.inner_a = inner_a
+        self.inner_b = inner_b
+        self.inner_ab = inner_ab
+        self.maximised = maximised
+        self.time = time
+        self.phase = phase
+
+    def _overlap(self, inner_a, inner_b, inner_ab):
+        numerator = np.abs(inner_ab) if self.maximised else inner_ab.real
+        # differences of cumulative sums can round to small negative norms
+        norm = np.sqrt(np.clip(inner_a.real, 0, None) * np.clip(inner_b.real, 0, None))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(norm > 0, numerator / norm, np.nan)
+
+    def _above(self, cumulative):
+        """Sums over [f_k, f_N] for every k"""
+        return cumulative[..., -1:] - cumulative + np.diff(cumulative, axis=-1, prepend=0)
+
+    @property
+    def overlap(self):
+        """ndarray (...) of the overlaps over all frequencies"""
+        return self._overlap(self.inner_a[..., -1], self.inner_b[..., -1],
+                             self.inner_ab[..., -1])
+
+    @property
+    def overlap_vs_maximum_frequency(self):
+        """ndarray (..., N) of the overlaps over [f_0, f_k]"""
+        return self._overlap(self.inner_a, self.inner_b, self.inner_ab)
+
+    @property
+    def overlap_vs_minimum_frequency(self):
+        """ndarray (..., N) of the overlaps over [f_k, f_N]"""
+        return self._overlap(self._above(self.inner_a), self._above(self.inner_b),
+                             self._above(self.inner_ab))
+
+    def band(self, minimum_frequency=None, maximum_frequency=None):
+        """
+        :return: ndarray (...) of the overlaps over [minimum_frequency, maximum_frequency]
+        """
+        start = 0 if minimum_frequency is None else np.searchsorted(
+            self.frequency, minimum_frequency)
+        stop = len(self.frequency) - 1 if maximum_frequency is None else np.searchsorted(
+            self.frequency, maximum_frequency, side='right') - 1
+        if stop < start:
+            raise ValueError(f"No frequencies in [{minimum_frequency}, {maximum_frequency}]")
+        inner = [c[..., stop] - (c[..., start - 1] if start > 0 else 0)
+                 for c in [self.inner_a, self.inner_b, self.inner_ab]]
+        return self._overlap(*inner)
+
+
+def cumulative_overlaps(a, b, weights, frequency, duration, maximise=False,
+                        sampling_frequency=None):
+    """Frequency resolved overlaps of (batches of) a(f) and b(f)
+
+    :param a: ndarray (..., N) of a(f)
+    :param b: ndarray (..., N) of b(f)
+    :param weights: ndarray (N,) of 1/PSD(f)
+    :param frequency: ndarray (N,) from 0 to the Nyquist frequency
+    :param maximise: bool, maximise over time (of the full band, with
+        `fft_maximised_overlaps`) and phase (of each band)
+    :param sampling_frequency: float, needed to maximise
+    :return: CumulativeOverlap
+    """
+    time = phase = None
+    if maximise:
+        _, time, phase = fft_maximised_overlaps(a, b, weights, sampling_frequency)
+        b = b * np.exp(2j * np.pi * frequency * np.asarray(time)[..., None])
+    inner_a, inner_b, inner_ab = cumulative_inner_products(a, b, weights, duration)
+    return CumulativeOverlap(frequency, inner_a, inner_b, inner_ab, maximise, time, phase)
+
+
+def compute_cumulative_overlap(wf1, wf2, psd=None, maximise=False):
+    """`cumulative_overlaps` of two Waveforms, or of two lists of Waveforms on one grid
+
+    :param psd: bilby PowerSpectralDensity, PSD filename or (frequency, psd) tuple
+    :return: CumulativeOverlap
+    """
+    batched = not isinstance(wf1, Waveform)
+    w1s, w2s = (wf1, wf2) if batched else ([wf1], [wf2])
+    frequency = w1s[0].frequency
+    for wf in [*w1s, *w2s]:
+        if len(wf.frequency) != len(frequency):
+            raise ValueError("All waveforms must share the same frequency grid")
+    a = np.array([combine_polarisations(wf) for wf in w1s])
+    b = np.array([combine_polarisations(wf) for wf in w2s])
+    if not batched:
+        a, b = a[0], b[0]
+    return cumulative_overlaps(a, b, get_weights(psd, frequency), frequency, w1s[0].duration,
+                               maximise, w1s[0].sampling_frequency)
 
 
 def get_snr_for_overlap(overlap):
@@ -100,12 +399,30 @@ def get_snr_for_overlap(overlap):
     return abs(np.sqrt(1 / (1 - overlap)))
 
 
-def plot_overlap(wf1, wf2, psd=None, filename=None):
+def plot_overlap(wf1, wf2, psd=None, filename=None, figure_name=None):
     overlap = compute_overlap(wf1, wf2, psd)
     snr = get_snr_for_overlap(overlap)
-    axes = plot_multiple_waveform_objects(waveform_objects=[wf1, wf2], freq_domain=True)
+    axes = plot_multiple_waveform_objects(waveform_objects=[wf1, wf2], freq_domain=True,
+                                          figure_name=figure_name)
     axes[0].set_title(f"Overlap = {overlap:.2f}, max(ρ) > {snr:.2f} ")
     if filename:
         plt.tight_layout()
         plt.savefig(filename)
     return axes
+
+
+def plot_cumulative_overlap(wf1, wf2, psd=None, maximise=False, filename=None):
+    """Plots the overlap of the frequencies below and above each frequency"""
+    cumulative = compute_cumulative_overlap(wf1, wf2, psd, maximise)
+    fig, ax = plt.subplots()
+    ax.plot(wf1.frequency, cumulative.overlap_vs_maximum_frequency, label="$f < f_{max}$")
+    ax.plot(wf1.frequency, cumulative.overlap_vs_minimum_frequency, label="$f > f_{min}$")
+    ax.set_xscale('log')
+    ax.set_xlabel('Frequency [Hz]')
+    ax.set_ylabel('Overlap')
+    ax.set_title(f"Overlap = {float(cumulative.overlap):.2f}")
+    ax.legend()
+    if filename:
+        plt.tight_layout()
+        plt.savefig(filename)
+    return ax
@@ -7,6 +7,7 @@ import scipy.optimize
 from matplotlib import pyplot as plt
 
 from . import overlap_computer
+from .executors import executor_scope
 from .waveform import Waveform, create_similar_waveform
 
 TLIM = (-4, 4)
@@ -17,7 +18,7 @@ NITER = 10
 NUM = 25
 
 
-def fft_overlap_optimizer(wf1: Waveform, wf2: Waveform, verbose=False):
+def fft_overlap_optimizer(wf1: Waveform, wf2: Waveform, verbose=False, psd=None):
     """ Gets Max overlap between two waveforms
     FINDCHIRP :https://arxiv.org/pdf/gr-qc/0509116.pdf
 
@@ -26,30 +27,32 @@ def fft_overlap_optimizer(wf1: Waveform, wf2: Waveform, verbose=False):
     :param wf1:
     :param wf2:
     :param verbose:
+    :param psd: PSD of the overlap, see `overlap_computer.get_weights`
     :return:
     """
-    t0s = np.linspace(- wf1.duration / 2, wf1.duration / 2, num=100)
     wf1_temp = create_similar_waveform(wf1, dict(phase=0))
     wf2_temp = create_similar_waveform(wf2, dict(phase=0, geocent_time=0))
-    z = np.vectorize(overlap_computer.complex_filter)
-    zs = z(t0s, wf1_temp, wf2_temp)
-
-    max_idx = np.argmax(np.abs(zs))
-    time = t0s[max_idx]
-    phase = np.angle(zs[max_idx])  # -pi, pi
-    phase = np.mod(phase, 2 * np.pi)  # -, 2pi
+    # z(t0) on every sample time with one inverse FFT (see `complex_filter`)
+    _, time, phase = overlap_computer.fft_maximised_overlaps(
+        overlap_computer.combine_polarisations(wf1_temp),
+        overlap_computer.combine_polarisations(wf2_temp),
+        overlap_computer.get_weights(psd, wf1_temp.frequency),
+        wf1_temp.sampling_frequency
+    )
+    time, phase = float(time), float(phase)  # phase in [0, 2pi)
 
     wf1_temp = create_similar_waveform(wf1_temp, dict(geocent_time=time, phase=phase))
     path = [[0, 0], [time, phase]]
-    return time, phase, overlap_computer.compute_overlap(wf1_temp, wf2_temp), path
+    return time, phase, overlap_computer.compute_overlap(wf1_temp, wf2_temp, psd), path
 
 
 def overlap_optimizer(wf1: Waveform, wf2: Waveform, verbose=False,
-                      method='Nelder-Mead'):
+                      method='Nelder-Mead', psd=None):
     """Method to estimate the maximum overlap.
 
     :param wf1:
     :param wf2:
+    :param psd: PSD of the overlap, see `overlap_computer.get_weights`
     :return:
     """
 
@@ -58,7 +61,7 @@ def overlap_optimizer(wf1: Waveform, wf2: Waveform, verbose=False,
 
     if method == "Nelder-Mead":
         minimizer_kwargs = dict(
-            args=(wf1, wf2),
+            args=(wf1, wf2, psd),
             tol=TOL,
             options=dict(disp=verbose, adaptive=True, maxiter=MAX_ITR),
             callback=make_minimize_cb(path),
@@ -66,7 +69,7 @@ def overlap_optimizer(wf1: Waveform, wf2: Waveform, verbose=False,
         )
     else:
         minimizer_kwargs = dict(
-            args=(wf1, wf2),
+            args=(wf1, wf2, psd),
             tol=TOL,
             options=dict(disp=verbose, adaptive=True),
             callback=make_minimize_cb(path),
@@ -122,17 +125,26 @@ def calculate_overlaps_optimizable(x: List, *args) -> float:
     Optimisable function for calculating overlaps.
 
     x: List of the [timeshift, phaseshift]
-    args: Tuple
+    args: Tuple of (wf1, wf2) or (wf1, wf2, psd)
 
     """
-    wf1, wf2 = (args)
+    wf1, wf2 = args[:2]
+    psd = args[2] if len(args) > 2 else None
     temp_wf1 = copy.deepcopy(wf1)
     temp_wf1.time_shift(amount=x[0])
     temp_wf1.phase_shift(amount=x[1])
-    return - overlap_computer.compute_overlap(temp_wf1, wf2)
+    return - overlap_computer.compute_overlap(temp_wf1, wf2, psd)
+
+
+def _shifted_overlap(wf1: Waveform, wf2: Waveform, time_shift, phase_shift):
+    temp_wf1 = copy.deepcopy(wf1)
+    temp_wf1.time_shift(time_shift)
+    temp_wf1.phase_shift(phase_shift)
+    return overlap_computer.compute_overlap(temp_wf1, wf2)
 
 
-def plot_waveform_optimization(wf1: Waveform, wf2: Waveform, path, fname):
+def plot_waveform_optimization(wf1: Waveform, wf2: Waveform, path, fname,
+                               executor=None):
     path = np.array(path).T
 
     t, p = np.meshgrid(
@@ -142,14 +154,9 @@ def plot_waveform_optimization(wf1: Waveform, wf2: Waveform, path, fname):
     wf1 = create_similar_waveform(wf1, dict(phase=0))
     wf2 = create_similar_waveform(wf2, dict(phase=0, geocent_time=0))
 
-    @np.vectorize
-    def f(t_, p_):
-        temp_wf1 = copy.deepcopy(wf1)
-        temp_wf1.time_shift(t_)
-        temp_wf1.phase_shift(p_)
-        return overlap_computer.compute_overlap(temp_wf1, wf2)
-
-    z = f(t, p)
+    with executor_scope(executor) as pool:
+        z = pool.map(_shifted_overlap, [wf1] * t.size, [wf2] * t.size, t.ravel(), p.ravel())
+    z = np.reshape(z, t.shape)
     plt.contourf(t, p, z)
 
     fig, ax = plt.subplots(figsize=(10, 6))
@@ -0,0 +1,275 @@
+"""
+
+A file for streaming overlap studies through pipelined stages for the
+gw_waveform_overlapper package.
+
+A study is a stream of (params_1, params_2) pairs, cut into batches that go
+through three stages joined by bounded `asyncio.Queue`s:
+
+- generate: `Waveform.inject_signals` for both sides of a batch, on the
+  executor's pool,
+- evaluate: the overlaps of the batch (and their time and phase maximised
+  overlaps, on the pool, when `optimise` is set),
+- write: the `write` callback with the columns of the batch, on a thread of
+  its own, so the writes never overlap and keep the input order.
+
+While one batch is written the next is evaluated and the ones after it are
+generated. A stage waits when the queue after it is full (backpressure), so
+at most about `2 * queue_size` batches of waveforms are held at once however
+long the stream is, and the pairs are only read from the iterable as space
+frees up. Batches reach the write stage in input order. An error in any stage,
+or cancelling the run (e.g. Ctrl-C), cancels the other stages and the queued
+pool tasks.
+
+    pairs = ((get_params(a_2=0, distance=d), get_params(a_2=0.1, distance=d))
+             for d in distances)
+    columns, metrics = run_pipeline(pairs, executor="process")
+
+"""
+
+import asyncio
+import concurrent.futures
+import itertools
+import time
+
+import numpy as np
+
+from .executors import PoolExecutor, executor_scope
+from .multiple_overlaps import calculate_multiple_overlaps_for_psds
+from .overlap_computer import combine_polarisations, fft_maximised_overlaps, get_weights, \
+    get_zero_noise_psd
+from .waveform import Waveform
+
+BATCH_SIZE = 16
+QUEUE_SIZE = 4  # batches buffered between two stages
+GENERATE = "generate"
+EVALUATE = "evaluate"
+WRITE = "write"
+STAGES = [GENERATE, EVALUATE, WRITE]
+_DONE = None  # end of stream marker put on the queues
+
+
+class StageMetrics:
+    def __init__(self, name):
+        """Throughput of one stage of the pipeline
+
+        :param name: str name of the stage
+        """
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self.busy = 0.  # seconds spent on batches
+        self.blocked = 0.  # seconds waiting for space in the next queue
+        self.start = None
+        self.stop = None
+
+    def record(self, n_items, busy):
+        self.batches += 1
+        self.items += n_items
+        self.busy += busy
+
+    @property
+    def elapsed(self):
+        if self.start is None:
+            return 0.
+        return (self.stop or time.perf_counter()) - self.start
+
+    @property
+    def throughput(self):
+        """Pairs per second since the stage started"""
+        return self.items / self.elapsed if self.elapsed > 0 else 0.
+
+    def summary(self):
+        return dict(name=self.name, batches=self.batches, items=self.items,
+                    busy=self.busy, blocked=self.blocked, elapsed=self.elapsed,
+                    throughput=self.throughput)
+
+    def __repr__(self):
+        return (f"{self.name}: {self.items} pairs in {self.batches} batches, "
+                f"{self.throughput:.1f} pairs/s (busy {self.busy:.1f}s, "
+                f"blocked {self.blocked:.1f}s)")
+
+
+def generate_batch(pairs, approximants=('IMRPhenomPv2',) * 2, **injection_kwargs):
+    """
+    :param pairs: list of (params_1, params_2) tuples
+    :return: tuple of the lists of Waveforms of the first and second params
+    """
+    return tuple(
+        Waveform.inject_signals([p[i] for p in pairs], approximant=approximants[i],
+                                **injection_kwargs)
+        for i in range(2)
+    )
+
+
+def evaluate_batch(w1s, w2s, psd=None):
+    """:return: dict of the overlap column of the pairs"""
+    psd = get_zero_noise_psd() if psd is None else psd
+    return dict(overlap=calculate_multiple_overlaps_for_psds(w1s, w2s, [psd])[:, 0])
+
+
+def optimise_batch(w1s, w2s, psd=None):
+    """Overlaps of the pairs maximised over time and phase with one batched
+    `fft_maximised_overlaps` of the generated waveforms (as `fft_overlap_optimizer`,
+    without regenerating them)
+
+    :return: dict of the time_shift, phase_shift and maximised overlap columns
+    """
+    overlaps, times, phases = fft_maximised_overlaps(
+        np.array([combine_polarisations(wf) for wf in w1s]),
+        np.array([combine_polarisations(wf) for wf in w2s]),
+        get_weights(psd, w1s[0].frequency), w1s[0].sampling_frequency)
+    return dict(time_shift=times, phase_shift=phases, optimised_overlap=overlaps)
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+async def _put(queue, item, metrics):
+    start = time.perf_counter()
+    await queue.put(item)
+    metrics.blocked += time.perf_counter() - start
+
+
+async def _timed(metrics, n_items, awaitable):
+    start = time.perf_counter()
+    result = await awaitable
+    metrics.record(n_items, time.perf_counter() - start)
+    metrics.stop = time.perf_counter()
+    return result
+
+
+async def _generate_stage(pairs, queue, run, batch_size, metrics, generate_kwargs):
+    metrics.start = time.perf_counter()
+    index = 0
+    for batch in _batched(pairs, batch_size):
+        task = asyncio.ensure_future(_timed(metrics, len(batch), run(
+            _call_generate_batch, batch, generate_kwargs, pool_task=True)))
+        await _put(queue, (np.arange(index, index + len(batch)), task), metrics)
+        index += len(batch)
+    await queue.put(_DONE)
+
+
+async def _evaluate_stage(in_queue, out_queue, run, psd, optimise, metrics):
+    while (item := await in_queue.get()) is not _DONE:
+        if metrics.start is None:
+            metrics.start = time.perf_counter()
+        indices, generating = item
+        w1s, w2s = await generating
+        start = time.perf_counter()
+        columns = dict(index=indices, **await run(evaluate_batch, w1s, w2s, psd))
+        if optimise:
+            columns.update(await run(optimise_batch, w1s, w2s, psd, pool_task=True))
+        del w1s, w2s
+        metrics.record(len(indices), time.perf_counter() - start)
+        await _put(out_queue, columns, metrics)
+    metrics.stop = time.perf_counter()
+    await out_queue.put(_DONE)
+
+
+async def _write_stage(queue, write, writer, metrics):
+    while (columns := await queue.get()) is not _DONE:
+        if metrics.start is None:
+            metrics.start = time.perf_counter()
+        start = time.perf_counter()
+        await asyncio.get_running_loop().run_in_executor(writer, write, columns)
+        metrics.record(len(columns["index"]), time.perf_counter() - start)
+    metrics.stop = time.perf_counter()
+
+
+def _call_generate_batch(batch, generate_kwargs):
+    return generate_batch(batch, **generate_kwargs)
+
+
+class ColumnCollector:
+    def __init__(self):
+        """A `write` callback keeping the columns of every batch in memory"""
+        self.batches = []
+
+    def __call__(self, columns):
+        self.batches.append(columns)
+
+    @property
+    def columns(self):
+        if not self.batches:
+            return {}
+        return {k: np.concatenate([b[k] for b in self.batches]) for k in self.batches[0]}
+
+
+async def run_pipeline_async(pairs, write=None, optimise=False, approximant='IMRPhenomPv2',
+                             psd=None, batch_size=BATCH_SIZE, queue_size=QUEUE_SIZE,
+                             executor=None, **injection_kwargs):
+    """Coroutine of `run_pipeline`, for callers already running an event loop"""
+    approximants = (approximant,) * 2 if isinstance(approximant, str) else tuple(approximant)
+    collector = ColumnCollector() if write is None else None
+    write = write or collector
+    metrics = {name: StageMetrics(name) for name in STAGES}
+    loop = asyncio.get_running_loop()
+    with executor_scope(executor) as executor, \
+            concurrent.futures.ThreadPoolExecutor(1) as thread, \
+            concurrent.futures.ThreadPoolExecutor(1) as serial, \
+            concurrent.futures.ThreadPoolExecutor(1) as writer:
+        # serial executors run the pool work on a thread of its own, so the stages still overlap
+        pool = executor.pool if isinstance(executor, PoolExecutor) else serial
+
+        def run(func, *args, pool_task=False):
+            return loop.run_in_executor(pool if pool_task else thread, func, *args)
+
+        generated = asyncio.Queue(queue_size)
+        evaluated = asyncio.Queue(queue_size)
+        tasks = [
+            asyncio.ensure_future(_generate_stage(
+                pairs, generated, run, batch_size, metrics[GENERATE],
+                dict(approximants=approximants, **injection_kwargs))),
+            asyncio.ensure_future(_evaluate_stage(
+                generated, evaluated, run, psd, optimise, metrics[EVALUATE])),
+            asyncio.ensure_future(_write_stage(evaluated, write, writer, metrics[WRITE])),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            # batches still queued hold generation tasks, cancel them too
+            while not generated.empty():
+                item = generated.get_nowait()
+                if item is not _DONE:
+                    item[1].cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    return (collector.columns if collector is not None else None), metrics
+
+
+def run_pipeline(pairs, write=None, optimise=False, approximant='IMRPhenomPv2', psd=None,
+                 batch_size=BATCH_SIZE, queue_size=QUEUE_SIZE, executor=None,
+                 verbose=True, **injection_kwargs):
+    """Streams pairs of params through the generate, evaluate and write stages
+
+    :param pairs: iterable of (params_1, params_2) tuples, read lazily
+    :param write: callable taking a dict of the columns of a batch (index,
+        overlap and, with `optimise`, time_shift, phase_shift and
+        optimised_overlap), or None to collect and return the columns
+    :param optimise: bool, also maximise the overlap of each pair over time and
+        phase (see `optimise_batch`)
+    :param approximant: str or pair of str approximants of the two waveforms
+    :param psd: PSD of the overlaps, see `multiple_overlaps.calculate_multiple_overlaps_for_psds`
+    :param batch_size: int pairs per batch
+    :param queue_size: int batches buffered between two stages
+    :param executor: see `executors.get_executor`, runs the generation
+        (and optimisation) of the batches
+    :param injection_kwargs: passed to `Waveform.inject_signals`
+    :return: tuple of (dict of columns or None if `write` is given,
+        dict of stage name: StageMetrics)
+    """
+    columns, metrics = asyncio.run(run_pipeline_async(
+        pairs, write=write, optimise=optimise, approximant=approximant, psd=psd,
+        batch_size=batch_size, queue_size=queue_size, executor=executor, **injection_kwargs))
+    if verbose:
+        for stage in metrics.values():
+            print(stage)
+    return columns, metrics
@@ -0,0 +1,122 @@
+"""
+
+A file for loading power spectral densities and building the noise weights
+used by the inner products of the gw_waveform_overlapper package.
+
+"""
+
+import functools
+import hashlib
+import os
+import tempfile
+
+import bilby
+import numpy as np
+
+PSD_CACHE_DIR = os.path.join(tempfile.gettempdir(), "gw_waveform_overlapper_psds")
+PSD_CACHE_SIZE = 32
+
+
+def load_psd(filename, is_asd=False):
+    """Loads a PSD (or ASD) file as memory-mapped frequency and PSD arrays.
+
+    Both text and `.npy` files hold an (N, 2) array of (frequency, psd)
+    columns, as written by `np.savetxt` or `np.save` of
+    `np.column_stack([frequency, psd])`; further columns are ignored.
+    `.npy` PSD files are memory-mapped directly. Text files (and ASDs) are
+    parsed once and stored as a binary copy in `PSD_CACHE_DIR`, so later
+    loads (also from other processes) are a memory map of that copy.
+    Repeated loads in a process return the cached arrays.
+
+    :param filename: path to a `.txt` or `.npy` file of (frequency, psd) columns
+    :param is_asd: bool, if True the second column is an ASD and is squared
+    :return: tuple of read-only (frequency, psd) ndarrays
+    """
+    filename = os.path.abspath(filename)
+    return _load_psd(filename, os.path.getmtime(filename), is_asd)
+
+
+@functools.lru_cache(maxsize=PSD_CACHE_SIZE)
+def _load_psd(filename, mtime, is_asd):
+    if filename.endswith('.npy') and not is_asd:
+        data = _check_columns(np.load(filename, mmap_mode='r'), filename)
+        return data[:, 0], data[:, 1]
+    # the cached copies are stored as (2, N) rows, so each array is contiguous
+    data = np.load(_get_binary_psd_file(filename, mtime, is_asd), mmap_mode='r')
+    return data[0], data[1]
+
+
+def _check_columns(data, filename):
+    if data.ndim != 2 or data.shape[1] < 2:
+        raise ValueError(f"{filename} is not an (N, 2) array of (frequency, psd) columns")
+    return data
+
+
+def _get_binary_psd_file(filename, mtime, is_asd):
+    key = hashlib.md5(f"{filename}{mtime}{is_asd}".encode()).hexdigest()
+    cached_file = os.path.join(PSD_CACHE_DIR, f"{key}.npy")
+    if not os.path.exists(cached_file):
+        if filename.endswith('.npy'):
+            frequency, psd = _check_columns(np.load(filename), filename)[:, :2].T
+        else:
+            frequency, psd = np.loadtxt(filename, unpack=True, usecols=(0, 1))
+        if is_asd:
+            psd = psd ** 2
+        os.makedirs(PSD_CACHE_DIR, exist_ok=True)
+        # write then rename so concurrent loaders never map a partial file
+        tmp_file = f"{cached_file}.{os.getpid()}.tmp.npy"
+        np.save(tmp_file, np.array([frequency, psd]))
+        os.replace(tmp_file, cached_file)
+    return cached_file
+
+
+def get_psd_file(psd):
+    """
+    :param psd: any PSD accepted by `interpolate_psd`
+    :return: tuple of (filename, is_asd) if `psd` is a PSD filename or a
+        (filename, is_asd) tuple, else None
+    """
+    if isinstance(psd, (str, os.PathLike)):
+        return psd, False
+    if isinstance(psd, (tuple, list)) and len(psd) == 2 \
+            and isinstance(psd[0], (str, os.PathLike)):
+        return psd[0], bool(psd[1])
+    return None
+
+
+def interpolate_psd(psd, frequency, is_asd=False):
+    """Interpolates a PSD onto a frequency grid.
+
+    Frequencies outside the range of the PSD are set to infinity (as is done
+    by bilby) so that they carry no weight in the inner products.
+
+    :param psd: bilby PowerSpectralDensity, PSD filename, (filename, is_asd)
+        tuple or (frequency, psd) tuple
+    :param frequency: ndarray of the frequencies to interpolate to
+    :param is_asd: bool, if True a PSD filename given on its own holds an ASD
+    :return: ndarray of the PSD at `frequency`
+    """
+    if isinstance(psd, bilby.gw.detector.PowerSpectralDensity):
+        return psd.power_spectral_density_interpolated(frequency)
+    if isinstance(psd, (str, os.PathLike)):
+        psd = (psd, is_asd)
+    psd_file = get_psd_file(psd)
+    if psd_file is not None:
+        psd = load_psd(*psd_file)
+    psd_frequency, psd_values = psd
+    return np.interp(frequency, psd_frequency, psd_values, left=np.inf, right=np.inf)
+
+
+def get_psd_weights(psds, frequency, is_asd=False):
+    """Builds the K x N matrix of noise weights 1/PSD for K PSDs.
+
+    :param psds: list of bilby PowerSpectralDensity, PSD filename,
+        (filename, is_asd) or (frequency, psd) tuples
+    :param frequency: ndarray of the N frequencies of the waveforms
+    :param is_asd: bool, see `interpolate_psd`
+    :return: ndarray of shape (K, N)
+    """
+    weights = np.empty((len(psds), len(frequency)))
+    for i, psd in enumerate(psds):
+        weights[i] = 1 / interpolate_psd(psd, frequency, is_asd)
+    return weights
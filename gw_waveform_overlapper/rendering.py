@@ -0,0 +1,105 @@
+"""
+
+A file for drawing long series quickly for the gw_waveform_overlapper package.
+
+A screen shows a few thousand points per line, so series are cut to the
+visible window and downsampled before they reach matplotlib, either with a
+min/max envelope (keeps every peak, best for oscillating strain) or
+Largest-Triangle-Three-Buckets (keeps the visual shape with fewer points).
+Named figures are kept and cleared between calls instead of being recreated.
+
+"""
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+MAX_POINTS = 4000
+MINMAX = 'minmax'
+LTTB = 'lttb'
+
+_figures = {}
+
+
+def get_window(x, xlim=None):
+    """
+    :param x: sorted ndarray
+    :param xlim: tuple of (left, right) limits, or None for all of x
+    :return: tuple of the (start, stop) indices of x inside xlim, with one
+        extra point on each side so lines reach the edges of the axes
+    """
+    if xlim is None:
+        return 0, len(x)
+    start = max(np.searchsorted(x, xlim[0]) - 1, 0)
+    stop = min(np.searchsorted(x, xlim[1], side='right') + 1, len(x))
+    return start, stop
+
+
+def minmax_envelope(x, y, max_points=MAX_POINTS):
+    """Keeps the min and max of y in each of max_points / 2 equal buckets"""
+    n, n_buckets = len(x), max_points // 2
+    if n <= max_points or n_buckets < 1:
+        return x, y
+    size = -(-n // n_buckets)
+    buckets = np.pad(y, (0, size * n_buckets - n), mode='edge').reshape(n_buckets, size)
+    i_min, i_max = np.argmin(buckets, axis=1), np.argmax(buckets, axis=1)
+    offsets = np.arange(n_buckets)[:, None] * size
+    idx = np.sort(np.stack([i_min, i_max], axis=1), axis=1) + offsets
+    idx = np.minimum(idx.ravel(), n - 1)
+    return x[idx], y[idx]
+
+
+def lttb(x, y, max_points=MAX_POINTS):
+    """Largest-Triangle-Three-Buckets downsampling (Steinarsson 2013)
+
+    Keeps the first and last points and, in each of max_points - 2 buckets,
+    the point making the largest triangle with the previously kept point and
+    the mean of the next bucket.
+    """
+    n = len(x)
+    if n <= max_points or max_points < 3:
+        return x, y
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    idx = np.empty(max_points, dtype=int)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(max_points - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        mean_x, mean_y = x[stop:next_stop].mean(), y[stop:next_stop].mean()
+        area = np.abs((x[a] - mean_x) * (y[start:stop] - y[a])
+                      - (x[a] - x[start:stop]) * (mean_y - y[a]))
+        a = start + int(np.argmax(area))
+        idx[i + 1] = a
+    return x[idx], y[idx]
+
+
+DECIMATORS = {MINMAX: minmax_envelope, LTTB: lttb}
+
+
+def decimate(x, y, max_points=MAX_POINTS, method=MINMAX, xlim=None):
+    """Cuts (x, y) to xlim and downsamples it to at most max_points points
+
+    :param method: 'minmax' or 'lttb'
+    :return: tuple of the (x, y) ndarrays to draw
+    """
+    if method not in DECIMATORS:
+        raise ValueError(f"Unknown method {method}, choose from {list(DECIMATORS)}")
+    start, stop = get_window(x, xlim)
+    return DECIMATORS[method](x[start:stop], y[start:stop], max_points)
+
+
+def get_figure(name, nrows=1, ncols=1, **kwargs):
+    """A named figure, created on the first call and cleared on later calls
+
+    :param kwargs: passed to `plt.subplots` when the figure is created
+    :return: tuple of (fig, axes) as returned by `plt.subplots`
+    """
+    key = (name, nrows, ncols)
+    if key in _figures and plt.fignum_exists(_figures[key][0].number):
+        fig, axes = _figures[key]
+        for ax in np.atleast_1d(axes).ravel():
+            ax.cla()
+        return fig, axes
+    fig, axes = plt.subplots(nrows, ncols, **kwargs)
+    _figures[key] = (fig, axes)
+    return fig, axes
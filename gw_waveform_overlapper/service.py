@@ -0,0 +1,491 @@
+"""
+
+A file for serving waveforms and overlaps from a long-running local process
+for the gw_waveform_overlapper package.
+
+The service keeps the bilby/LAL imports, the PSDs and a `WaveformCache` per
+grid warm between requests. Requests are JSON POSTs over HTTP, on a TCP port
+or a Unix socket:
+
+- /inject_signal {"parameters": {...}}: the frequency series of the waveform
+- /compute_overlap {"parameters_1": {...}, "parameters_2": {...}}: {"overlap"}
+- /fft_overlap_optimizer (as compute_overlap): {"time_shift", "phase_shift", "overlap"}
+- GET /stats: the request, batch and cache counters
+
+with the optional keys "approximant" (a pair for the overlaps), "psd" (a PSD
+filename), "duration", "sampling_frequency", "reference_frequency" and
+"minimum_frequency". Identical requests in flight at the same time share one
+evaluation, and requests arriving within `BATCH_WINDOW` seconds of each other
+are evaluated together: their waveforms are generated with one
+`WaveformCache.generate` call, and the overlaps of each grid and PSD are one
+matrix product (or one batched inverse FFT for the optimiser).
+
+    python -m gw_waveform_overlapper serve --socket /tmp/overlaps.sock
+
+    client = OverlapClient("/tmp/overlaps.sock")
+    overlap = client.compute_overlap(params_1, params_2)
+
+"""
+
+import base64
+import concurrent.futures
+import http.client
+import http.server
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+
+import numpy as np
+
+from .cache import CACHE_SIZE, WaveformCache, parameters_key
+from .executors import get_executor
+from .multiple_overlaps import calculate_multiple_overlaps_for_psds
+from .overlap_computer import combine_polarisations, fft_maximised_overlaps, get_weights, \
+    get_zero_noise_psd
+from .waveform import Waveform, DEFAULT_SAMPLING_FREQ, REF_FREQ, MIN_FREQ, POLARISATION
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+BATCH_WINDOW = 0.005  # seconds a request waits for others to be batched with
+MAX_BATCH = 64
+TIMEOUT = 600
+INJECT_SIGNAL = "inject_signal"
+COMPUTE_OVERLAP = "compute_overlap"
+FFT_OVERLAP_OPTIMIZER = "fft_overlap_optimizer"
+METHODS = [INJECT_SIGNAL, COMPUTE_OVERLAP, FFT_OVERLAP_OPTIMIZER]
+GRID_DEFAULTS = dict(duration=4, sampling_frequency=DEFAULT_SAMPLING_FREQ,
+                     reference_frequency=REF_FREQ, minimum_frequency=MIN_FREQ)
+_STOP = None
+
+
+class ServiceError(Exception):
+    pass
+
+
+def normalise_request(method, request):
+    """Fills in the defaults of a request, so equal requests have equal keys
+
+    :raises ValueError: if the method is unknown or the request misses parameters
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown method {method}, choose from {METHODS}")
+    request = {**GRID_DEFAULTS, "approximant": 'IMRPhenomPv2', "psd": None, **request}
+    names = ["parameters"] if method == INJECT_SIGNAL else ["parameters_1", "parameters_2"]
+    for name in names:
+        if name not in request:
+            raise ValueError(f"{method} requests need '{name}'")
+        request[name] = {k: float(v) for k, v in request[name].items()}
+    if method != INJECT_SIGNAL and isinstance(request["approximant"], str):
+        request["approximant"] = [request["approximant"]] * 2
+    return request
+
+
+def get_request_key(method, request):
+    return method, json.dumps(request, sort_keys=True)
+
+
+def encode_array(array):
+    array = np.ascontiguousarray(array)
+    return dict(dtype=array.dtype.str, data=base64.b64encode(array.data).decode())
+
+
+def decode_array(data):
+    return np.frombuffer(base64.b64decode(data["data"]), dtype=data["dtype"])
+
+
+def encode_result(method, result):
+    """:return: JSON-able dict of a result of `OverlapService.call`"""
+    if method == INJECT_SIGNAL:
+        return dict(
+            frequency=encode_array(result.frequency),
+            frequency_domain_signal={
+                k: encode_array(result.frequency_domain_signal[k]) for k in POLARISATION},
+            sampling_frequency=result.sampling_frequency, approximant=result.approximant,
+            parameters={k: float(v) for k, v in result.parameters.items()},
+        )
+    if method == COMPUTE_OVERLAP:
+        return dict(overlap=float(result))
+    time_shift, phase_shift, overlap = result
+    return dict(time_shift=float(time_shift), phase_shift=float(phase_shift),
+                overlap=float(overlap))
+
+
+class OverlapService:
+    def __init__(self, cache_size=CACHE_SIZE, batch_window=BATCH_WINDOW,
+                 max_batch=MAX_BATCH, executor=None):
+        """Evaluates requests in micro-batches on a worker thread
+
+        :param cache_size: int waveforms kept per grid
+        :param batch_window: float seconds to wait for more requests to batch
+        :param max_batch: int max requests evaluated together
+        :param executor: see `executors.get_executor`, used for waveform generation
+        """
+        self.cache_size = cache_size
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.executor = get_executor(executor)
+        self.caches = {}
+        self.psds = {}
+        self.counters = dict(requests=0, coalesced=0, batches=0, evaluated=0)
+        self._queue = queue.Queue()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, method, request):
+        """Queues a request, or joins an identical one already in flight
+
+        :return: concurrent.futures.Future of the result
+        """
+        request = normalise_request(method, request)
+        key = get_request_key(method, request)
+        with self._lock:
+            self.counters["requests"] += 1
+            future = self._pending.get(key)
+            if future is not None:
+                self.counters["coalesced"] += 1
+                return future
+            future = concurrent.futures.Future()
+            self._pending[key] = future
+        future.add_done_callback(lambda _: self._forget(key))
+        self._queue.put((method, request, future))
+        return future
+
+    def call(self, method, request, timeout=TIMEOUT):
+        """
+        :return: Waveform for inject_signal, the overlap for compute_overlap
+            and (time shift, phase shift, overlap) for fft_overlap_optimizer
+        """
+        return self.submit(method, request).result(timeout)
+
+    def _forget(self, key):
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def _run(self):
+        while (item := self._queue.get()) is not _STOP:
+            batch = [item]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.put(_STOP)
+                    break
+                batch.append(item)
+            self.evaluate(batch)
+
+    def get_cache(self, grid):
+        if grid not in self.caches:
+            self.caches[grid] = WaveformCache(self.cache_size, **dict(grid))
+        return self.caches[grid]
+
+    def get_psd(self, psd):
+        if psd not in self.psds:
+            self.psds[psd] = get_zero_noise_psd() if psd is None else psd
+        return self.psds[psd]
+
+    def evaluate(self, batch):
+        """Evaluates a batch of (method, request, future), grouped by grid
+
+        If a grid's batch fails, its unfinished requests are retried one at a
+        time (the waveforms already generated are cached), so a bad request
+        only fails its own future, not those batched with it.
+        """
+        self.counters["batches"] += 1
+        self.counters["evaluated"] += len(batch)
+        groups = {}
+        for item in batch:
+            grid = tuple((k, item[1][k]) for k in GRID_DEFAULTS)
+            groups.setdefault(grid, []).append(item)
+        for grid, items in groups.items():
+            try:
+                self._evaluate_grid(grid, items)
+            except Exception as e:
+                if len(items) == 1:
+                    items[0][2].set_exception(e)
+                    continue
+                for item in items:
+                    if item[2].done():
+                        continue
+                    try:
+                        self._evaluate_grid(grid, [item])
+                    except Exception as e:
+                        item[2].set_exception(e)
+
+    def _evaluate_grid(self, grid, items):
+        cache = self.get_cache(grid)
+        requests = []
+        for method, request, _ in items:
+            if method == INJECT_SIGNAL:
+                requests.append((request["approximant"], request["parameters"]))
+            else:
+                requests += list(zip(request["approximant"], _get_pair(method, request)))
+        found = cache.generate(requests, self.executor)
+
+        by_psd = {}
+        for method, request, future in items:
+            if method == INJECT_SIGNAL:
+                future.set_result(found[_get_key(request["approximant"], request["parameters"])])
+            else:
+                by_psd.setdefault((method, request["psd"]), []).append((request, future))
+        for (method, psd), group in by_psd.items():
+            pairs = [[found[_get_key(a, p)] for a, p in zip(
+                request["approximant"], _get_pair(method, request))] for request, _ in group]
+            w1s, w2s = [p[0] for p in pairs], [p[1] for p in pairs]
+            if method == COMPUTE_OVERLAP:
+                results = calculate_multiple_overlaps_for_psds(w1s, w2s, [self.get_psd(psd)])[:, 0]
+            else:
+                results = self._optimise(cache, w1s, w2s, [request for request, _ in group], psd)
+            for (_, future), result in zip(group, results):
+                future.set_result(result)
+
+    def _optimise(self, cache, w1s, w2s, requests, psd):
+        """Batched `overlap_optimizer.fft_overlap_optimizer` of the phase zeroed pairs"""
+        weights = get_weights(psd, w1s[0].frequency)
+        _, times, phases = fft_maximised_overlaps(
+            np.array([combine_polarisations(wf) for wf in w1s]),
+            np.array([combine_polarisations(wf) for wf in w2s]),
+            weights, w1s[0].sampling_frequency)
+        shifted = [
+            (request["approximant"][0],
+             dict(request["parameters_1"], phase=float(phase), geocent_time=float(t)))
+            for request, t, phase in zip(requests, times, phases)
+        ]
+        found = cache.generate(shifted, self.executor)
+        w1s = [found[_get_key(a, p)] for a, p in shifted]
+        overlaps = calculate_multiple_overlaps_for_psds(w1s, w2s, [self.get_psd(psd)])[:, 0]
+        return list(zip(times, phases, overlaps))
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters, in_flight=len(self._pending))
+        counters["caches"] = {
+            json.dumps(dict(grid)): cache.stats for grid, cache in self.caches.items()}
+        return counters
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._worker.join()
+        self.executor.close()
+
+
+def _get_key(approximant, parameters):
+    return approximant, parameters_key(parameters)
+
+
+def _get_pair(method, request):
+    """The (params_1, params_2) whose waveforms a request is evaluated on"""
+    if method == FFT_OVERLAP_OPTIMIZER:
+        # as fft_overlap_optimizer, compared at zero phase and wf2 at zero time
+        return (dict(request["parameters_1"], phase=0),
+                dict(request["parameters_2"], phase=0, geocent_time=0))
+    return request["parameters_1"], request["parameters_2"]
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path.strip("/") == "stats":
+            self._send(200, self.server.service.stats())
+        else:
+            self._send(404, dict(error=f"Unknown path {self.path}"))
+
+    def do_POST(self):
+        method = self.path.strip("/")
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if method not in METHODS:
+            self._send(404, dict(error=f"Unknown method {method}, choose from {METHODS}"))
+            return
+        try:
+            result = self.server.service.call(method, json.loads(body or b"{}"))
+            self._send(200, encode_result(method, result))
+        except Exception as e:
+            self._send(400, dict(error=f"{type(e).__name__}: {e}"))
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class _ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(service=None, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None,
+                  verbose=False):
+    """
+    :param service: OverlapService (default: a new one)
+    :param socket_path: str, if given serve on this Unix socket instead of host:port
+    :return: a socketserver server with `serve_forever` and `shutdown`, whose
+        `server_address` is the socket path or the (host, port) served on
+    """
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = _ThreadingUnixHTTPServer(socket_path, _Handler)
+    else:
+        server = http.server.ThreadingHTTPServer((host, port), _Handler)
+    server.service = service or OverlapService()
+    server.verbose = verbose
+    return server
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, verbose=True,
+          **service_kwargs):
+    """Runs the service until interrupted
+
+    :param service_kwargs: passed to `OverlapService`
+    """
+    server = create_server(OverlapService(**service_kwargs), host, port, socket_path, verbose)
+    print(f"Serving overlaps on {server.server_address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.close()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=TIMEOUT):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class OverlapClient:
+    def __init__(self, address=None, timeout=TIMEOUT):
+        """Calls a running `serve` with the signatures of the in-process functions
+
+        Waveforms may be given as param dicts or as Waveforms (their
+        `parameters` and `approximant` are sent). Each thread keeps its own
+        connection open between calls.
+
+        :param address: "host:port", a (host, port) tuple or a Unix socket path
+        """
+        address = address or (DEFAULT_HOST, DEFAULT_PORT)
+        if isinstance(address, str) and not os.path.exists(address) and ":" in address:
+            host, port = address.rsplit(":", 1)
+            address = (host, int(port))
+        self.address = address
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        if isinstance(self.address, str):
+            return _UnixHTTPConnection(self.address, self.timeout)
+        return http.client.HTTPConnection(*self.address, timeout=self.timeout)
+
+    def request(self, method, payload=None):
+        """
+        :return: dict of the JSON response
+        :raises ServiceError: if the service could not evaluate the request
+        """
+        body = None if payload is None else json.dumps(payload)
+        for attempt in range(2):
+            connection = getattr(self._local, "connection", None) or self._connect()
+            self._local.connection = connection
+            try:
+                connection.request("GET" if body is None else "POST", f"/{method}", body,
+                                   {"Content-Type": "application/json"})
+                response = connection.getresponse()
+                data = json.loads(response.read())
+                break
+            except (ConnectionError, http.client.HTTPException):
+                # the kept-alive connection was closed by the server, reconnect once
+                connection.close()
+                self._local.connection = None
+                if attempt:
+                    raise
+        if response.status != 200:
+            raise ServiceError(data.get("error"))
+        return data
+
+    def _pair_request(self, wf1, wf2, psd, approximant, grid):
+        if psd is not None and not isinstance(psd, (str, os.PathLike)):
+            raise ValueError("The service takes PSD filenames")
+        p1, a1 = _get_parameters(wf1)
+        p2, a2 = _get_parameters(wf2)
+        if approximant is None:
+            approximant = [a1 or 'IMRPhenomPv2', a2 or 'IMRPhenomPv2']
+        return dict(parameters_1=p1, parameters_2=p2, approximant=approximant,
+                    psd=None if psd is None else os.path.abspath(psd), **grid)
+
+    def inject_signal(self, injection_parameters, approximant='IMRPhenomPv2', **grid):
+        """`Waveform.inject_signal` on the service
+
+        :param grid: duration, sampling_frequency, reference_frequency or minimum_frequency
+        :return: Waveform
+        """
+        request = dict(parameters=injection_parameters, approximant=approximant, **grid)
+        data = self.request(INJECT_SIGNAL, request)
+        return Waveform.from_arrays(
+            decode_array(data["frequency"]),
+            {k: decode_array(v) for k, v in data["frequency_domain_signal"].items()},
+            sampling_frequency=data["sampling_frequency"],
+            duration=grid.get("duration", GRID_DEFAULTS["duration"]),
+            approximant=data["approximant"], parameters=data["parameters"])
+
+    def compute_overlap(self, wf1, wf2, psd=None, approximant=None, **grid):
+        """`overlap_computer.compute_overlap` on the service
+
+        :param psd: None or a PSD filename
+        :param approximant: str or pair of str, defaults to the approximants
+            of the Waveforms (or IMRPhenomPv2 for param dicts)
+        """
+        data = self.request(COMPUTE_OVERLAP, self._pair_request(wf1, wf2, psd, approximant, grid))
+        return data["overlap"]
+
+    def fft_overlap_optimizer(self, wf1, wf2, verbose=False, psd=None, approximant=None,
+                              **grid):
+        """`overlap_optimizer.fft_overlap_optimizer` on the service
+
+        :return: time shift, phase shift, overlap, path
+        """
+        data = self.request(FFT_OVERLAP_OPTIMIZER,
+                            self._pair_request(wf1, wf2, psd, approximant, grid))
+        time_shift, phase_shift = data["time_shift"], data["phase_shift"]
+        return time_shift, phase_shift, data["overlap"], [[0, 0], [time_shift, phase_shift]]
+
+    def stats(self):
+        return self.request("stats")
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def _get_parameters(wf):
+    """:return: tuple of the param dict and approximant (or None) of a Waveform or dict"""
+    if isinstance(wf, Waveform):
+        return wf.parameters, wf.approximant
+    return dict(wf), None
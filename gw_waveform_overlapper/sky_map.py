@@ -0,0 +1,153 @@
+"""
+
+A file for computing detector-projected overlaps over the sky for the
+gw_waveform_overlapper package.
+
+The sky location (ra, dec), polarisation angle psi and the detectors only
+enter a signal through the antenna patterns and the time delay from the
+geocenter,
+
+    h_d(f) = [F+_d h+(f) + Fx_d hx(f)] exp(-2πi f Δt_d),
+
+so the network inner products of two waveforms follow from the 2x2 matrices
+of their polarisation inner products <h1_p|h2_q>_d, computed once per
+detector. A whole sky and psi grid is then a few einsums, with no waveform
+regeneration.
+
+"""
+
+import bilby
+import numpy as np
+
+from . import kernels
+from .overlap_computer import noise_weighted_inner_product
+from .psd import interpolate_psd
+
+IFOS = ['H1', 'L1', 'V1']
+NSIDE = 16
+NUM_PSI = 8
+POLARISATIONS = ['plus', 'cross']
+
+
+def get_sky_grid(nside=NSIDE):
+    """Equal area sky grid of 12 nside^2 pixels
+
+    Uses the HEALPix pixel centres (ring ordering) when healpy is installed,
+    otherwise a Fibonacci lattice with the same number of points.
+
+    :return: tuple of (ra, dec) ndarrays
+    """
+    npix = 12 * nside ** 2
+    try:
+        import healpy
+        theta, phi = healpy.pix2ang(nside, np.arange(npix))
+        return phi, np.pi / 2 - theta
+    except ImportError:
+        i = np.arange(npix) + 0.5
+        dec = np.arcsin(1 - 2 * i / npix)
+        ra = np.mod(np.pi * (1 + 5 ** 0.5) * i, 2 * np.pi)
+        return ra, dec
+
+
+def _source_frame(ra, dec, time):
+    """Earth-frame unit vectors u, v and the direction ω to the source (bilby convention)"""
+    phi = ra - np.mod(bilby.gw.utils.greenwich_mean_sidereal_time(time), 2 * np.pi)
+    theta = np.pi / 2 - dec
+    u = np.stack([np.cos(phi) * np.cos(theta), np.cos(theta) * np.sin(phi), -np.sin(theta)], -1)
+    v = np.stack([-np.sin(phi), np.cos(phi), np.zeros_like(phi)], -1)
+    omega = np.stack([np.sin(theta) * np.cos(phi), np.sin(theta) * np.sin(phi),
+                      np.cos(theta)], -1)
+    return u, v, omega
+
+
+def antenna_patterns(ifo, ra, dec, psi, time=0):
+    """Vectorised `bilby.gw.detector.Interferometer.antenna_response`
+
+    :param ifo: bilby Interferometer
+    :param ra, dec: ndarrays of npix sky locations
+    :param psi: ndarray of npsi polarisation angles
+    :return: ndarray (2, npix, npsi) of the plus and cross antenna patterns
+    """
+    u, v, _ = _source_frame(np.atleast_1d(ra), np.atleast_1d(dec), time)
+    psi = np.atleast_1d(psi)[None, :, None]
+    u, v = u[:, None, :], v[:, None, :]
+    m = -u * np.sin(psi) - v * np.cos(psi)
+    n = -u * np.cos(psi) + v * np.sin(psi)
+    tensor = ifo.geometry.detector_tensor
+    plus = (np.einsum('ij,...i,...j->...', tensor, m, m)
+            - np.einsum('ij,...i,...j->...', tensor, n, n))
+    cross = 2 * np.einsum('ij,...i,...j->...', tensor, m, n)
+    return np.stack([plus, cross])
+
+
+def time_delays(ifo, ra, dec, time=0):
+    """Vectorised `bilby.gw.detector.Interferometer.time_delay_from_geocenter`"""
+    _, _, omega = _source_frame(np.atleast_1d(ra), np.atleast_1d(dec), time)
+    return -omega @ ifo.geometry.vertex / bilby.core.utils.speed_of_light
+
+
+def _polarisation_inner_products(wf_a, wf_b, weights, delays=None):
+    """<a_p|b_q> as an ndarray (2, 2), or (npix, 2, 2) for b delayed by `delays`"""
+    if delays is None:
+        return np.array([[
+            noise_weighted_inner_product(
+                wf_a.frequency_domain_signal[p], wf_b.frequency_domain_signal[q],
+                weights, wf_a.duration)
+            for q in POLARISATIONS] for p in POLARISATIONS])
+    backend = kernels.get_backend()
+    return np.stack([np.stack([
+        4 / wf_a.duration * backend.filter(
+            wf_a.frequency_domain_signal[p], wf_b.frequency_domain_signal[q],
+            weights, wf_a.frequency, -delays)
+        for q in POLARISATIONS], -1) for p in POLARISATIONS], -2)
+
+
+def sky_overlap_map(wf1, wf2, ifos=None, ra=None, dec=None, psi=None,
+                    reference_sky=None, psds=None):
+    """Network overlap of the detector projections of two waveforms over the sky
+
+    :param wf1: Waveform
+    :param wf2: Waveform (on the frequency grid of wf1)
+    :param ifos: list of detector names or a bilby InterferometerList (default `IFOS`)
+    :param ra, dec: ndarrays of the sky grid (default `get_sky_grid()`)
+    :param psi: ndarray of polarisation angles (default `NUM_PSI` in [0, π))
+    :param reference_sky: dict of ra, dec and psi. If given, wf1 stays at this
+        location while wf2 is moved over the grid (so the relative time
+        delays enter); otherwise both waveforms are at each grid point, where
+        the time delays cancel
+    :param psds: list of PSDs of the detectors (default: the detectors' PSDs)
+    :return: dict of ra, dec, psi and overlap, an ndarray (npix, npsi)
+    """
+    if ifos is None:
+        ifos = IFOS
+    if not isinstance(ifos, bilby.gw.detector.InterferometerList):
+        ifos = bilby.gw.detector.InterferometerList(ifos)
+    if ra is None or dec is None:
+        ra, dec = get_sky_grid()
+    if psi is None:
+        psi = np.linspace(0, np.pi, NUM_PSI, endpoint=False)
+    if psds is None:
+        psds = [ifo.power_spectral_density for ifo in ifos]
+    time = wf1.parameters.get('geocent_time', 0)
+    inner_11, inner_22, inner_12 = 0, 0, 0
+    for ifo, psd in zip(ifos, psds):
+        weights = 1 / interpolate_psd(psd, wf1.frequency)
+        f2 = antenna_patterns(ifo, ra, dec, psi, time)
+        inner_22 = inner_22 + np.einsum(
+            'pab,pq,qab->ab', f2, _polarisation_inner_products(wf2, wf2, weights), f2)
+        if reference_sky is None:
+            f1 = f2
+            inner_12 = inner_12 + np.einsum(
+                'pab,pq,qab->ab', f1, _polarisation_inner_products(wf1, wf2, weights), f2)
+        else:
+            f1 = antenna_patterns(ifo, reference_sky['ra'], reference_sky['dec'],
+                                  reference_sky['psi'], time)
+            delays = (time_delays(ifo, ra, dec, time)
+                      - time_delays(ifo, reference_sky['ra'], reference_sky['dec'], time))
+            inner_12 = inner_12 + np.einsum(
+                'p,apq,qab->ab', f1[:, 0, 0],
+                _polarisation_inner_products(wf1, wf2, weights, delays), f2)
+        inner_11 = inner_11 + np.einsum(
+            'pab,pq,qab->ab', f1, _polarisation_inner_products(wf1, wf1, weights), f1)
+    overlap = inner_12.real / np.sqrt(inner_11.real * inner_22.real)
+    return dict(ra=ra, dec=dec, psi=psi, overlap=overlap)
@@ -0,0 +1,288 @@
+"""
+
+A file for storing waveforms on disk for the gw_waveform_overlapper package.
+
+A stored waveform is a directory holding the frequency array, the frequency
+domain polarisations (as one (2, N) array in `POLARISATION` order) and a json
+file of metadata. The arrays are opened as read-only memory maps, so only the
+frequency blocks that are read are ever resident.
+
+Collections of waveforms on one frequency grid are stored in a single npy
+directory, npz, HDF5 or Arrow file by `save_waveforms`, and `open_waveforms`
+reads each waveform only when it is indexed.
+
+"""
+
+import json
+import os
+
+import numpy as np
+
+from .waveform import POLARISATION, Waveform
+
+FREQUENCY_FILE = "frequency.npy"
+SIGNAL_FILE = "frequency_domain_signal.npy"
+META_FILE = "meta.json"
+
+
+class MemmapWaveform:
+    def __init__(self, frequency, frequency_domain_signal, duration,
+                 sampling_frequency, approximant, parameters):
+        """A frequency domain only waveform backed by memory-mapped arrays.
+
+        It can be passed to the `overlap_computer` functions in place of a
+        `Waveform` (use `chunk_size` to keep them from reading everything).
+
+        :param frequency: ndarray of frequency
+        :param frequency_domain_signal: dict of 'cross' and 'plus' signal data
+        :param duration: float, matches `Waveform.duration`
+        :param sampling_frequency: float
+        :param approximant: str of the approximant for the signal
+        :param parameters: dict of params
+        """
+        self.frequency = frequency
+        self.frequency_domain_signal = frequency_domain_signal
+        self.duration = duration
+        self.sampling_frequency = sampling_frequency
+        self.approximant = approximant
+        self.parameters = parameters
+
+
+def save_waveform(wf, path):
+    """Writes the frequency domain data of a waveform to the directory `path`.
+
+    :param wf: Waveform (or MemmapWaveform)
+    :param path: str of directory to write to
+    """
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, FREQUENCY_FILE), wf.frequency)
+    signal = np.lib.format.open_memmap(
+        os.path.join(path, SIGNAL_FILE), mode="w+", dtype=complex,
+        shape=(len(POLARISATION), len(wf.frequency))
+    )
+    for i, p in enumerate(POLARISATION):
+        signal[i] = wf.frequency_domain_signal[p]
+    signal.flush()
+    meta = dict(
+        duration=float(wf.duration),
+        sampling_frequency=float(wf.sampling_frequency),
+        approximant=wf.approximant,
+        parameters={k: float(v) for k, v in wf.parameters.items()},
+    )
+    with open(os.path.join(path, META_FILE), "w") as f:
+        json.dump(meta, f)
+
+
+def open_waveform(path, mode="r"):
+    """Opens a waveform written by `save_waveform` without reading its arrays.
+
+    :param path: str of the waveform directory
+    :param mode: memory map mode of the arrays ('r', 'r+' or 'c')
+    :return: MemmapWaveform
+    """
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    signal = np.load(os.path.join(path, SIGNAL_FILE), mmap_mode=mode)
+    return MemmapWaveform(
+        frequency=np.load(os.path.join(path, FREQUENCY_FILE), mmap_mode=mode),
+        frequency_domain_signal={p: signal[i] for i, p in enumerate(POLARISATION)},
+        **meta
+    )
+
+
+NPY = "npy"
+NPZ = "npz"
+HDF5 = "hdf5"
+ARROW = "arrow"
+FORMATS = {".npz": NPZ, ".h5": HDF5, ".hdf5": HDF5, ".arrow": ARROW, ".feather": ARROW}
+COLLECTION_META_KEY = "gw_waveform_overlapper"
+
+
+def get_format(path):
+    """:return: the collection format of a path from its extension (a directory is 'npy')"""
+    return FORMATS.get(os.path.splitext(path)[1].lower(), NPY)
+
+
+def _collection_meta(wfs):
+    frequency = wfs[0].frequency
+    for wf in wfs:
+        if not np.array_equal(wf.frequency, frequency):
+            raise ValueError("All waveforms must share the same frequency grid")
+    return dict(
+        sampling_frequency=float(wfs[0].sampling_frequency),
+        approximants=[wf.approximant for wf in wfs],
+        parameters=[{k: float(v) for k, v in wf.parameters.items()} for wf in wfs],
+    )
+
+
+def _frequency_grid(frequency):
+    """:return: [first, last, length] of an evenly spaced frequency grid, the
+    `np.linspace` arguments rebuilding it (as `bilby.core.utils.create_frequency_series`)"""
+    grid = [float(frequency[0]), float(frequency[-1]), len(frequency)]
+    if not np.array_equal(np.linspace(*grid), frequency):
+        raise ValueError("The frequency grid must be evenly spaced")
+    return grid
+
+
+def _stacked_signal(wf):
+    return np.stack([wf.frequency_domain_signal[p] for p in POLARISATION])
+
+
+def save_waveforms(wfs, path, file_format=None, compression=None):
+    """Writes a collection of waveforms on one frequency grid to a single file
+
+    Formats (picked from the extension of `path` by default):
+    - 'npy': a directory with an (M, 2, N) .npy array, opened as a memory map
+    - 'npz': a compressed npz with one member per waveform
+    - 'hdf5': an HDF5 file with an (M, 2, N) dataset chunked per waveform (needs h5py)
+    - 'arrow': an Arrow IPC file, opened as a memory map (needs pyarrow), on an
+      evenly spaced frequency grid stored as its first and last frequency and length
+
+    :param wfs: list of Waveforms (or MemmapWaveforms)
+    :param path: str of the file (or directory for 'npy') to write
+    :param file_format: str, one of 'npy', 'npz', 'hdf5' or 'arrow'
+    :param compression: str compression of the 'hdf5' datasets (e.g. 'gzip')
+        or the 'arrow' buffers (e.g. 'zstd', which prevents zero-copy reads)
+    """
+    file_format = file_format or get_format(path)
+    meta = _collection_meta(wfs)
+    shape = (len(wfs), len(POLARISATION), len(wfs[0].frequency))
+    if file_format == NPY:
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, FREQUENCY_FILE), wfs[0].frequency)
+        signal = np.lib.format.open_memmap(
+            os.path.join(path, SIGNAL_FILE), mode="w+", dtype=complex, shape=shape)
+        for i, wf in enumerate(wfs):
+            signal[i] = _stacked_signal(wf)
+        signal.flush()
+        with open(os.path.join(path, META_FILE), "w") as f:
+            json.dump(meta, f)
+    elif file_format == NPZ:
+        np.savez_compressed(
+            path, frequency=wfs[0].frequency, meta=np.array(json.dumps(meta)),
+            **{f"signal_{i}": _stacked_signal(wf) for i, wf in enumerate(wfs)}
+        )
+    elif file_format == HDF5:
+        import h5py
+        with h5py.File(path, "w") as f:
+            f.create_dataset("frequency", data=wfs[0].frequency)
+            signal = f.create_dataset(
+                "frequency_domain_signal", shape=shape, dtype=complex,
+                chunks=(1,) + shape[1:], compression=compression)
+            for i, wf in enumerate(wfs):
+                signal[i] = _stacked_signal(wf)
+            f.attrs["meta"] = json.dumps(meta)
+    elif file_format == ARROW:
+        import pyarrow as pa
+        values = pa.array(np.concatenate([_stacked_signal(wf).view(float).ravel() for wf in wfs]))
+        column = pa.FixedSizeListArray.from_arrays(values, 2 * shape[1] * shape[2])
+        meta["frequency_grid"] = _frequency_grid(wfs[0].frequency)
+        schema = pa.schema([("frequency_domain_signal", column.type)],
+                           metadata={COLLECTION_META_KEY: json.dumps(meta)})
+        options = pa.ipc.IpcWriteOptions(compression=compression)
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, schema, options=options) as writer:
+            writer.write_batch(pa.record_batch([column], schema=schema))
+    else:
+        raise ValueError(f"Unknown format {file_format}, choose from {[NPY, NPZ, HDF5, ARROW]}")
+
+
+class WaveformCollection:
+    def __init__(self, frequency, signals, meta, files=()):
+        """A lazily read collection of waveforms, see `open_waveforms`
+
+        Indexing returns a `Waveform.from_arrays` view of one waveform; only
+        that waveform's data is read (nothing is copied for memory maps).
+
+        :param frequency: ndarray of the shared frequencies
+        :param signals: object whose [i] is the (2, N) polarisations of waveform i
+        :param meta: dict of sampling_frequency, approximants and parameters
+        :param files: open file objects closed by `close`
+        """
+        self.frequency = frequency
+        self.signals = signals
+        self.sampling_frequency = meta["sampling_frequency"]
+        self.approximants = meta["approximants"]
+        self.parameters = meta["parameters"]
+        self._files = list(files)
+
+    def __len__(self):
+        return len(self.parameters)
+
+    def __getitem__(self, i):
+        if not -len(self) <= i < len(self):
+            raise IndexError(f"Waveform {i} is not in a collection of {len(self)}")
+        i = i % len(self)
+        return Waveform.from_arrays(
+            self.frequency, self.signals[i], sampling_frequency=self.sampling_frequency,
+            approximant=self.approximants[i], parameters=dict(self.parameters[i]))
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def close(self):
+        for f in self._files:
+            f.close()
+        self._files = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class _NpzSignals:
+    def __init__(self, npz):
+        self.npz = npz
+
+    def __getitem__(self, i):
+        return self.npz[f"signal_{i}"]
+
+
+class _ArrowSignals:
+    def __init__(self, column, length):
+        # zero-copy float views of the (memory-mapped) record batches
+        self.chunks = [c.flatten().to_numpy(zero_copy_only=True) for c in column.chunks]
+        self.starts = np.cumsum([0] + [len(c) for c in column.chunks])
+        self.length = length
+
+    def __getitem__(self, i):
+        chunk = np.searchsorted(self.starts, i, side="right") - 1
+        row_size = 2 * len(POLARISATION) * self.length
+        row = i - self.starts[chunk]
+        values = self.chunks[chunk][row * row_size:(row + 1) * row_size]
+        return values.view(complex).reshape(len(POLARISATION), self.length)
+
+
+def open_waveforms(path, file_format=None, mode="r"):
+    """Opens a collection written by `save_waveforms` without reading the waveforms
+
+    :param mode: memory map mode of the 'npy' arrays ('r', 'r+' or 'c')
+    :return: WaveformCollection
+    """
+    file_format = file_format or get_format(path)
+    if file_format == NPY:
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        return WaveformCollection(
+            np.load(os.path.join(path, FREQUENCY_FILE), mmap_mode=mode),
+            np.load(os.path.join(path, SIGNAL_FILE), mmap_mode=mode), meta)
+    if file_format == NPZ:
+        npz = np.load(path)
+        return WaveformCollection(npz["frequency"], _NpzSignals(npz),
+                                  json.loads(str(npz["meta"])), files=[npz])
+    if file_format == HDF5:
+        import h5py
+        f = h5py.File(path, "r")
+        return WaveformCollection(f["frequency"][()], f["frequency_domain_signal"],
+                                  json.loads(f.attrs["meta"]), files=[f])
+    if file_format == ARROW:
+        import pyarrow as pa
+        source = pa.memory_map(path, "r")
+        table = pa.ipc.open_file(source).read_all()
+        meta = json.loads(table.schema.metadata[COLLECTION_META_KEY.encode()])
+        frequency = np.linspace(*meta.pop("frequency_grid"))
+        return WaveformCollection(
+            frequency, _ArrowSignals(table.column("frequency_domain_signal"), len(frequency)),
+            meta, files=[source])
+    raise ValueError(f"Unknown format {file_format}, choose from {[NPY, NPZ, HDF5, ARROW]}")
@@ -0,0 +1,185 @@
+"""
+
+A file for a numpy frequency domain source model of the gw_waveform_overlapper
+package.
+
+The phase is the 3.5PN TaylorF2 phase with aligned spin-orbit (to 3.5PN) and
+spin-spin (2PN) terms, using the coefficients of LALSimInspiralTaylorF2 (the
+spin components along the orbital angular momentum are a_i cos(tilt_i)). The
+amplitude is either the leading order (Newtonian) inspiral amplitude, cut at
+the ISCO frequency, or the phenomenological inspiral-merger-ringdown
+amplitude of Ajith et al. 2008 (arXiv:0710.2335), cut at its f_cut.
+
+Every function is vectorised over parameter points, so a batch of M points
+gives (M, N) arrays without any LAL calls.
+
+"""
+
+import lal
+import numpy as np
+
+TAYLORF2 = "NumpyTaylorF2"
+TAYLORF2_PHENOM = "NumpyTaylorF2Phenom"
+APPROXIMANTS = {TAYLORF2: "newtonian", TAYLORF2_PHENOM: "phenom"}
+MIN_FREQ = 20
+
+# Ajith et al. 2008 Table I: f_k = (a η^2 + b η + c) / (π M)
+PHENOM_COEFFICIENTS = dict(
+    merger=(2.9740e-1, 4.4810e-2, 9.5560e-2),
+    ringdown=(5.9411e-1, 8.9794e-2, 1.9111e-1),
+    sigma=(5.0801e-1, 7.7515e-2, 2.2369e-2),
+    cut=(8.4845e-1, 1.2848e-1, 2.7299e-1),
+)
+
+
+def _as_batch(parameters):
+    """dict of params (floats or arrays) or list of dicts -> dict of 1-D arrays"""
+    if isinstance(parameters, (list, tuple)):
+        parameters = {k: [p[k] for p in parameters] for k in parameters[0]}
+    return {k: np.atleast_1d(np.asarray(v, dtype=float)) for k, v in parameters.items()}
+
+
+def _aligned_spins(parameters):
+    chis = []
+    for i in [1, 2]:
+        if f"chi_{i}" in parameters:
+            chis.append(parameters[f"chi_{i}"])
+        else:
+            a = parameters.get(f"a_{i}", 0)
+            chis.append(a * np.cos(parameters.get(f"tilt_{i}", 0)))
+    return chis
+
+
+def taylorf2_phase(frequency, mass_1, mass_2, chi_1, chi_2):
+    """
+    :param frequency: ndarray of N frequencies (must be > 0)
+    :param mass_1, mass_2, chi_1, chi_2: ndarrays of M detector frame masses
+        (in solar masses) and aligned spins
+    :return: ndarray (M, N) of the phase Ψ(f) for t_c = φ_c = 0
+    """
+    mass_1, mass_2, chi_1, chi_2 = (np.atleast_1d(x)[:, None]
+                                    for x in [mass_1, mass_2, chi_1, chi_2])
+    total_mass = mass_1 + mass_2
+    m1_m, m2_m = mass_1 / total_mass, mass_2 / total_mass
+    eta = m1_m * m2_m
+    v = np.cbrt(np.pi * total_mass * lal.MTSUN_SI * frequency)
+    log_v = np.log(v)
+    pi = np.pi
+
+    v2 = 5 * (743 / 84 + 11 * eta) / 9
+    v3 = -16 * pi
+    v4 = 5 * (3058.673 / 7.056 + 5429 / 7 * eta + 617 * eta ** 2) / 72
+    v5 = 5 / 9 * (7729 / 84 - 13 * eta) * pi
+    v5_log = 5 / 3 * (7729 / 84 - 13 * eta) * pi
+    v6 = (11583.231236531 / 4.694215680 - 640 / 3 * pi ** 2 - 6848 / 21 * np.euler_gamma
+          + eta * (-15737.765635 / 3.048192 + 2255 / 12 * pi ** 2)
+          + eta ** 2 * 76055 / 1728 - eta ** 3 * 127825 / 1296
+          - 6848 / 21 * np.log(4))
+    v6_log = -6848 / 21
+    v7 = pi * (77096675 / 254016 + 378515 / 1512 * eta - 74045 / 756 * eta ** 2)
+
+    for m, chi in [(m1_m, chi_1), (m2_m, chi_2)]:
+        v3 = v3 + m * (25 + 38 / 3 * m) * chi
+        v4 = v4 - 50.625 * m ** 2 * chi ** 2
+        so_5 = -m * (1391.5 / 8.4 - m * (1 - m) * 10 / 3 + m * (1276 / 8.1 + m * (1 - m) * 170 / 9))
+        v5 = v5 + so_5 * chi
+        v5_log = v5_log + 3 * so_5 * chi
+        v6 = v6 + pi * m * (1490 / 3 + m * 260) * chi
+        eta_i = m * (1 - m)
+        v7 = v7 + m * (-17097.8035 / 4.8384 + eta_i * 28764.25 / 6.72 + eta_i ** 2 * 47.35 / 1.44
+                       + m * (-7189.233785 / 1.524096 + eta_i * 458.555 / 3.024
+                              - eta_i ** 2 * 534.5 / 7.2)) * chi
+    v4 = v4 - 98.75 * eta * chi_1 * chi_2
+
+    series = (1 + v2 * v ** 2 + v3 * v ** 3 + v4 * v ** 4 + (v5 + v5_log * log_v) * v ** 5
+              + (v6 + v6_log * log_v) * v ** 6 + v7 * v ** 7)
+    return 3 / (128 * eta * v ** 5) * series - pi / 4
+
+
+def _phenom_frequencies(total_mass_in_seconds, eta):
+    return {
+        k: (a * eta ** 2 + b * eta + c) / (np.pi * total_mass_in_seconds)
+        for k, (a, b, c) in PHENOM_COEFFICIENTS.items()
+    }
+
+
+def taylorf2_amplitude(frequency, mass_1, mass_2, luminosity_distance, amplitude="newtonian"):
+    """
+    :param amplitude: 'newtonian' (inspiral only, cut at ISCO) or 'phenom'
+    :return: ndarray (M, N) of the amplitude |h(f)| for a face-on source
+    """
+    mass_1, mass_2, luminosity_distance = (np.atleast_1d(x)[:, None]
+                                           for x in [mass_1, mass_2, luminosity_distance])
+    total_mass = (mass_1 + mass_2) * lal.MTSUN_SI
+    eta = mass_1 * mass_2 / (mass_1 + mass_2) ** 2
+    chirp_mass = total_mass * eta ** (3 / 5)
+    distance = luminosity_distance * 1e6 * lal.PC_SI / lal.C_SI
+    newtonian = (np.sqrt(5 / 24) * np.pi ** (-2 / 3) * chirp_mass ** (5 / 6) / distance
+                 * frequency ** (-7 / 6))
+    if amplitude == "newtonian":
+        isco = 1 / (6 ** 1.5 * np.pi * total_mass)
+        return np.where(frequency <= isco, newtonian, 0)
+    if amplitude != "phenom":
+        raise ValueError(f"Unknown amplitude {amplitude}, choose from ['newtonian', 'phenom']")
+    f = _phenom_frequencies(total_mass, eta)
+    scale = newtonian * frequency ** (7 / 6) * f["merger"] ** (-7 / 6)
+    lorentzian = f["sigma"] / (2 * np.pi) / ((frequency - f["ringdown"]) ** 2 + f["sigma"] ** 2 / 4)
+    w = np.pi * f["sigma"] / 2 * (f["ringdown"] / f["merger"]) ** (-2 / 3)
+    shape = np.where(
+        frequency < f["merger"], (frequency / f["merger"]) ** (-7 / 6),
+        np.where(frequency < f["ringdown"], (frequency / f["merger"]) ** (-2 / 3),
+                 w * lorentzian)
+    )
+    return np.where(frequency < f["cut"], scale * shape, 0)
+
+
+def taylorf2_strain(frequency, parameters, minimum_frequency=MIN_FREQ,
+                    amplitude="newtonian"):
+    """Frequency domain polarisations for a batch of parameter points
+
+    :param frequency: ndarray of N frequencies
+    :param parameters: dict of params (floats or length M arrays) or list of
+        M param dicts, with mass_1, mass_2, luminosity_distance, theta_jn,
+        phase and the spins (a_i, tilt_i or chi_i)
+    :param minimum_frequency: float, the strain is zero below it
+    :param amplitude: 'newtonian' or 'phenom'
+    :return: dict of 'plus' and 'cross' ndarrays of shape (M, N)
+    """
+    parameters = _as_batch(parameters)
+    frequency = np.asarray(frequency, dtype=float)
+    mask = frequency >= max(minimum_frequency, 0)
+    mask &= frequency > 0
+    f = frequency[mask]
+    chi_1, chi_2 = _aligned_spins(parameters)
+    n_points = len(parameters["mass_1"])
+    chi_1, chi_2 = np.broadcast_to(chi_1, n_points), np.broadcast_to(chi_2, n_points)
+    psi = taylorf2_phase(f, parameters["mass_1"], parameters["mass_2"], chi_1, chi_2)
+    psi -= 2 * parameters.get("phase", np.zeros(n_points))[:, None]
+    h = taylorf2_amplitude(f, parameters["mass_1"], parameters["mass_2"],
+                           parameters["luminosity_distance"], amplitude) * np.exp(-1j * psi)
+    cos_iota = np.cos(parameters.get("theta_jn", np.zeros(n_points)))[:, None]
+    strain = {}
+    for key, factor in [("plus", 0.5 * (1 + cos_iota ** 2)), ("cross", -1j * cos_iota)]:
+        strain[key] = np.zeros((n_points, len(frequency)), dtype=complex)
+        strain[key][:, mask] = factor * h
+    return strain
+
+
+def taylorf2_binary_black_hole(frequency_array, mass_1, mass_2, luminosity_distance,
+                               a_1, tilt_1, phi_12, a_2, tilt_2, phi_jl, theta_jn,
+                               phase, **kwargs):
+    """A bilby `frequency_domain_source_model` with the signature of
+    `bilby.gw.source.lal_binary_black_hole`
+
+    The waveform_approximant ('NumpyTaylorF2' or 'NumpyTaylorF2Phenom') picks
+    the amplitude; precession angles (phi_12, phi_jl) are ignored.
+    """
+    strain = taylorf2_strain(
+        frequency_array,
+        dict(mass_1=mass_1, mass_2=mass_2, luminosity_distance=luminosity_distance,
+             a_1=a_1, tilt_1=tilt_1, a_2=a_2, tilt_2=tilt_2, theta_jn=theta_jn,
+             phase=phase),
+        minimum_frequency=kwargs.get("minimum_frequency", MIN_FREQ),
+        amplitude=APPROXIMANTS[kwargs.get("waveform_approximant", TAYLORF2)],
+    )
+    return {key: value[0] for key, value in strain.items()}
@@ -4,21 +4,36 @@ A file for generating waveforms and related objects for the pycentricity package
 
 """
 
+import hashlib
 from copy import deepcopy
 
 import bilby
 import bilby.gw.utils as gwutils
+import lal
 import matplotlib.pyplot as plt
 import numpy as np
 from bilby.gw.detector.strain_data import InterferometerStrainData
 from matplotlib.ticker import (AutoMinorLocator)
 
+from . import fft_engine, rendering, taylorf2
+
 STRAIN_LABEL = r'Strain [strain/$\sqrt{\rm Hz}$]'
 TIME_LABEL = r'Time (s)'
 FREQ_LABEL = r'Frequency [Hz]'
 POLARISATION = ['cross', 'plus']
 DEFAULT_SAMPLING_FREQ = 2048
 REF_FREQ = 50
+MIN_FREQ = 20
+AUTO = 'auto'
+MINIMUM_DURATION = 1
+POST_MERGER_DURATION = 0.5
+MINIMUM_SAMPLING_FREQ = 128
+MAXIMUM_SAMPLING_FREQ = 16384
+FINAL_SPIN = 0.95  # near-maximal remnant spin, errs towards high ringdown frequencies
+RINGDOWN_FACTOR = 1.5
+CUTOFF_MF = 0.2  # dimensionless frequency where IMRPhenom waveforms end
+TIME_XLIM = (1.5, 2.5)
+FREQ_XLIM = (10, 300)
 
 
 class Waveform:
@@ -37,51 +52,220 @@ class Waveform:
         self.frequency_domain_signal = None
         self.approximant = None
         self.parameters = None
-        self.strain = None
+        self._strain = None
         self.duration = None
-        self.min_fidx = None
-        self.max_fidx = None
         self.sampling_frequency = None
         self.reference_frequency = None
+        self._asd_cache = None
+        self._fingerprint = None
         self.reset(time, time_domain_signal, frequency, frequency_domain_signal,
                    approximant, parameters, sampling_frequency)
-        assert len(self.time) == len(self.time_domain_signal[
-                                         'cross']), f"{len(self.time)} {len(self.time_domain_signal['cross'])}"
+        if time_domain_signal is not None:
+            assert len(self.time) == len(time_domain_signal[
+                                             'cross']), f"{len(self.time)} {len(time_domain_signal['cross'])}"
 
     def reset(self, time, time_domain_signal, frequency, frequency_domain_signal,
               approximant, parameters, sampling_frequency):
         self.time = time
-        self.time_domain_signal = time_domain_signal
         self.frequency = frequency
         self.frequency_domain_signal = frequency_domain_signal
         self.approximant = approximant
         self.parameters = parameters
-        self.strain = InterferometerStrainData()
-        self.strain.set_from_frequency_domain_strain(
-            frequency_domain_strain=frequency_domain_signal['cross'],
-            frequency_array=frequency
-        )
+        self._strain = None
+        self._fingerprint = None
         self.duration = max(time)
-        self.min_fidx = np.where(self.frequency >= self.strain.minimum_frequency)[0][0]
-        self.max_fidx = np.where(self.frequency >= self.strain.maximum_frequency)[0][0]
         self.sampling_frequency = sampling_frequency
-        # update time domain signal
-        self.set_time_domain_signal_from_frequency()
+        # the time domain signal is rebuilt from the frequency domain when first used
+        self.time_domain_signal = None
+
+    @classmethod
+    def from_arrays(cls, frequency, frequency_domain_signal, sampling_frequency=None,
+                    duration=None, approximant=None, parameters=None,
+                    time_domain_signal=None):
+        """Wraps existing frequency domain arrays (e.g. memory maps) without copying them
+
+        Nothing is recomputed: the time domain signal and the bilby strain
+        data are only built if they are used.
+
+        :param frequency: ndarray of N frequencies
+        :param frequency_domain_signal: dict of 'cross' and 'plus' signal data,
+            or an ndarray (2, N) in `POLARISATION` order
+        :param sampling_frequency: float (defaults to twice the last frequency)
+        :param duration: float (defaults to 1 / the frequency spacing)
+        :param time_domain_signal: optional dict of 'cross' and 'plus' time domain data
+        """
+        frequency = np.asarray(frequency)
+        if not isinstance(frequency_domain_signal, dict):
+            frequency_domain_signal = {
+                p: np.asarray(frequency_domain_signal)[i] for i, p in enumerate(POLARISATION)}
+        if sampling_frequency is None:
+            sampling_frequency = 2 * float(frequency[-1])
+        if duration is None:
+            duration = 1 / float(frequency[1] - frequency[0])
+        wf = cls.__new__(cls)
+        wf.time = bilby.core.utils.create_time_series(sampling_frequency, duration)
+        wf._time_domain_signal = time_domain_signal
+        wf.frequency = frequency
+        wf.frequency_domain_signal = frequency_domain_signal
+        wf.approximant = approximant
+        wf.parameters = {} if parameters is None else parameters
+        wf._strain = None
+        wf.duration = wf.time[-1]  # as `reset`
+        wf.sampling_frequency = sampling_frequency
+        wf.reference_frequency = None
+        wf._asd_cache = None
+        wf._fingerprint = None
+        return wf
+
+    @classmethod
+    def from_buffer(cls, buffer, length, offset=0, **kwargs):
+        """Wraps a buffer holding the N frequencies (float64) followed by the
+        (2, N) polarisations (complex128, `POLARISATION` order), the layout of
+        `waveform_store` blocks, without copying it
+
+        :param buffer: object exposing the buffer interface (bytes, mmap,
+            shared memory ...)
+        :param length: int N, the number of frequencies
+        :param offset: int byte offset of the waveform in the buffer
+        :param kwargs: passed to `from_arrays`
+        """
+        frequency = np.frombuffer(buffer, dtype=float, count=length, offset=offset)
+        signal = np.frombuffer(buffer, dtype=complex, count=len(POLARISATION) * length,
+                               offset=offset + frequency.nbytes)
+        return cls.from_arrays(frequency, signal.reshape(len(POLARISATION), length), **kwargs)
+
+    @property
+    def time_domain_signal(self):
+        if self._time_domain_signal is None:
+            self.set_time_domain_signal_from_frequency()
+        return self._time_domain_signal
+
+    @time_domain_signal.setter
+    def time_domain_signal(self, value):
+        self._time_domain_signal = value
+
+    @property
+    def strain(self):
+        """bilby strain data of the cross polarisation, built on first use"""
+        if self._strain is None:
+            self._strain = InterferometerStrainData()
+            self._strain.set_from_frequency_domain_strain(
+                frequency_domain_strain=self.frequency_domain_signal['cross'],
+                frequency_array=self.frequency
+            )
+        return self._strain
+
+    @property
+    def fingerprint(self):
+        """Content hash of the frequency grid and frequency domain signal
+
+        Computed once and cleared by `reset`, `time_shift` and `phase_shift`
+        (the signal arrays must not be modified in place).
+        """
+        if self._fingerprint is None:
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(np.array([len(self.frequency), self.frequency[0], self.frequency[-1],
+                                    self.duration]).tobytes())
+            for key in POLARISATION:
+                digest.update(np.ascontiguousarray(self.frequency_domain_signal[key]).data)
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    @property
+    def min_fidx(self):
+        return np.where(self.frequency >= self.strain.minimum_frequency)[0][0]
+
+    @property
+    def max_fidx(self):
+        return np.where(self.frequency >= self.strain.maximum_frequency)[0][0]
 
     @classmethod
     def inject_signal(cls, injection_parameters, approximant='IMRPhenomPv2', duration=4,
                       sampling_frequency=DEFAULT_SAMPLING_FREQ,
-                      reference_frequency=REF_FREQ):
-        """Generates strain and time data for a set of injection parameters"""
+                      reference_frequency=REF_FREQ, minimum_frequency=MIN_FREQ):
+        """Generates strain and time data for a set of injection parameters
+
+        :param duration: float, or 'auto' to use `get_auto_duration`
+        :param sampling_frequency: float, or 'auto' to use `get_auto_sampling_frequency`
+        """
+        if duration == AUTO:
+            duration = get_auto_duration(injection_parameters, minimum_frequency)
+        if sampling_frequency == AUTO:
+            sampling_frequency = get_auto_sampling_frequency(injection_parameters)
         kwargs = create_injection(
             duration=duration,
             sampling_frequency=sampling_frequency,
             reference_frequency=reference_frequency,
             injection_parameters=injection_parameters,
-            approximant=approximant
+            approximant=approximant,
+            minimum_frequency=minimum_frequency
         )
         return cls(**kwargs)
 
+    @classmethod
+    def inject_signals(cls, injection_parameters_list, approximant='IMRPhenomPv2',
+                       duration=4, sampling_frequency=DEFAULT_SAMPLING_FREQ,
+                       reference_frequency=REF_FREQ, minimum_frequency=MIN_FREQ):
+        """Generates a waveform per set of injection parameters
+
+        The `taylorf2.APPROXIMANTS` are generated for the whole batch at once
+        as (M, N) arrays (with one batched inverse FFT for the time domain),
+        other approximants call `inject_signal` for each. An 'auto' duration or
+        sampling frequency is then the one of `get_common_grid` of the batch,
+        as the batch shares a frequency grid.
+        """
+        if approximant not in taylorf2.APPROXIMANTS:
+            return [
+                cls.inject_signal(
+                    p, approximant=approximant, duration=duration,
+                    sampling_frequency=sampling_frequency,
+                    reference_frequency=reference_frequency,
+                    minimum_frequency=minimum_frequency
+                )
+                for p in injection_parameters_list
+            ]
+        if AUTO in (duration, sampling_frequency):
+            common_duration, common_sampling_frequency = get_common_grid(
+                injection_parameters_list, minimum_frequency)
+            duration = common_duration if duration == AUTO else duration
+            sampling_frequency = (common_sampling_frequency if sampling_frequency == AUTO
+                                  else sampling_frequency)
+        frequency = bilby.core.utils.create_frequency_series(sampling_frequency, duration)
+        strain = taylorf2.taylorf2_strain(
+            frequency, list(injection_parameters_list),
+            minimum_frequency=minimum_frequency,
+            amplitude=taylorf2.APPROXIMANTS[approximant]
+        )
+        wfs = [
+            cls.from_arrays(frequency, {key: strain[key][i] for key in POLARISATION},
+                            sampling_frequency=sampling_frequency, duration=duration,
+                            approximant=approximant, parameters=p)
+            for i, p in enumerate(injection_parameters_list)
+        ]
+        compute_time_domain_signals(wfs)
+        return wfs
+
+    @classmethod
+    def inject_signals_on_common_grid(cls, injection_parameters_list,
+                                      approximant='IMRPhenomPv2',
+                                      reference_frequency=REF_FREQ,
+                                      minimum_frequency=MIN_FREQ):
+        """Generates waveforms on the smallest grid that fits all of them
+
+        :return: list of Waveforms sharing a duration and sampling frequency
+        """
+        duration, sampling_frequency = get_common_grid(
+            injection_parameters_list, minimum_frequency)
+        return [
+            cls.inject_signal(
+                p, approximant=approximant, duration=duration,
+                sampling_frequency=sampling_frequency,
+                reference_frequency=reference_frequency,
+                minimum_frequency=minimum_frequency
+            )
+            for p in injection_parameters_list
+        ]
+
     def time_shift(self, amount):
         # time shift
         shift_factor = -2j * np.pi * (self.duration + amount) * self.frequency
@@ -89,14 +273,15 @@ class Waveform:
             key: self.frequency_domain_signal[key] * np.exp(shift_factor)
             for key in POLARISATION
         }
-        self.set_time_domain_signal_from_frequency()
+        self._fingerprint = None
+        self.time_domain_signal = None
 
     def set_time_domain_signal_from_frequency(self):
-        self.time_domain_signal = {
-            key: bilby.core.utils.infft(
-                self.frequency_domain_signal[key], self.sampling_frequency)
-            for key in POLARISATION
-        }
+        """Both polarisations in one `fft_engine.infft` call"""
+        signal = fft_engine.infft(
+            np.stack([self.frequency_domain_signal[key] for key in POLARISATION]),
+            self.sampling_frequency)
+        self.time_domain_signal = dict(zip(POLARISATION, signal))
 
     def phase_shift(self, amount):
         # phase shift
@@ -104,9 +289,32 @@ class Waveform:
             key: self.frequency_domain_signal[key] * np.exp(-2j * amount)
             for key in POLARISATION
         }
-        self.set_time_domain_signal_from_frequency()
+        self._fingerprint = None
+        self.time_domain_signal = None
 
-    def plot_time_domain_data(self, ax=None, label=None, color=None):
+    def get_asd(self):
+        """ASD of the cross polarisation inside the strain frequency mask
+
+        Cached until the frequency domain signal is replaced (by `reset`,
+        `time_shift` or `phase_shift`).
+
+        :return: tuple of (frequency, asd) ndarrays
+        """
+        freq_data = self.frequency_domain_signal['cross']
+        if self._asd_cache is None or self._asd_cache[0] is not freq_data:
+            mask = self.strain.frequency_mask
+            asd = gwutils.asd_from_freq_series(
+                freq_data=freq_data, df=self.frequency[1] - self.frequency[0])
+            self._asd_cache = (freq_data, self.frequency[mask], asd[mask])
+        return self._asd_cache[1:]
+
+    def plot_time_domain_data(self, ax=None, label=None, color=None,
+                              max_points=rendering.MAX_POINTS, xlim=TIME_XLIM):
+        """Plots the cross polarisation, with its max moved to mid-duration
+
+        Only the samples inside xlim are drawn, downsampled to at most
+        max_points with `rendering.decimate`.
+        """
         if ax is None:
             fig, ax = plt.subplots()
         ax.xaxis.set_minor_locator(AutoMinorLocator())
@@ -117,15 +325,19 @@ class Waveform:
             label = self.approximant
 
         signal = self.time_domain_signal['cross']  # has max val at end
-        signal = np.roll(signal, shift=len(signal) // 2)  # move max val to mid
-        if color:
-            ax.plot(self.time, signal, label=label, color=color)
-        else:
-            ax.plot(self.time, signal, label=label)
-        ax.set_xlim(left=1.5, right=2.5)
+        n = len(signal)
+        start, stop = rendering.get_window(self.time, xlim)
+        # same as np.roll(signal, n // 2)[start:stop], moving the max val to mid
+        signal = signal[(np.arange(start, stop) - n // 2) % n]
+        time, signal = rendering.minmax_envelope(self.time[start:stop], signal, max_points)
+        kwargs = dict(label=label, color=color) if color else dict(label=label)
+        ax.plot(time, signal, **kwargs)
+        ax.set_xlim(left=xlim[0], right=xlim[1])
         return ax
 
-    def plot_frequency_domain_data(self, ax=None, label=None, color=None):
+    def plot_frequency_domain_data(self, ax=None, label=None, color=None,
+                                   max_points=rendering.MAX_POINTS, xlim=FREQ_XLIM):
+        """Plots the ASD of the cross polarisation (see `get_asd`)"""
         if ax is None:
             fig, ax = plt.subplots()
         ax.xaxis.set_minor_locator(AutoMinorLocator())
@@ -134,19 +346,10 @@ class Waveform:
         if label is None:
             label = self.approximant
 
-        freq_data = self.frequency_domain_signal['cross']
-        f = self.frequency
-        df = f[1] - f[0]
-
-        asd = gwutils.asd_from_freq_series(
-            freq_data=freq_data, df=df)
-        if color:
-            ax.loglog(self.strain.frequency_array[self.strain.frequency_mask],
-                      asd[self.strain.frequency_mask], label=label, color=color)
-        else:
-            ax.loglog(self.strain.frequency_array[self.strain.frequency_mask],
-                      asd[self.strain.frequency_mask], label=label)
-        ax.set_xlim(left=10, right=300)
+        frequency, asd = rendering.decimate(*self.get_asd(), max_points, xlim=xlim)
+        kwargs = dict(label=label, color=color) if color else dict(label=label)
+        ax.loglog(frequency, asd, **kwargs)
+        ax.set_xlim(left=xlim[0], right=xlim[1])
         return ax
 
     def __deepcopy__(self, memodict={}):
@@ -157,14 +360,37 @@ class Waveform:
         return result
 
 
+def compute_time_domain_signals(waveform_objects):
+    """Sets the missing time domain signals of waveforms with batched transforms
+
+    Waveforms sharing a frequency grid are transformed together in one
+    `fft_engine.infft` call of shape (M, 2, N).
+    """
+    groups = {}
+    for wf in waveform_objects:
+        if wf._time_domain_signal is None:
+            key = (len(wf.frequency), float(wf.sampling_frequency))
+            groups.setdefault(key, []).append(wf)
+    for (_, sampling_frequency), wfs in groups.items():
+        signals = fft_engine.infft(np.array([
+            [wf.frequency_domain_signal[key] for key in POLARISATION] for wf in wfs
+        ]), sampling_frequency)
+        for wf, signal in zip(wfs, signals):
+            wf.time_domain_signal = dict(zip(POLARISATION, signal))
+
+
 def plot_multiple_waveform_objects(waveform_objects, freq_domain=False,
-                                   filename=None):
-    if freq_domain:
-        fig, axes = plt.subplots(2, 1)
-        time_ax = axes[0]
-        freq_ax = axes[1]
+                                   filename=None, figure_name=None):
+    """
+    :param figure_name: str, reuse (and clear) the figure of this name from
+        earlier calls instead of creating a new one
+    """
+    nrows = 2 if freq_domain else 1
+    if figure_name is None:
+        fig, axes = plt.subplots(nrows, 1)
     else:
-        fig, time_ax = plt.subplots()
+        fig, axes = rendering.get_figure(figure_name, nrows, 1)
+    time_ax, freq_ax = (axes[0], axes[1]) if freq_domain else (axes, None)
 
     for i, wf in enumerate(waveform_objects):
         time_ax = wf.plot_time_domain_data(time_ax, label=f"Waveform {i}")
@@ -182,16 +408,80 @@ def plot_multiple_waveform_objects(waveform_objects, freq_domain=False,
         return axes
 
 
+def _get_masses_and_spin(injection_parameters):
+    params, _ = bilby.gw.conversion.convert_to_lal_binary_black_hole_parameters(
+        dict(injection_parameters))
+    mass_1, mass_2 = params['mass_1'], params['mass_2']
+    chi = ((mass_1 * params.get('a_1', 0) * np.cos(params.get('tilt_1', 0)) +
+            mass_2 * params.get('a_2', 0) * np.cos(params.get('tilt_2', 0)))
+           / (mass_1 + mass_2))
+    return mass_1, mass_2, chi
+
+
+def _next_power_of_two(x):
+    return 2 ** int(np.ceil(np.log2(x)))
+
+
+def get_auto_duration(injection_parameters, minimum_frequency=MIN_FREQ):
+    """Smallest power-of-two duration holding the signal above `minimum_frequency`
+
+    Uses the chirp time from `minimum_frequency` to merger plus
+    `POST_MERGER_DURATION` for the ringdown.
+    """
+    mass_1, mass_2, chi = _get_masses_and_spin(injection_parameters)
+    chirp_time = gwutils.calculate_time_to_merger(
+        minimum_frequency, mass_1, mass_2, chi=chi)
+    duration = max(chirp_time, 0) + POST_MERGER_DURATION
+    return max(_next_power_of_two(duration), MINIMUM_DURATION)
+
+
+def get_auto_sampling_frequency(injection_parameters):
+    """Smallest power-of-two sampling frequency resolving the signal
+
+    The highest frequency is the smaller of `RINGDOWN_FACTOR` times the
+    fundamental ringdown frequency (Berti et al. 2006 fit for a `FINAL_SPIN`
+    remnant of the total mass) and the `CUTOFF_MF` cut-off frequency.
+    """
+    mass_1, mass_2, _ = _get_masses_and_spin(injection_parameters)
+    total_mass_in_seconds = (mass_1 + mass_2) * lal.MTSUN_SI
+    ringdown_mf = (1.5251 - 1.1568 * (1 - FINAL_SPIN) ** 0.1292) / (2 * np.pi)
+    maximum_frequency = min(RINGDOWN_FACTOR * ringdown_mf, CUTOFF_MF) / total_mass_in_seconds
+    sampling_frequency = _next_power_of_two(2 * maximum_frequency)
+    return int(np.clip(sampling_frequency, MINIMUM_SAMPLING_FREQ, MAXIMUM_SAMPLING_FREQ))
+
+
+def get_common_grid(injection_parameters_list, minimum_frequency=MIN_FREQ):
+    """
+    :return: (duration, sampling_frequency) large enough for every parameter set
+    """
+    duration = max(get_auto_duration(p, minimum_frequency)
+                   for p in injection_parameters_list)
+    sampling_frequency = max(get_auto_sampling_frequency(p)
+                             for p in injection_parameters_list)
+    return duration, sampling_frequency
+
+
+def get_source_model(approximant):
+    """
+    :return: the native numpy source model for the `taylorf2.APPROXIMANTS`,
+        else `bilby.gw.source.lal_binary_black_hole`
+    """
+    if approximant in taylorf2.APPROXIMANTS:
+        return taylorf2.taylorf2_binary_black_hole
+    return bilby.gw.source.lal_binary_black_hole
+
+
 def create_injection(duration, sampling_frequency, injection_parameters,
-                     reference_frequency, approximant):
+                     reference_frequency, approximant, minimum_frequency=MIN_FREQ):
     generator_args = dict(
         duration=duration,
         sampling_frequency=sampling_frequency,
-        frequency_domain_source_model=bilby.gw.source.lal_binary_black_hole,
+        frequency_domain_source_model=get_source_model(approximant),
         parameters=injection_parameters,
         waveform_arguments=dict(
             reference_frequency=reference_frequency,
-            waveform_approximant=approximant
+            waveform_approximant=approximant,
+            minimum_frequency=minimum_frequency
         )
     )
 
@@ -0,0 +1,173 @@
+"""
+
+A file for sharing waveforms with worker processes for the
+gw_waveform_overlapper package.
+
+The parent process writes the frequency series of each waveform once into
+shared memory (or a memory-mapped file) and gets back a small
+`WaveformHandle`. Tasks are sent handles instead of `Waveform` objects and
+attach zero-copy numpy views, so the data sent to each worker does not grow
+with the size of the waveforms.
+
+    with WaveformStore() as store:
+        handles = [store.add(wf) for wf in waveforms]
+        overlaps = calculate_multiple_overlaps_from_handles(
+            handles[:-1], handles[1:], executor="process")
+
+"""
+
+import os
+import tempfile
+import uuid
+from collections import namedtuple
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from . import storage
+from .executors import executor_scope
+from .overlap_computer import combine_polarisations, compute_overlap, \
+    fft_maximised_overlaps, get_weights
+from .waveform import POLARISATION
+
+SHARED_MEMORY = "shm"
+MEMMAP = "mmap"
+
+WaveformHandle = namedtuple(
+    "WaveformHandle", ["name", "backend", "length", "duration", "sampling_frequency"])
+
+_created_blocks = set()  # shared memory blocks created by this process
+_attached_blocks = {}  # shared memory blocks attached by this process
+
+
+class WaveformStore:
+    def __init__(self, backend=SHARED_MEMORY, directory=None):
+        """
+
+        :param backend: 'shm' for `multiprocessing.shared_memory` blocks or
+            'mmap' for memory-mapped files (which also work across nodes
+            sharing a filesystem)
+        :param directory: str directory of the 'mmap' files (defaults to a
+            temporary directory)
+        """
+        if backend not in [SHARED_MEMORY, MEMMAP]:
+            raise ValueError(f"Unknown backend {backend}, choose from {[SHARED_MEMORY, MEMMAP]}")
+        self.backend = backend
+        self.directory = directory
+        if backend == MEMMAP and directory is None:
+            self._tmpdir = tempfile.TemporaryDirectory(prefix="waveform_store_")
+            self.directory = self._tmpdir.name
+        self._blocks = []
+        self.handles = []
+
+    def add(self, wf):
+        """Copies the frequency series of `wf` into the store
+
+        :param wf: Waveform (or MemmapWaveform)
+        :return: WaveformHandle
+        """
+        length = len(wf.frequency)
+        if self.backend == SHARED_MEMORY:
+            block = shared_memory.SharedMemory(create=True, size=_block_size(length))
+            _created_blocks.add(block.name)
+            self._blocks.append(block)
+            frequency, signal = _get_views(block.buf, length)
+            frequency[:] = wf.frequency
+            for i, p in enumerate(POLARISATION):
+                signal[i] = wf.frequency_domain_signal[p]
+            name = block.name
+        else:
+            name = os.path.join(self.directory, uuid.uuid4().hex)
+            storage.save_waveform(wf, name)
+        handle = WaveformHandle(
+            name=name, backend=self.backend, length=length,
+            duration=float(wf.duration), sampling_frequency=float(wf.sampling_frequency)
+        )
+        self.handles.append(handle)
+        return handle
+
+    def close(self):
+        """Releases every waveform of the store"""
+        for block in self._blocks:
+            _attached_blocks.pop(block.name, None)
+            _created_blocks.discard(block.name)
+            block.close()
+            block.unlink()
+        self._blocks = []
+        if self.backend == MEMMAP and hasattr(self, "_tmpdir"):
+            self._tmpdir.cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _block_size(length):
+    return length * (np.dtype(float).itemsize + len(POLARISATION) * np.dtype(complex).itemsize)
+
+
+def _get_views(buffer, length):
+    frequency = np.ndarray((length,), dtype=float, buffer=buffer)
+    signal = np.ndarray((len(POLARISATION), length), dtype=complex, buffer=buffer,
+                        offset=frequency.nbytes)
+    return frequency, signal
+
+
+def attach(handle: WaveformHandle):
+    """Opens the waveform of a handle as zero-copy views of the store
+
+    :return: storage.MemmapWaveform (frequency domain only, read-only)
+    """
+    if handle.backend == MEMMAP:
+        return storage.open_waveform(handle.name)
+    if handle.name not in _attached_blocks:
+        block = shared_memory.SharedMemory(name=handle.name)
+        if handle.name not in _created_blocks:
+            # the creating process owns (and unlinks) the block
+            resource_tracker.unregister(block._name, "shared_memory")
+        _attached_blocks[handle.name] = block
+    frequency, signal = _get_views(_attached_blocks[handle.name].buf, handle.length)
+    frequency.flags.writeable = False
+    signal.flags.writeable = False
+    return storage.MemmapWaveform(
+        frequency=frequency,
+        frequency_domain_signal={p: signal[i] for i, p in enumerate(POLARISATION)},
+        duration=handle.duration,
+        sampling_frequency=handle.sampling_frequency,
+        approximant=None,
+        parameters={}
+    )
+
+
+def compute_overlap_from_handles(handle1, handle2, psd=None):
+    return compute_overlap(attach(handle1), attach(handle2), psd)
+
+
+def fft_overlap_from_handles(handle1, handle2, psd=None):
+    """Time and phase maximised overlap of two stored waveforms
+
+    Like `overlap_optimizer.fft_overlap_optimizer`, z(t) is evaluated on every
+    sample time with one inverse FFT (see `overlap_computer.fft_maximised_overlaps`),
+    but the overlap is read off the filter instead of regenerating the shifted waveform.
+
+    :return: tuple of (time, phase, overlap)
+    """
+    wf1, wf2 = attach(handle1), attach(handle2)
+    overlap, time, phase = fft_maximised_overlaps(
+        combine_polarisations(wf1), combine_polarisations(wf2),
+        get_weights(psd, wf1.frequency), wf1.sampling_frequency)
+    return float(time), float(phase), float(overlap)
+
+
+def calculate_multiple_overlaps_from_handles(h1s, h2s, psd=None, executor=None):
+    """`multiple_overlaps.calculate_multiple_overlaps` for stored waveforms"""
+    with executor_scope(executor) as pool:
+        return pool.map(compute_overlap_from_handles, h1s, h2s, [psd] * len(h1s))
+
+
+def calculate_multiple_fft_overlaps_from_handles(h1s, h2s, psd=None, executor=None):
+    """`fft_overlap_from_handles` for each (h1, h2) pair"""
+    with executor_scope(executor) as pool:
+        return pool.map(fft_overlap_from_handles, h1s, h2s, [psd] * len(h1s))
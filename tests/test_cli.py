@@ -0,0 +1,131 @@
+import json
+import os
+import shutil
+import unittest
+
+import numpy as np
+
+from gw_waveform_overlapper import cli
+from gw_waveform_overlapper.overlap_computer import combine_polarisations, compute_overlap, \
+    fft_maximised_overlaps, get_weights
+from gw_waveform_overlapper.waveform import Waveform
+
+
+class CLITest(unittest.TestCase):
+
+    def setUp(self):
+        self.params = dict(
+            mass_1=141.0741,
+            mass_2=113.0013,
+            a_1=0.9434,
+            a_2=0.2173,
+            tilt_1=0,
+            tilt_2=0,
+            phi_jl=0,
+            phi_12=0,
+            luminosity_distance=1782.1610,
+            theta_jn=0.9614,
+            psi=1.6831,
+            phase=5.2220,
+            geocent_time=0,
+            ra=0.9978,
+            dec=-0.4476
+        )
+        self.outdir = "tests/cli_test"
+        os.makedirs(self.outdir, exist_ok=True)
+        self.config_file = os.path.join(self.outdir, "study.json")
+        config = dict(
+            label="test",
+            outdir=self.outdir,
+            parameters=self.params,
+            grid=dict(mass_2=dict(start=20, stop=100, num=3), a_2=[0, 0.5]),
+            waveform_2=dict(a_1=0.5),
+            checkpoint_interval=2,
+        )
+        with open(self.config_file, "w") as f:
+            json.dump(config, f)
+
+    def tearDown(self):
+        if os.path.exists(self.outdir):
+            shutil.rmtree(self.outdir)
+
+    def test_study_points(self):
+        points = cli.get_study_points(cli.load_config(self.config_file))
+        self.assertEqual(len(points), 6)
+        self.assertEqual(points[1], dict(mass_2=20, a_2=0.5))
+
+    def test_prior_points_are_reproducible(self):
+        prior_file = os.path.join(self.outdir, "study.prior")
+        with open(prior_file, "w") as f:
+            f.write("mass_2 = Uniform(minimum=20, maximum=40, name='mass_2')\n"
+                    "a_2 = Uniform(minimum=0, maximum=0.8, name='a_2')\n")
+        config = dict(cli.DEFAULT_CONFIG, prior=dict(file=prior_file, n_samples=5, seed=3))
+        points = cli.get_study_points(config)
+        np.random.seed(1)
+        self.assertEqual(cli.get_study_points(config), points)
+        self.assertEqual(len(points), 5)
+        config["prior"]["seed"] = 4
+        self.assertNotEqual(cli.get_study_points(config), points)
+
+    def test_sharded_run_and_merge(self):
+        for shard in range(3):
+            cli.main(["run", self.config_file, "--shard", str(shard), "--n-shards", "3"])
+        cli.main(["merge", self.config_file])
+        config = cli.load_config(self.config_file)
+        with np.load(cli.get_result_filename(config)) as result:
+            np.testing.assert_array_equal(result["index"], np.arange(6))
+            np.testing.assert_array_equal(result["mass_2"], [20, 20, 60, 60, 100, 100])
+            params = dict(self.params, mass_2=60, a_2=0.5)
+            expected = compute_overlap(
+                Waveform.inject_signal(params),
+                Waveform.inject_signal(dict(params, a_1=0.5))
+            )
+            self.assertAlmostEqual(result["overlap"][3], expected)
+
+    def test_merge_ignores_stale_shards(self):
+        config = cli.load_config(self.config_file)
+        for shard in range(2):
+            cli.run_shard(config, shard, 2)
+        stale = cli.run_shard(config, 0, 3)
+        stale["overlap"][:] = -1
+        cli._save_columns(cli.get_shard_filename(config, 0, 3), stale)
+        with self.assertRaises(ValueError):
+            cli.merge_shards(config)
+        cli.main(["merge", self.config_file, "--n-shards", "2"])
+        with np.load(cli.get_result_filename(config)) as result:
+            np.testing.assert_array_equal(result["index"], np.arange(6))
+            self.assertNotIn(-1, result["overlap"])
+
+    def test_fft_optimizer(self):
+        psd = [[20, 60, 200, 1024], [1e-46, 1e-47, 1e-46, 1e-44]]
+        config = dict(cli.load_config(self.config_file), optimizer="fft", psd=psd, duration=8,
+                      sampling_frequency=1024, approximant=["IMRPhenomPv2", "IMRPhenomXP"])
+        point = dict(mass_2=60, a_2=0.5)
+        result = cli.evaluate_point(config, point)
+        params = dict(self.params, **point)
+        wfs = [Waveform.inject_signal(p, approximant=approximant, duration=8,
+                                      sampling_frequency=1024)
+               for p, approximant in zip([params, dict(params, a_1=0.5)],
+                                         config["approximant"])]
+        overlap, time, phase = fft_maximised_overlaps(
+            *[combine_polarisations(wf) for wf in wfs],
+            get_weights(psd, wfs[0].frequency), 1024)
+        self.assertAlmostEqual(result["overlap"], overlap)
+        self.assertAlmostEqual(result["time_shift"], time)
+        self.assertAlmostEqual(result["phase_shift"], phase)
+        self.assertGreaterEqual(result["overlap"], compute_overlap(*wfs, psd=psd))
+        self.assertNotAlmostEqual(
+            result["overlap"], cli.evaluate_point(dict(config, psd=None), point)["overlap"],
+            places=6)
+
+    def test_resume_from_checkpoint(self):
+        config = cli.load_config(self.config_file)
+        columns = cli.run_shard(config, 0, 2)
+        columns["overlap"][:] = -1
+        cli._save_columns(cli.get_shard_filename(config, 0, 2), columns)
+        resumed = cli.run_shard(config, 0, 2)
+        np.testing.assert_array_equal(resumed["overlap"], -1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+
+import numpy as np
+
+from gw_waveform_overlapper.executors import get_executor, TaskFailure, \
+    SerialExecutor, ProcessExecutor, PoolExecutor
+from gw_waveform_overlapper.multiple_overlaps import calculate_multiple_overlaps
+from gw_waveform_overlapper.waveform import Waveform
+
+
+def invert(x):
+    return 1 / x
+
+
+class ExecutorsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.params = dict(
+            mass_1=141.0741,
+            mass_2=113.0013,
+            a_1=0.9434,
+            a_2=0.2173,
+            tilt_1=0,
+            tilt_2=0,
+            phi_jl=0,
+            phi_12=0,
+            luminosity_distance=1782.1610,
+            theta_jn=0.9614,
+            psi=1.6831,
+            phase=5.2220,
+            geocent_time=0,
+            ra=0.9978,
+            dec=-0.4476
+        )
+        self.params2 = self.params.copy()
+        self.params2.update(dict(mass_2=20))
+        self.wf1 = Waveform.inject_signal(self.params)
+        self.wf2 = Waveform.inject_signal(self.params2)
+
+    def test_get_executor(self):
+        self.assertIsInstance(get_executor(), SerialExecutor)
+        executor = get_executor(dict(backend="process", max_workers=2))
+        self.assertIsInstance(executor, ProcessExecutor)
+        self.assertIs(get_executor(executor), executor)
+        with self.assertRaises(ValueError):
+            get_executor("gpu")
+        with self.assertRaises(TypeError):
+            PoolExecutor()  # abstract, the backends provide the pool
+
+    def test_process_start_method(self):
+        with get_executor(dict(backend="process", max_workers=1)) as executor:
+            self.assertNotEqual(executor.start_method, "fork")
+            self.assertEqual(executor.map(invert, [2]), [0.5])
+            self.assertEqual(executor.pool._mp_context.get_start_method(), executor.start_method)
+        executor = get_executor(dict(backend="process", start_method="spawn"))
+        self.assertEqual(executor.start_method, "spawn")
+
+    def test_ordering(self):
+        values = list(range(1, 50))
+        for backend in ["serial", "thread", "process"]:
+            with get_executor(dict(backend=backend, max_workers=2, chunksize=3)) as pool:
+                self.assertEqual(pool.map(invert, values), [1 / v for v in values])
+
+    def test_failure_capture(self):
+        for backend in ["serial", "thread", "process"]:
+            with get_executor(dict(backend=backend, capture_failures=True)) as pool:
+                results = pool.map(invert, [1, 0, 2])
+            self.assertEqual(results[0], 1)
+            self.assertIsInstance(results[1], TaskFailure)
+            self.assertIsInstance(results[1].exception, ZeroDivisionError)
+            self.assertEqual(results[1].index, 1)
+            self.assertEqual(results[2], 0.5)
+            with get_executor(backend) as pool, self.assertRaises(ZeroDivisionError):
+                pool.map(invert, [1, 0, 2])
+
+    def test_parallel_overlaps(self):
+        w1s, w2s = [self.wf1, self.wf1, self.wf2], [self.wf1, self.wf2, self.wf2]
+        np.testing.assert_allclose(
+            calculate_multiple_overlaps(w1s, w2s, executor="process"),
+            calculate_multiple_overlaps(w1s, w2s)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
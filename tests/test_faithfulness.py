@@ -0,0 +1,57 @@
+import unittest
+
+import numpy as np
+
+from gw_waveform_overlapper.cache import WaveformCache
+from gw_waveform_overlapper.faithfulness import faithfulness_survey, rank_worst_cases, \
+    format_table, get_pair_label, MIN_COLUMN
+from gw_waveform_overlapper.taylorf2 import TAYLORF2, TAYLORF2_PHENOM
+
+
+class FaithfulnessTest(unittest.TestCase):
+
+    def setUp(self):
+        self.params = dict(
+            mass_1=36,
+            mass_2=29,
+            a_1=0.4,
+            a_2=0,
+            tilt_1=0.5,
+            tilt_2=1,
+            phi_12=1.7,
+            phi_jl=0.3,
+            luminosity_distance=400,
+            dec=-1.2208,
+            ra=1.375,
+            theta_jn=0.4,
+            psi=2.659,
+            phase=1.3,
+            geocent_time=0,
+        )
+        self.points = [dict(self.params, mass_1=m) for m in [10, 20, 30, 40]]
+        self.approximants = [TAYLORF2, TAYLORF2_PHENOM]
+
+    def test_survey(self):
+        table = faithfulness_survey(self.points, self.approximants,
+                                    reference=TAYLORF2)
+        column = get_pair_label(TAYLORF2, TAYLORF2_PHENOM)
+        self.assertEqual(len(table[column]), len(self.points))
+        np.testing.assert_array_equal(table[column], table[MIN_COLUMN])
+        self.assertTrue(np.all(table[column] < 1))
+        # the ISCO cut of TaylorF2 matters less for lighter binaries
+        self.assertTrue(np.all(np.diff(table[column]) < 0))
+
+        worst = rank_worst_cases(table, n=2)
+        self.assertEqual([row['mass_1'] for row in worst], [40, 30])
+        self.assertIn(column, format_table(worst, ['mass_1', column]))
+
+    def test_cache(self):
+        cache = WaveformCache()
+        faithfulness_survey(self.points, self.approximants, cache=cache, executor="thread")
+        self.assertEqual(cache.stats['misses'], 8)
+        faithfulness_survey(self.points[:2], self.approximants, cache=cache)
+        self.assertEqual(cache.stats['hits'], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
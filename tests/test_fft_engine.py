@@ -0,0 +1,91 @@
+import unittest
+
+import bilby
+import numpy as np
+
+from gw_waveform_overlapper import fft_engine
+from gw_waveform_overlapper.taylorf2 import TAYLORF2
+from gw_waveform_overlapper.waveform import Waveform, compute_time_domain_signals, \
+    POLARISATION
+
+
+class FFTEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.params = dict(
+            mass_1=36,
+            mass_2=29,
+            a_1=0.4,
+            a_2=0,
+            tilt_1=0.5,
+            tilt_2=1,
+            phi_12=1.7,
+            phi_jl=0.3,
+            luminosity_distance=400,
+            dec=-1.2208,
+            ra=1.375,
+            theta_jn=0.4,
+            psi=2.659,
+            phase=1.3,
+            geocent_time=0,
+        )
+        rng = np.random.default_rng(0)
+        self.x = rng.normal(size=(3, 2, 1025)) + 1j * rng.normal(size=(3, 2, 1025))
+
+    def test_engines(self):
+        self.assertIn("scipy", fft_engine.available_engines())
+        for name in fft_engine.available_engines():
+            with fft_engine.use_engine(name, workers=2) as engine:
+                self.assertEqual(engine.name, name)
+                np.testing.assert_allclose(fft_engine.infft(self.x, 2048),
+                                           np.fft.irfft(self.x) * 2048)
+                np.testing.assert_allclose(fft_engine.ifft(self.x, n=3000),
+                                           np.fft.ifft(self.x, n=3000))
+                out = np.empty((3, 2, 2048))
+                self.assertIs(engine.irfft(self.x, out=out), out)
+                np.testing.assert_allclose(out, np.fft.irfft(self.x))
+        with self.assertRaises(ValueError):
+            fft_engine.set_engine("fftpack")
+        with self.assertRaises(TypeError):
+            fft_engine.FFTEngine()
+
+    def test_pyfftw_plan_reuse(self):
+        if "pyfftw" not in fft_engine.available_engines():
+            self.skipTest("pyfftw is not installed")
+        engine = fft_engine.PyFFTWEngine()
+        first = engine.irfft(self.x)
+        plan = engine.get_plan("irfft", self.x.shape, self.x.dtype)
+        second = engine.irfft(2 * self.x)
+        self.assertIs(engine.get_plan("irfft", self.x.shape, self.x.dtype), plan)
+        self.assertEqual(len(engine.plans), 1)
+        np.testing.assert_allclose(second, 2 * first)
+
+    def test_waveform_time_domain(self):
+        wf = Waveform.inject_signal(self.params)
+        self.assertIsNone(wf._time_domain_signal)  # built when first used
+        for key in POLARISATION:
+            np.testing.assert_allclose(
+                wf.time_domain_signal[key],
+                bilby.core.utils.infft(wf.frequency_domain_signal[key], wf.sampling_frequency))
+        wf.phase_shift(0.5)
+        self.assertIsNone(wf._time_domain_signal)
+        np.testing.assert_allclose(
+            wf.time_domain_signal['plus'],
+            bilby.core.utils.infft(wf.frequency_domain_signal['plus'], wf.sampling_frequency))
+
+    def test_batched_time_domain(self):
+        points = [dict(self.params, mass_1=m) for m in [30, 35, 40]]
+        wfs = Waveform.inject_signals(points, approximant=TAYLORF2)
+        lazy = [Waveform.from_arrays(wf.frequency, wf.frequency_domain_signal) for wf in wfs]
+        compute_time_domain_signals(lazy)
+        for wf, expected in zip(lazy, wfs):
+            self.assertIsNotNone(wf._time_domain_signal)
+            np.testing.assert_allclose(wf.time_domain_signal['plus'],
+                                       expected.time_domain_signal['plus'])
+            np.testing.assert_allclose(
+                wf.time_domain_signal['cross'],
+                bilby.core.utils.infft(wf.frequency_domain_signal['cross'], 2048))
+
+
+if __name__ == '__main__':
+    unittest.main()
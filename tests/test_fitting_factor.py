@@ -0,0 +1,113 @@
+import unittest
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from gw_waveform_overlapper.cache import LRUCache
+from gw_waveform_overlapper.fitting_factor import FittingFactorSearch
+from gw_waveform_overlapper.overlap_computer import combine_polarisations, \
+    complex_filter, fft_maximised_overlaps, inner_product, get_zero_noise_psd
+from gw_waveform_overlapper.psd import interpolate_psd
+from gw_waveform_overlapper.taylorf2 import TAYLORF2_PHENOM
+from gw_waveform_overlapper.waveform import Waveform
+
+
+class FittingFactorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.params = dict(
+            mass_1=36,
+            mass_2=29,
+            a_1=0.4,
+            a_2=0,
+            tilt_1=0.5,
+            tilt_2=1,
+            phi_12=1.7,
+            phi_jl=0.3,
+            luminosity_distance=400,
+            dec=-1.2208,
+            ra=1.375,
+            theta_jn=0.4,
+            psi=2.659,
+            phase=1.3,
+            geocent_time=0,
+        )
+        self.bank_parameters = [
+            dict(self.params, mass_1=m1, mass_2=m2)
+            for m1 in [25, 35, 45] for m2 in [20, 30] if m2 <= m1
+        ]
+        self.search = FittingFactorSearch(self.bank_parameters, keys=['mass_1', 'mass_2'],
+                                          top_k=2, approximant=TAYLORF2_PHENOM)
+
+    def test_fft_maximised_overlaps(self):
+        wf1 = Waveform.inject_signal(self.params, approximant=TAYLORF2_PHENOM)
+        wf2 = Waveform.inject_signal(dict(self.params, mass_1=37), approximant=TAYLORF2_PHENOM)
+        weights = 1 / interpolate_psd(get_zero_noise_psd(), wf1.frequency)
+        overlap, time, phase = fft_maximised_overlaps(
+            combine_polarisations(wf1), combine_polarisations(wf2), weights,
+            wf1.sampling_frequency)
+        z = complex_filter(time, wf1, wf2)
+        norm = np.sqrt(inner_product(wf1, wf1).real * inner_product(wf2, wf2).real)
+        self.assertAlmostEqual(overlap, np.abs(z) / norm)
+        self.assertAlmostEqual(phase, np.mod(np.angle(z), 2 * np.pi))
+        self.assertLess(overlap, 1)
+
+    def test_coarse_search(self):
+        overlaps, _, _ = self.search.coarse_search(self.bank_parameters[2])
+        self.assertEqual(len(overlaps), len(self.bank_parameters))
+        self.assertEqual(np.argmax(overlaps), 2)
+        self.assertAlmostEqual(overlaps[2], 1)
+
+    def test_search(self):
+        result = self.search.search(dict(self.params, mass_1=40, mass_2=24))
+        self.assertLess(result['coarse_fitting_factor'], 0.9)
+        self.assertGreater(result['fitting_factor'], 0.99)
+        self.assertGreater(self.search.cache.stats['size'], 0)
+
+    def test_signal_generated_once(self):
+        signal = dict(self.params, mass_1=40, mass_2=24)
+        h = combine_polarisations(Waveform.inject_signal(signal, approximant=TAYLORF2_PHENOM))
+        for expected, result in zip(self.search.coarse_search(signal),
+                                    self.search.coarse_search(h)):
+            np.testing.assert_array_equal(expected, result)
+        with mock.patch.object(Waveform, "inject_signal",
+                               side_effect=Waveform.inject_signal) as inject_signal:
+            self.search.search(signal)
+        self.assertEqual(sum(call.args[0] == signal for call in inject_signal.call_args_list), 1)
+
+    def test_search_many(self):
+        signals = [self.bank_parameters[0], self.bank_parameters[-1]]
+        results = self.search.search_many(signals, executor="thread")
+        for result, signal in zip(results, signals):
+            self.assertAlmostEqual(result['fitting_factor'], 1, places=3)
+            self.assertAlmostEqual(result['parameters']['mass_1'], signal['mass_1'], places=0)
+
+    def test_lru_cache(self):
+        cache = LRUCache(maxsize=2)
+        cache['a'], cache['b'] = 1, 2
+        self.assertEqual(cache.get('a'), 1)
+        cache['c'] = 3
+        self.assertNotIn('b', cache)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats['hit_rate'], 0.5)
+
+    def test_lru_cache_threads(self):
+        # search_many shares the template caches between the thread executor's workers
+        cache = LRUCache(maxsize=8)
+
+        def use(i):
+            for j in range(200):
+                key = (i + j) % 16
+                if cache.get(key) is None:
+                    cache[key] = key
+
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(use, range(8)))
+        stats = cache.stats
+        self.assertEqual(stats['hits'] + stats['misses'], 8 * 200)
+        self.assertEqual(stats['size'], 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
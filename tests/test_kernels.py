@@ -0,0 +1,98 @@
+import unittest
+
+import numpy as np
+
+from gw_waveform_overlapper import kernels
+from gw_waveform_overlapper.overlap_computer import inner_product, complex_filter
+from gw_waveform_overlapper.waveform import Waveform
+
+
+class KernelsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.params = dict(
+            mass_1=141.0741,
+            mass_2=113.0013,
+            a_1=0.9434,
+            a_2=0.2173,
+            tilt_1=0,
+            tilt_2=0,
+            phi_jl=0,
+            phi_12=0,
+            luminosity_distance=1782.1610,
+            theta_jn=0.9614,
+            psi=1.6831,
+            phase=5.2220,
+            geocent_time=0,
+            ra=0.9978,
+            dec=-0.4476
+        )
+        self.params2 = self.params.copy()
+        self.params2.update(dict(mass_2=20))
+        self.wf1 = Waveform.inject_signal(self.params)
+        self.wf2 = Waveform.inject_signal(self.params2)
+
+    def test_check_backends(self):
+        rng = np.random.default_rng(0)
+        n = 2 ** 12
+        a = rng.normal(size=n) + 1j * rng.normal(size=n)
+        b = rng.normal(size=n) + 1j * rng.normal(size=n)
+        weights = rng.uniform(size=n)
+        frequency = np.linspace(0, 1024, n)
+        errors = kernels.check_backends(a, b, weights, frequency, np.linspace(-1, 1, 10))
+        self.assertIn("numpy", errors)
+
+    def test_backends_agree_on_waveforms(self):
+        t0s = np.linspace(-1, 1, 5)
+        with kernels.use_backend("numpy"):
+            expected_inner = inner_product(self.wf1, self.wf2)
+            expected_filter = complex_filter(t0s, self.wf1, self.wf2)
+        for name in kernels.available_backends():
+            with kernels.use_backend(name) as backend:
+                self.assertEqual(kernels.get_backend(), backend)
+                self.assertAlmostEqual(inner_product(self.wf1, self.wf2), expected_inner)
+                np.testing.assert_allclose(
+                    complex_filter(t0s, self.wf1, self.wf2), expected_filter)
+        self.assertEqual(kernels.get_backend().name, kernels.DEFAULT_BACKEND)
+
+    def test_scalar_complex_filter(self):
+        z = complex_filter(0.1, self.wf1, self.wf2)
+        self.assertEqual(np.ndim(z), 0)
+        self.assertAlmostEqual(z, complex_filter(np.array([0.1]), self.wf1, self.wf2)[0])
+
+    def test_numpy_filter_blocks(self):
+        rng = np.random.default_rng(1)
+        n = 2 ** 12
+        a = rng.normal(size=n) + 1j * rng.normal(size=n)
+        b = rng.normal(size=n) + 1j * rng.normal(size=n)
+        weights = rng.uniform(size=n)
+        frequency = np.linspace(0, 1024, n)
+        backend = kernels.load_backend("numpy")
+        for t0s in [np.linspace(-1, 1, 50), np.sort(rng.uniform(-1, 1, 50)), [0.3]]:
+            expected = np.exp(2j * np.pi * np.multiply.outer(t0s, frequency)) @ (
+                np.conj(a) * b * weights)
+            filter_bytes = kernels.FILTER_BYTES
+            try:
+                for kernels.FILTER_BYTES in [filter_bytes, 16 * n * 7, 1]:
+                    np.testing.assert_allclose(
+                        backend.filter(a, b, weights, frequency, t0s), expected, rtol=1e-8)
+            finally:
+                kernels.FILTER_BYTES = filter_bytes
+
+    def test_use_backend_restores_threads(self):
+        for name in kernels.available_backends():
+            backend = kernels.load_backend(name)
+            if backend.get_num_threads is None:
+                continue
+            threads = backend.get_num_threads()
+            with kernels.use_backend(name, num_threads=1):
+                self.assertEqual(backend.get_num_threads(), 1)
+            self.assertEqual(backend.get_num_threads(), threads)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            kernels.set_backend("fortran")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+
+import numpy as np
+
+from gw_waveform_overlapper.matched_filter import BLOCK_BYTES, SNRDistribution, \
+    get_block_size, noise_realisation_study
+from gw_waveform_overlapper.overlap_computer import compute_overlap
+from gw_waveform_overlapper.waveform import Waveform
+
+
+class MatchedFilterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.params = dict(
+            mass_1=36,
+            mass_2=29,
+            a_1=0.4,
+            a_2=0,
+            tilt_1=0.5,
+            tilt_2=1,
+            phi_12=1.7,
+            phi_jl=0.3,
+            luminosity_distance=4000,
+            dec=-1.2208,
+            ra=1.375,
+            theta_jn=0.4,
+            psi=2.659,
+            phase=1.3,
+            geocent_time=0,
+        )
+        self.wf1 = Waveform.inject_signal(self.params)
+        self.wf2 = Waveform.inject_signal(dict(self.params, a_2=0.2))
+
+    def test_snr_distribution(self):
+        snrs = np.random.default_rng(0).normal(10, 2, 10000)
+        distribution = SNRDistribution(bins=np.linspace(0, 30, 301))
+        for batch in np.array_split(snrs, 3):
+            distribution.update(batch)
+        self.assertAlmostEqual(distribution.mean, snrs.mean())
+        self.assertAlmostEqual(distribution.variance, snrs.var(ddof=1))
+        for q in [0.05, 0.5, 0.95]:
+            self.assertAlmostEqual(distribution.quantile(q), np.quantile(snrs, q), delta=0.05)
+        self.assertAlmostEqual(distribution.fractions_above_threshold[8], np.mean(snrs > 8))
+
+    def test_block_size(self):
+        n = len(self.wf1.frequency)
+        self.assertGreater(get_block_size(2, n, n), 1)
+        # 16 kHz for 64 s: the block shrinks with the grid instead of the memory growing
+        n = 8192 * 64 + 1
+        block_size = get_block_size(2, n, n)
+        self.assertGreaterEqual(block_size, 1)
+        self.assertLessEqual(block_size * 2 * 4 * n * 16, BLOCK_BYTES)
+        self.assertGreater(get_block_size(2, n, n, maximise_time=False), block_size)
+
+    def test_phase_maximised_snr(self):
+        results = noise_realisation_study(self.wf1, self.wf1, n_realisations=4000,
+                                          maximise_time=False)
+        snr, expected = results["snr"], results["expected_snr"]
+        self.assertGreater(expected, 8)
+        # |expected + complex unit normal noise|
+        self.assertAlmostEqual(snr.mean, np.sqrt(expected ** 2 + 1), delta=0.1)
+        self.assertAlmostEqual(np.sqrt(snr.variance), 1, delta=0.05)
+        np.testing.assert_allclose(results["overlap"].mean, 1)
+
+    def test_noise_realisations(self):
+        kwargs = dict(n_realisations=300, seed=4)
+        results = noise_realisation_study(self.wf2, self.wf1, block_size=64, **kwargs)
+        same = noise_realisation_study(self.wf2, self.wf1, block_size=7, **kwargs)
+        self.assertAlmostEqual(results["snr"].mean, same["snr"].mean)
+        self.assertAlmostEqual(results["overlap"].mean, same["overlap"].mean)
+        self.assertEqual(results["overlap"].minimum, same["overlap"].minimum)
+        np.testing.assert_array_equal(results["snr"].histogram, same["snr"].histogram)
+        auto = noise_realisation_study(self.wf2, self.wf1, **kwargs)
+        np.testing.assert_array_equal(results["snr"].histogram, auto["snr"].histogram)
+        self.assertGreaterEqual(results["expected_overlap"], compute_overlap(self.wf2, self.wf1))
+        self.assertAlmostEqual(results["overlap"].mean, results["expected_overlap"], delta=0.05)
+        self.assertTrue(np.all(results["overlap"].maximum <= 1.1))
+        self.assertGreater(results["optimal_snr"].mean, results["snr"].mean)
+
+
+if __name__ == '__main__':
+    unittest.main()
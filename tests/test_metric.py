@@ -0,0 +1,68 @@
+import unittest
+
+import numpy as np
+
+from gw_waveform_overlapper.metric import OverlapMetric
+from gw_waveform_overlapper.overlap_computer import compute_overlap
+from gw_waveform_overlapper.waveform import Waveform
+
+
+class MetricTest(unittest.TestCase):
+
+    def setUp(self):
+        self.params = dict(
+            mass_1=36,
+            mass_2=29,
+            a_1=0.4,
+            a_2=0,
+            tilt_1=0.5,
+            tilt_2=1,
+            phi_12=1.7,
+            phi_jl=0.3,
+            luminosity_distance=400,
+            dec=-1.2208,
+            ra=1.375,
+            theta_jn=0.4,
+            psi=2.659,
+            phase=1.3,
+            geocent_time=0,
+        )
+        self.metric = OverlapMetric(self.params, keys=['a_2', 'mass_1'])
+
+    def test_metric(self):
+        g = self.metric.metric
+        self.assertEqual(g.shape, (2, 2))
+        np.testing.assert_allclose(g, g.T)
+        self.assertTrue(np.all(np.linalg.eigvalsh(g) > 0))
+
+    def test_prediction(self):
+        points = [dict(self.params, a_2=0.01), dict(self.params, mass_1=36.1)]
+        predicted = self.metric.predict_overlaps(points)
+        for point, overlap in zip(points, predicted):
+            expected = compute_overlap(
+                Waveform.inject_signal(self.params), Waveform.inject_signal(point))
+            self.assertAlmostEqual(overlap, expected, places=2)
+        self.assertAlmostEqual(self.metric.predict_overlaps([self.params])[0], 1)
+
+    def test_fallback_to_exact(self):
+        overlaps, exact = self.metric.compute_overlaps(np.array([[0.001, 36], [0.3, 38]]))
+        np.testing.assert_array_equal(exact, [False, True])
+        expected = compute_overlap(
+            Waveform.inject_signal(self.params),
+            Waveform.inject_signal(dict(self.params, a_2=0.3, mass_1=38))
+        )
+        self.assertAlmostEqual(overlaps[1], expected)
+
+    def test_failed_exact_overlaps(self):
+        points = np.array([[0.3, 38], [1.5, 36]])  # a_2 > 1 fails to generate
+        overlaps, exact = self.metric.compute_overlaps(
+            points, executor=dict(backend="serial", capture_failures=True))
+        np.testing.assert_array_equal(exact, [True, True])
+        self.assertTrue(np.isfinite(overlaps[0]))
+        self.assertTrue(np.isnan(overlaps[1]))
+        with self.assertRaises(RuntimeError):
+            self.metric.compute_overlaps(points, executor="serial")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import shutil
+import unittest
+
+import bilby
+import numpy as np
+
+from gw_waveform_overlapper.monte_carlo import OverlapStatistics, run_monte_carlo, \
+    compute_overlap_batch
+from gw_waveform_overlapper.overlap_computer import compute_overlap, get_snr_for_overlap
+from gw_waveform_overlapper.taylorf2 import TAYLORF2_PHENOM
+from gw_waveform_overlapper.waveform import Waveform
+
+
+class MonteCarloTest(unittest.TestCase):
+
+    def setUp(self):
+        self.params = dict(
+            mass_1=36,
+            mass_2=29,
+            a_1=0.4,
+            a_2=0,
+            tilt_1=0.5,
+            tilt_2=1,
+            phi_12=1.7,
+            phi_jl=0.3,
+            luminosity_distance=400,
+            dec=-1.2208,
+            ra=1.375,
+            theta_jn=0.4,
+            psi=2.659,
+            phase=1.3,
+            geocent_time=0,
+        )
+        self.priors = bilby.core.prior.PriorDict(
+            {k: bilby.core.prior.DeltaFunction(v) for k, v in self.params.items()})
+        self.priors['mass_1'] = bilby.core.prior.Uniform(30, 40)
+        self.priors['a_1'] = bilby.core.prior.Uniform(0, 0.8)
+        self.outdir = "tests/monte_carlo_test"
+        os.makedirs(self.outdir, exist_ok=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.outdir, ignore_errors=True)
+
+    def test_statistics(self):
+        overlaps = 1 - np.random.default_rng(1).exponential(0.01, 5000)
+        statistics = OverlapStatistics()
+        for batch in np.array_split(overlaps, 7):
+            statistics.update(batch)
+        self.assertEqual(statistics.n, len(overlaps))
+        self.assertAlmostEqual(statistics.mean, overlaps.mean())
+        self.assertAlmostEqual(statistics.variance, overlaps.var(ddof=1))
+        self.assertEqual(statistics.histogram.sum(), len(overlaps))
+        for q in [0.05, 0.5, 0.9]:
+            expected = 1 - np.quantile(overlaps, q)
+            self.assertAlmostEqual(1 - statistics.quantile(q), expected, delta=0.02 * expected)
+        fraction = np.mean(get_snr_for_overlap(overlaps) < 20)
+        self.assertAlmostEqual(statistics.fractions_below_threshold[20], fraction)
+
+    def test_save_and_load(self):
+        statistics = OverlapStatistics()
+        statistics.update([0.9, 0.99, 1])
+        filename = os.path.join(self.outdir, "stats.npz")
+        statistics.save(filename, n_batches=1)
+        loaded, data = OverlapStatistics.load(filename)
+        self.assertEqual(loaded.summary(), statistics.summary())
+        self.assertEqual(int(data['n_batches']), 1)
+
+    def test_run_monte_carlo(self):
+        kwargs = dict(waveform_2=dict(a_2=0.2), n_samples=64, batch_size=32,
+                      approximant=TAYLORF2_PHENOM, seed=3)
+        statistics = run_monte_carlo(self.priors, **kwargs)
+        self.assertEqual(statistics.n, 64)
+        self.assertTrue(statistics.minimum < statistics.mean < statistics.maximum <= 1)
+
+        checkpoint = os.path.join(self.outdir, "checkpoint.npz")
+        first = run_monte_carlo(self.priors, checkpoint=checkpoint, **dict(kwargs, n_samples=32))
+        self.assertEqual(first.n, 32)
+        resumed = run_monte_carlo(self.priors, checkpoint=checkpoint, **kwargs)
+        self.assertEqual(resumed.n, 64)
+        self.assertAlmostEqual(resumed.mean, statistics.mean)
+
+    def test_early_stop(self):
+        statistics = run_monte_carlo(
+            self.priors, waveform_2=dict(a_2=0.2), n_samples=1000, batch_size=16,
+            approximant=TAYLORF2_PHENOM, tolerance=0.5, min_samples=16)
+        self.assertEqual(statistics.n, 16)
+
+    def test_compute_overlap_batch(self):
+        points = [self.params, dict(self.params, mass_1=40)]
+        overlaps = compute_overlap_batch(points, approximants=[TAYLORF2_PHENOM] * 2)
+        np.testing.assert_allclose(overlaps, 1)
+        for waveform_2 in [dict(mass_2=25), dict(a_2=0.5, luminosity_distance=800)]:
+            overlaps = compute_overlap_batch(points, waveform_2=waveform_2)
+            expected = [
+                compute_overlap(Waveform.inject_signal(p),
+                                Waveform.inject_signal(dict(p, **waveform_2)))
+                for p in points
+            ]
+            self.assertTrue(np.all(overlaps < 0.999))
+            np.testing.assert_allclose(overlaps, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
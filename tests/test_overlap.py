@@ -2,8 +2,14 @@ import os
 import shutil
 import unittest
 
+from copy import deepcopy
+
+import numpy as np
+
 from gw_waveform_overlapper.overlap_computer import compute_overlap, Waveform, \
-    plot_overlap
+    plot_overlap, inner_product, clear_caches, get_cache_stats, compute_cumulative_overlap, \
+    plot_cumulative_overlap, fft_maximised_overlaps, combine_polarisations, get_weights
+from gw_waveform_overlapper.waveform import create_similar_waveform
 
 
 class WaveformTest(unittest.TestCase):
@@ -42,6 +48,34 @@ class WaveformTest(unittest.TestCase):
         self.assertIsNotNone(compute_overlap(self.wf1, self.wf2))
         self.assertEqual(1, compute_overlap(self.wf1, self.wf1))
 
+    def test_overlap_cache(self):
+        clear_caches()
+        wf2 = deepcopy(self.wf2)
+        expected = (inner_product(self.wf1, wf2) / (inner_product(self.wf1, self.wf1) *
+                                                     inner_product(wf2, wf2)) ** 0.5).real
+        self.assertAlmostEqual(compute_overlap(self.wf1, wf2), expected)
+        self.assertEqual(get_cache_stats()['overlaps']['size'], 0)  # caching is opt-in
+        self.assertAlmostEqual(compute_overlap(self.wf1, wf2, cache=True), expected)
+        self.assertAlmostEqual(compute_overlap(wf2, self.wf1, cache=True), expected)
+        stats = get_cache_stats()
+        self.assertEqual(stats['overlaps']['hits'], 1)
+        self.assertEqual(stats['norms']['misses'], 2)
+
+        wf2.time_shift(0.01)
+        compute_overlap(self.wf1, wf2, cache=True)
+        stats = get_cache_stats()
+        self.assertEqual(stats['overlaps']['misses'], 2)
+        self.assertEqual(stats['norms']['hits'], 1)  # only wf1's norm is reused
+        self.assertEqual(stats['weights']['hits'], 1)
+
+    def test_fingerprint(self):
+        wf = deepcopy(self.wf1)
+        fingerprint = wf.fingerprint
+        self.assertEqual(fingerprint, Waveform.inject_signal(self.params).fingerprint)
+        self.assertNotEqual(fingerprint, self.wf2.fingerprint)
+        wf.phase_shift(0.1)
+        self.assertNotEqual(wf.fingerprint, fingerprint)
+
     def test_overlap_plot(self):
         path = os.path.join(self.outdir, "overlap_different.png")
         plot_overlap(self.wf1, self.wf2, filename=path)
@@ -50,6 +84,44 @@ class WaveformTest(unittest.TestCase):
         plot_overlap(self.wf1, self.wf1, filename=path)
         self.assertTrue(os.path.exists(path))
 
+    def test_cumulative_overlap(self):
+        cumulative = compute_cumulative_overlap(self.wf1, self.wf2)
+        overlap = compute_overlap(self.wf1, self.wf2)
+        self.assertAlmostEqual(float(cumulative.overlap), overlap)
+        self.assertAlmostEqual(float(cumulative.band()), overlap)
+        for f_max in [30, 60, 200]:
+            cut = create_similar_waveform(self.wf1, {})
+            cut2 = create_similar_waveform(self.wf2, {})
+            for wf in [cut, cut2]:
+                for key in ['plus', 'cross']:
+                    wf.frequency_domain_signal[key][wf.frequency > f_max] = 0
+            i = np.searchsorted(self.wf1.frequency, f_max, side='right') - 1
+            expected = compute_overlap(cut, cut2, chunk_size=1024)
+            self.assertAlmostEqual(cumulative.overlap_vs_maximum_frequency[i], expected)
+            self.assertAlmostEqual(float(cumulative.band(maximum_frequency=f_max)), expected)
+        below = cumulative.band(maximum_frequency=60)
+        above = cumulative.overlap_vs_minimum_frequency[
+            np.searchsorted(self.wf1.frequency, 60, side='right')]
+        self.assertNotAlmostEqual(float(below), float(above))
+        self.assertTrue(np.isnan(cumulative.overlap_vs_maximum_frequency[0]))
+
+    def test_cumulative_overlap_batch(self):
+        w1s, w2s = [self.wf1, self.wf2, self.wf1], [self.wf2, self.wf2, self.wf1]
+        cumulative = compute_cumulative_overlap(w1s, w2s, maximise=True)
+        self.assertEqual(cumulative.overlap_vs_minimum_frequency.shape,
+                         (3, len(self.wf1.frequency)))
+        a = np.array([combine_polarisations(wf) for wf in w1s])
+        b = np.array([combine_polarisations(wf) for wf in w2s])
+        expected, time, phase = fft_maximised_overlaps(
+            a, b, get_weights(None, self.wf1.frequency), self.wf1.sampling_frequency)
+        np.testing.assert_allclose(cumulative.overlap, expected)
+        np.testing.assert_allclose(cumulative.time, time)
+        np.testing.assert_allclose(cumulative.overlap[1:], 1)
+        self.assertTrue(np.all(cumulative.overlap >= compute_cumulative_overlap(w1s, w2s).overlap))
+        path = os.path.join(self.outdir, "cumulative_overlap.png")
+        plot_cumulative_overlap(self.wf1, self.wf2, filename=path)
+        self.assertTrue(os.path.exists(path))
+
 
 if __name__ == '__main__':
     unittest.main()
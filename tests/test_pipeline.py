@@ -0,0 +1,128 @@
+import asyncio
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from gw_waveform_overlapper.multiple_overlaps import calculate_multiple_overlaps_for_psds
+from gw_waveform_overlapper.overlap_computer import combine_polarisations, \
+    fft_maximised_overlaps, get_weights, get_zero_noise_psd
+from gw_waveform_overlapper.pipeline import run_pipeline, GENERATE, EVALUATE, WRITE
+from gw_waveform_overlapper.taylorf2 import TAYLORF2_PHENOM
+from gw_waveform_overlapper.waveform import Waveform
+
+
+class PipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.params = dict(
+            mass_1=36,
+            mass_2=29,
+            a_1=0.4,
+            a_2=0,
+            tilt_1=0.5,
+            tilt_2=1,
+            phi_12=1.7,
+            phi_jl=0.3,
+            luminosity_distance=400,
+            dec=-1.2208,
+            ra=1.375,
+            theta_jn=0.4,
+            psi=2.659,
+            phase=1.3,
+            geocent_time=0,
+        )
+        self.pairs = [(dict(self.params, mass_1=m), dict(self.params, mass_1=m, a_2=0.2))
+                      for m in np.linspace(30, 40, 10)]
+        self.kwargs = dict(approximant=TAYLORF2_PHENOM, batch_size=3, queue_size=1,
+                           verbose=False)
+
+    def test_run_pipeline(self):
+        w1s = Waveform.inject_signals([p[0] for p in self.pairs], approximant=TAYLORF2_PHENOM)
+        w2s = Waveform.inject_signals([p[1] for p in self.pairs], approximant=TAYLORF2_PHENOM)
+        expected = calculate_multiple_overlaps_for_psds(w1s, w2s, [get_zero_noise_psd()])[:, 0]
+        for executor in ["serial", "thread"]:
+            columns, metrics = run_pipeline(iter(self.pairs), executor=executor, **self.kwargs)
+            np.testing.assert_array_equal(columns["index"], np.arange(len(self.pairs)))
+            np.testing.assert_allclose(columns["overlap"], expected)
+            for name in [GENERATE, EVALUATE, WRITE]:
+                self.assertEqual(metrics[name].items, len(self.pairs))
+                self.assertEqual(metrics[name].batches, 4)
+                self.assertGreater(metrics[name].throughput, 0)
+
+    def test_optimise(self):
+        columns, _ = run_pipeline(self.pairs[:2], optimise=True, **self.kwargs)
+        self.assertEqual(set(columns), {"index", "overlap", "time_shift", "phase_shift",
+                                        "optimised_overlap"})
+        self.assertTrue(np.all(columns["optimised_overlap"] >= columns["overlap"] - 1e-6))
+
+        pairs = [(dict(p1), dict(p2)) for p1, p2 in self.pairs[:2]]
+        psd = (np.array([20, 60, 200, 1024]), np.array([1e-46, 1e-47, 1e-46, 1e-44]))
+        columns, _ = run_pipeline(pairs, optimise=True, psd=psd, duration=8,
+                                  sampling_frequency=1024, **self.kwargs)
+        self.assertEqual(pairs, [(dict(p1), dict(p2)) for p1, p2 in self.pairs[:2]])
+        w1s = Waveform.inject_signals([p[0] for p in pairs], approximant=TAYLORF2_PHENOM,
+                                      duration=8, sampling_frequency=1024)
+        w2s = Waveform.inject_signals([p[1] for p in pairs], approximant=TAYLORF2_PHENOM,
+                                      duration=8, sampling_frequency=1024)
+        for i, (w1, w2) in enumerate(zip(w1s, w2s)):
+            overlap, time, phase = fft_maximised_overlaps(
+                combine_polarisations(w1), combine_polarisations(w2),
+                get_weights(psd, w1.frequency), 1024)
+            self.assertAlmostEqual(columns["optimised_overlap"][i], overlap)
+            self.assertAlmostEqual(columns["time_shift"][i], time)
+
+    def test_backpressure(self):
+        consumed = []
+        max_ahead = []
+
+        def pairs():
+            for i, pair in enumerate(self.pairs * 4):
+                consumed.append(i)
+                yield pair
+
+        def write(columns):
+            max_ahead.append(len(consumed) - columns["index"][-1] - 1)
+            time.sleep(0.05)
+
+        columns, metrics = run_pipeline(pairs(), write=write, **self.kwargs)
+        self.assertIsNone(columns)
+        # batches ahead of the writer: one in each queue, one blocked on each put
+        # and one being evaluated
+        self.assertLessEqual(max(max_ahead), 5 * 3)
+        self.assertEqual(len(consumed), 40)
+        self.assertGreater(metrics[EVALUATE].blocked, 0)
+
+    def test_write_stage(self):
+        # python 3.8 (as on CI) has no asyncio.to_thread, the writes must not need it
+        to_thread = getattr(asyncio, "to_thread", None)
+        if to_thread is not None:
+            del asyncio.to_thread
+        writes = []
+        try:
+            run_pipeline(self.pairs, write=lambda columns: writes.append(
+                (threading.get_ident(), columns["index"][0])), **self.kwargs)
+        finally:
+            if to_thread is not None:
+                asyncio.to_thread = to_thread
+        self.assertEqual([i for _, i in writes], [0, 3, 6, 9])
+        self.assertEqual(len({thread for thread, _ in writes}), 1)
+        self.assertNotEqual(writes[0][0], threading.get_ident())
+
+    def test_error_cancels_stages(self):
+        calls = []
+        lock = threading.Lock()
+
+        def write(columns):
+            with lock:
+                calls.append(columns["index"][0])
+            raise IOError("disk full")
+
+        with self.assertRaises(IOError):
+            run_pipeline(self.pairs, write=write, **self.kwargs)
+        self.assertEqual(calls, [0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import shutil
+import unittest
+
+import bilby
+import numpy as np
+
+from gw_waveform_overlapper import psd
+from gw_waveform_overlapper.multiple_overlaps import calculate_multiple_overlaps_for_psds
+from gw_waveform_overlapper.overlap_computer import compute_overlap
+from gw_waveform_overlapper.waveform import Waveform
+
+NOISE_CURVES = os.path.join(os.path.dirname(bilby.gw.detector.__file__), 'noise_curves')
+
+
+class PSDTest(unittest.TestCase):
+
+    def setUp(self):
+        self.params = dict(
+            mass_1=141.0741,
+            mass_2=113.0013,
+            a_1=0.9434,
+            a_2=0.2173,
+            tilt_1=0,
+            tilt_2=0,
+            phi_jl=0,
+            phi_12=0,
+            luminosity_distance=1782.1610,
+            theta_jn=0.9614,
+            psi=1.6831,
+            phase=5.2220,
+            geocent_time=0,
+            ra=0.9978,
+            dec=-0.4476
+        )
+        self.params2 = self.params.copy()
+        self.params2.update(dict(mass_2=20))
+        self.wf1 = Waveform.inject_signal(self.params)
+        self.wf2 = Waveform.inject_signal(self.params2)
+        self.outdir = "tests/psd_test"
+        psd.PSD_CACHE_DIR = os.path.join(self.outdir, "cache")
+        os.makedirs(self.outdir, exist_ok=True)
+        self.psd_files = [
+            os.path.join(NOISE_CURVES, "aLIGO_ZERO_DET_high_P_psd.txt"),
+            os.path.join(NOISE_CURVES, "AdV_psd.txt"),
+            os.path.join(NOISE_CURVES, "KAGRA_design_psd.txt"),
+        ]
+
+    def tearDown(self):
+        if os.path.exists(self.outdir):
+            shutil.rmtree(self.outdir)
+
+    def test_load_psd_is_cached_memory_map(self):
+        frequency, psd_values = psd.load_psd(self.psd_files[0])
+        self.assertIsInstance(psd_values.base, np.memmap)
+        self.assertIs(psd.load_psd(self.psd_files[0])[1], psd_values)
+        expected = np.loadtxt(self.psd_files[0])
+        np.testing.assert_array_equal(frequency, expected[:, 0])
+        np.testing.assert_array_equal(psd_values, expected[:, 1])
+
+    def test_load_asd(self):
+        asd_file = os.path.join(NOISE_CURVES, "aLIGO_ZERO_DET_high_P_asd.txt")
+        _, psd_values = psd.load_psd(asd_file, is_asd=True)
+        np.testing.assert_allclose(psd_values, np.loadtxt(asd_file)[:, 1] ** 2)
+
+    def test_asd_through_interpolation(self):
+        asd_file = os.path.join(NOISE_CURVES, "aLIGO_ZERO_DET_high_P_asd.txt")
+        frequency, asd = np.loadtxt(asd_file, unpack=True)
+        expected = psd.interpolate_psd((frequency, asd ** 2), self.wf1.frequency)
+        np.testing.assert_allclose(
+            psd.interpolate_psd((asd_file, True), self.wf1.frequency), expected)
+        np.testing.assert_allclose(
+            psd.interpolate_psd(asd_file, self.wf1.frequency, is_asd=True), expected)
+        np.testing.assert_allclose(
+            psd.get_psd_weights([asd_file], self.wf1.frequency, is_asd=True)[0], 1 / expected)
+        self.assertAlmostEqual(compute_overlap(self.wf1, self.wf2, psd=(asd_file, True)),
+                               compute_overlap(self.wf1, self.wf2, psd=(frequency, asd ** 2)))
+
+    def test_npy_psd_columns(self):
+        npy_file = os.path.join(self.outdir, "psd.npy")
+        np.save(npy_file, np.loadtxt(self.psd_files[0]))
+        for filename in [npy_file, self.psd_files[0]]:
+            frequency, psd_values = psd.load_psd(filename)
+            np.testing.assert_array_equal(frequency, np.loadtxt(self.psd_files[0])[:, 0])
+            np.testing.assert_array_equal(psd_values, np.loadtxt(self.psd_files[0])[:, 1])
+        np.testing.assert_allclose(psd.load_psd(npy_file, is_asd=True)[1], psd_values ** 2)
+        bad_file = os.path.join(self.outdir, "rows.npy")
+        np.save(bad_file, np.arange(10.))
+        with self.assertRaises(ValueError):
+            psd.load_psd(bad_file)
+
+    def test_psd_weights(self):
+        weights = psd.get_psd_weights(self.psd_files, self.wf1.frequency)
+        self.assertEqual(weights.shape, (3, len(self.wf1.frequency)))
+        self.assertEqual(weights[0, 0], 0)
+
+    def test_overlaps_for_psds(self):
+        overlaps = calculate_multiple_overlaps_for_psds(
+            w1s=[self.wf1, self.wf1], w2s=[self.wf1, self.wf2], psds=self.psd_files
+        )
+        self.assertEqual(overlaps.shape, (2, 3))
+        np.testing.assert_allclose(overlaps[0], 1)
+        for k, psd_file in enumerate(self.psd_files):
+            expected = compute_overlap(self.wf1, self.wf2, psd=psd_file)
+            self.assertAlmostEqual(overlaps[1, k], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from gw_waveform_overlapper import rendering
+from gw_waveform_overlapper.waveform import Waveform
+
+
+class RenderingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.params = dict(
+            mass_1=36,
+            mass_2=29,
+            a_1=0.4,
+            a_2=0,
+            tilt_1=0.5,
+            tilt_2=1,
+            phi_12=1.7,
+            phi_jl=0.3,
+            luminosity_distance=400,
+            dec=-1.2208,
+            ra=1.375,
+            theta_jn=0.4,
+            psi=2.659,
+            phase=1.3,
+            geocent_time=0,
+        )
+        self.x = np.linspace(0, 10, 100001)
+        self.y = np.sin(40 * self.x) * np.exp(-self.x)
+
+    def test_minmax_envelope(self):
+        x, y = rendering.minmax_envelope(self.x, self.y, 1000)
+        self.assertLessEqual(len(x), 1000)
+        self.assertTrue(np.all(np.diff(x) >= 0))
+        self.assertEqual(y.max(), self.y.max())
+        self.assertEqual(y.min(), self.y.min())
+
+    def test_lttb(self):
+        x, y = rendering.lttb(self.x, self.y, 500)
+        self.assertEqual(len(x), 500)
+        self.assertEqual((x[0], x[-1]), (self.x[0], self.x[-1]))
+        self.assertTrue(np.all(np.diff(x) > 0))
+        self.assertLess(np.max(np.abs(np.interp(self.x, x, y) - self.y)), 0.2)
+
+    def test_decimate_window(self):
+        x, y = rendering.decimate(self.x, self.y, xlim=(2, 3), method=rendering.LTTB)
+        self.assertLessEqual(x[0], 2)
+        self.assertGreaterEqual(x[-1], 3)
+        self.assertLess(x[-1] - x[0], 1.001)
+        with self.assertRaises(ValueError):
+            rendering.decimate(self.x, self.y, method="every_other")
+
+    def test_get_figure(self):
+        fig, axes = rendering.get_figure("test", 2, 1)
+        axes[0].plot([0, 1])
+        fig2, axes2 = rendering.get_figure("test", 2, 1)
+        self.assertIs(fig, fig2)
+        self.assertEqual(len(axes2[0].lines), 0)
+        plt.close(fig)
+        fig3, _ = rendering.get_figure("test", 2, 1)
+        self.assertIsNot(fig, fig3)
+        plt.close(fig3)
+
+    def test_waveform_plots(self):
+        wf = Waveform.inject_signal(self.params, sampling_frequency=16384)
+        ax = wf.plot_time_domain_data(max_points=1000)
+        line = ax.lines[0]
+        self.assertLessEqual(len(line.get_xdata()), 1000)
+        rolled = np.roll(wf.time_domain_signal['cross'], len(wf.time) // 2)
+        self.assertEqual(np.max(line.get_ydata()), np.max(rolled))
+
+        frequency, asd = wf.get_asd()
+        self.assertIs(wf.get_asd()[1], asd)
+        wf.time_shift(0.1)
+        self.assertIsNot(wf.get_asd()[1], asd)
+        ax = wf.plot_frequency_domain_data(max_points=1000)
+        self.assertLessEqual(len(ax.lines[0].get_xdata()), 1000)
+        plt.close('all')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from gw_waveform_overlapper import overlap_optimizer
+from gw_waveform_overlapper.overlap_computer import compute_overlap
+from gw_waveform_overlapper.service import OverlapService, OverlapClient, ServiceError, \
+    create_server, COMPUTE_OVERLAP, INJECT_SIGNAL
+from gw_waveform_overlapper.taylorf2 import TAYLORF2_PHENOM
+from gw_waveform_overlapper.waveform import Waveform
+
+
+class ServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.params = dict(
+            mass_1=36,
+            mass_2=29,
+            a_1=0.4,
+            a_2=0,
+            tilt_1=0.5,
+            tilt_2=1,
+            phi_12=1.7,
+            phi_jl=0.3,
+            luminosity_distance=400,
+            dec=-1.2208,
+            ra=1.375,
+            theta_jn=0.4,
+            psi=2.659,
+            phase=1.3,
+            geocent_time=0,
+        )
+        self.outdir = tempfile.mkdtemp()
+        self.server = create_server(
+            OverlapService(batch_window=0.05), socket_path=os.path.join(self.outdir, "sock"))
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.client = OverlapClient(self.server.server_address)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.server.service.close()
+        shutil.rmtree(self.outdir)
+
+    def test_inject_signal(self):
+        wf = self.client.inject_signal(self.params)
+        expected = Waveform.inject_signal(self.params)
+        for key in ['plus', 'cross']:
+            np.testing.assert_allclose(wf.frequency_domain_signal[key],
+                                       expected.frequency_domain_signal[key])
+        np.testing.assert_allclose(wf.time_domain_signal['plus'],
+                                   expected.time_domain_signal['plus'], atol=1e-30)
+
+    def test_compute_overlap(self):
+        params_2 = dict(self.params, a_2=0.2)
+        expected = compute_overlap(Waveform.inject_signal(self.params),
+                                   Waveform.inject_signal(params_2))
+        self.assertAlmostEqual(self.client.compute_overlap(self.params, params_2), expected)
+        wf = Waveform.inject_signal(self.params)
+        self.assertAlmostEqual(self.client.compute_overlap(wf, wf), 1)
+
+    def test_fft_overlap_optimizer(self):
+        params_2 = dict(self.params, geocent_time=0.1, phase=0.5)
+        time, phase, overlap, _ = self.client.fft_overlap_optimizer(self.params, params_2)
+        expected = overlap_optimizer.fft_overlap_optimizer(
+            Waveform.inject_signal(self.params), Waveform.inject_signal(params_2))
+        np.testing.assert_allclose([time, phase, overlap], expected[:3], atol=1e-6)
+
+    def test_coalescing_and_batching(self):
+        service = self.server.service
+        request = dict(parameters_1=self.params, parameters_2=dict(self.params, a_2=0.2),
+                       approximant=TAYLORF2_PHENOM)
+        futures = [service.submit(COMPUTE_OVERLAP, request) for _ in range(3)]
+        futures += [service.submit(COMPUTE_OVERLAP, dict(request, parameters_2=dict(
+            self.params, a_2=a_2))) for a_2 in [0.3, 0.4]]
+        futures.append(service.submit(INJECT_SIGNAL, dict(parameters=self.params)))
+        results = [f.result() for f in futures]
+        self.assertIs(futures[0], futures[2])
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(len(set(results[:5])), 3)
+        stats = self.client.stats()
+        self.assertEqual(stats["requests"], 6)
+        self.assertEqual(stats["coalesced"], 2)
+        self.assertEqual(stats["evaluated"], 4)
+        self.assertEqual(stats["batches"], 1)
+
+    def test_failures_are_isolated(self):
+        service = self.server.service
+        request = dict(parameters_1=self.params, parameters_2=dict(self.params, a_2=0.2),
+                       approximant=TAYLORF2_PHENOM)
+        bad = service.submit(COMPUTE_OVERLAP, dict(request, approximant="NotAnApproximant"))
+        good = service.submit(COMPUTE_OVERLAP, request)
+        wf = service.submit(INJECT_SIGNAL, dict(parameters=self.params))
+        with self.assertRaises(Exception):
+            bad.result()
+        expected = compute_overlap(*Waveform.inject_signals(
+            [request["parameters_1"], request["parameters_2"]], approximant=TAYLORF2_PHENOM))
+        self.assertAlmostEqual(good.result(), expected)
+        self.assertIsInstance(wf.result(), Waveform)
+        self.assertEqual(self.client.stats()["batches"], 1)
+
+    def test_concurrent_clients(self):
+        points = [dict(self.params, a_2=a_2) for a_2 in [0, 0.1, 0.2, 0.3]]
+        results = {}
+
+        def call(i):
+            results[i] = self.client.compute_overlap(
+                self.params, points[i % 4], approximant=TAYLORF2_PHENOM)
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for i in range(12):
+            self.assertEqual(results[i], results[i % 4])
+        self.assertAlmostEqual(results[0], 1)
+
+    def test_errors(self):
+        with self.assertRaises(ServiceError):
+            self.client.request("unknown", {})
+        with self.assertRaises(ServiceError):
+            self.client.request(COMPUTE_OVERLAP, dict(parameters_1=self.params))
+        with self.assertRaises(ValueError):
+            self.client.compute_overlap(self.params, self.params, psd=(np.ones(2), np.ones(2)))
+        self.assertAlmostEqual(self.client.compute_overlap(self.params, self.params), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+
+import bilby
+import numpy as np
+
+from gw_waveform_overlapper import sky_map
+from gw_waveform_overlapper.waveform import Waveform
+
+
+class SkyMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.params = dict(
+            mass_1=141.0741,
+            mass_2=113.0013,
+            a_1=0.9434,
+            a_2=0.2173,
+            tilt_1=0,
+            tilt_2=0,
+            phi_jl=0,
+            phi_12=0,
+            luminosity_distance=1782.1610,
+            theta_jn=0.9614,
+            psi=1.6831,
+            phase=5.2220,
+            geocent_time=0,
+            ra=0.9978,
+            dec=-0.4476
+        )
+        self.params2 = self.params.copy()
+        self.params2.update(dict(mass_2=100, theta_jn=0.3))
+        self.wf1 = Waveform.inject_signal(self.params)
+        self.wf2 = Waveform.inject_signal(self.params2)
+        self.ifos = bilby.gw.detector.InterferometerList(['H1', 'L1', 'V1'])
+
+    def projected_overlap(self, ra1, dec1, psi1, ra2, dec2, psi2):
+        inner = dict(aa=0, bb=0, ab=0)
+        for ifo in self.ifos:
+            weights = 1 / ifo.power_spectral_density.power_spectral_density_interpolated(
+                self.wf1.frequency)
+            signals = []
+            for wf, ra, dec, psi in [(self.wf1, ra1, dec1, psi1), (self.wf2, ra2, dec2, psi2)]:
+                h = sum(ifo.antenna_response(ra, dec, 0, psi, p) * wf.frequency_domain_signal[p]
+                        for p in ['plus', 'cross'])
+                delay = ifo.time_delay_from_geocenter(ra, dec, 0)
+                signals.append(h * np.exp(-2j * np.pi * wf.frequency * delay))
+            a, b = signals
+            inner['aa'] += np.sum(np.abs(a) ** 2 * weights)
+            inner['bb'] += np.sum(np.abs(b) ** 2 * weights)
+            inner['ab'] += np.sum(np.conj(a) * b * weights)
+        return inner['ab'].real / np.sqrt(inner['aa'] * inner['bb'])
+
+    def test_antenna_patterns(self):
+        ra, dec = sky_map.get_sky_grid(2)
+        psi = np.array([0.3, 2.0])
+        patterns = sky_map.antenna_patterns(self.ifos[0], ra, dec, psi, time=0)
+        self.assertEqual(patterns.shape, (2, 48, 2))
+        for i in [0, 17, 40]:
+            for j, p in enumerate(psi):
+                self.assertAlmostEqual(patterns[0, i, j], self.ifos[0].antenna_response(
+                    ra[i], dec[i], 0, p, 'plus'))
+                self.assertAlmostEqual(patterns[1, i, j], self.ifos[0].antenna_response(
+                    ra[i], dec[i], 0, p, 'cross'))
+        np.testing.assert_allclose(
+            sky_map.time_delays(self.ifos[1], ra[:3], dec[:3]),
+            [self.ifos[1].time_delay_from_geocenter(r, d, 0) for r, d in zip(ra[:3], dec[:3])]
+        )
+
+    def test_sky_overlap_map(self):
+        ra, dec = sky_map.get_sky_grid(2)
+        result = sky_map.sky_overlap_map(self.wf1, self.wf2, ifos=self.ifos, ra=ra, dec=dec)
+        self.assertEqual(result['overlap'].shape, (48, sky_map.NUM_PSI))
+        i, j = 5, 3
+        expected = self.projected_overlap(ra[i], dec[i], result['psi'][j],
+                                          ra[i], dec[i], result['psi'][j])
+        self.assertAlmostEqual(result['overlap'][i, j], expected)
+
+    def test_reference_sky_map(self):
+        ra, dec = sky_map.get_sky_grid(2)
+        reference = dict(ra=self.params['ra'], dec=self.params['dec'], psi=self.params['psi'])
+        result = sky_map.sky_overlap_map(self.wf1, self.wf2, ifos=self.ifos, ra=ra, dec=dec,
+                                         reference_sky=reference)
+        i, j = 30, 1
+        expected = self.projected_overlap(reference['ra'], reference['dec'], reference['psi'],
+                                          ra[i], dec[i], result['psi'][j])
+        self.assertAlmostEqual(result['overlap'][i, j], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
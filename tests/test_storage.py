@@ -0,0 +1,113 @@
+import os
+import shutil
+import unittest
+
+import numpy as np
+
+from gw_waveform_overlapper.overlap_computer import compute_overlap, \
+    chunked_inner_products, inner_product
+from gw_waveform_overlapper.storage import save_waveform, open_waveform, \
+    save_waveforms, open_waveforms
+from gw_waveform_overlapper.waveform import Waveform, POLARISATION
+
+
+class StorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.params = dict(
+            mass_1=141.0741,
+            mass_2=113.0013,
+            a_1=0.9434,
+            a_2=0.2173,
+            tilt_1=0,
+            tilt_2=0,
+            phi_jl=0,
+            phi_12=0,
+            luminosity_distance=1782.1610,
+            theta_jn=0.9614,
+            psi=1.6831,
+            phase=5.2220,
+            geocent_time=0,
+            ra=0.9978,
+            dec=-0.4476
+        )
+        self.params2 = self.params.copy()
+        self.params2.update(dict(mass_2=20))
+        self.wf1 = Waveform.inject_signal(self.params)
+        self.wf2 = Waveform.inject_signal(self.params2)
+        self.outdir = "tests/storage_test"
+        os.makedirs(self.outdir, exist_ok=True)
+
+    def tearDown(self):
+        if os.path.exists(self.outdir):
+            shutil.rmtree(self.outdir)
+
+    def test_save_and_open(self):
+        path = os.path.join(self.outdir, "wf1")
+        save_waveform(self.wf1, path)
+        wf = open_waveform(path)
+        self.assertIsInstance(wf.frequency, np.memmap)
+        self.assertEqual(wf.duration, self.wf1.duration)
+        self.assertEqual(wf.parameters, self.wf1.parameters)
+        for p in ['cross', 'plus']:
+            np.testing.assert_array_equal(
+                wf.frequency_domain_signal[p], self.wf1.frequency_domain_signal[p])
+
+    def test_chunked_inner_products(self):
+        expected = [inner_product(self.wf1, self.wf1), inner_product(self.wf2, self.wf2),
+                    inner_product(self.wf1, self.wf2)]
+        for chunk_size in [100, 1000, 10 ** 6]:
+            res = chunked_inner_products(self.wf1, self.wf2, chunk_size=chunk_size)
+            np.testing.assert_allclose(res, expected)
+
+    def test_chunked_overlap_from_storage(self):
+        save_waveform(self.wf1, os.path.join(self.outdir, "wf1"))
+        save_waveform(self.wf2, os.path.join(self.outdir, "wf2"))
+        wf1 = open_waveform(os.path.join(self.outdir, "wf1"))
+        wf2 = open_waveform(os.path.join(self.outdir, "wf2"))
+        self.assertAlmostEqual(
+            compute_overlap(wf1, wf2, chunk_size=512),
+            compute_overlap(self.wf1, self.wf2)
+        )
+
+    def test_from_arrays_and_buffer(self):
+        signal = np.stack([self.wf1.frequency_domain_signal[p] for p in POLARISATION])
+        wf = Waveform.from_arrays(self.wf1.frequency, signal)
+        self.assertTrue(np.shares_memory(wf.frequency_domain_signal['plus'], signal))
+        self.assertEqual(wf.duration, self.wf1.duration)
+        self.assertEqual(wf.sampling_frequency, self.wf1.sampling_frequency)
+        np.testing.assert_allclose(wf.time_domain_signal['cross'],
+                                   self.wf1.time_domain_signal['cross'])
+        self.assertAlmostEqual(compute_overlap(wf, self.wf2), compute_overlap(self.wf1, self.wf2))
+
+        buffer = bytearray(self.wf1.frequency.tobytes() + signal.tobytes())
+        wf = Waveform.from_buffer(buffer, len(self.wf1.frequency))
+        np.testing.assert_array_equal(wf.frequency_domain_signal['plus'],
+                                      self.wf1.frequency_domain_signal['plus'])
+        wf.frequency_domain_signal['plus'][0] = 1
+        self.assertEqual(np.frombuffer(buffer, dtype=complex, offset=wf.frequency.nbytes)[
+                             POLARISATION.index('plus') * len(wf.frequency)], 1)
+
+    def test_collections(self):
+        wfs = [self.wf1, self.wf2]
+        for filename in ["collection", "collection.npz", "collection.h5", "collection.arrow"]:
+            path = os.path.join(self.outdir, filename)
+            save_waveforms(wfs, path)
+            with open_waveforms(path) as collection:
+                self.assertEqual(len(collection), 2)
+                self.assertEqual(collection.parameters[1], self.params2)
+                np.testing.assert_array_equal(collection.frequency, self.wf1.frequency)
+                for wf, expected in zip(collection, wfs):
+                    for p in POLARISATION:
+                        np.testing.assert_array_equal(
+                            wf.frequency_domain_signal[p], expected.frequency_domain_signal[p])
+                self.assertAlmostEqual(compute_overlap(collection[0], collection[-1]),
+                                       compute_overlap(*wfs))
+        uneven = Waveform.from_arrays(self.wf1.frequency ** 2, self.wf1.frequency_domain_signal,
+                                      sampling_frequency=self.wf1.sampling_frequency)
+        with self.assertRaises(ValueError):
+            save_waveforms([uneven], os.path.join(self.outdir, "uneven.arrow"))
+
+
+if __name__ == '__main__':
+    unittest.main()
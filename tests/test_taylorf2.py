@@ -0,0 +1,77 @@
+import unittest
+
+import bilby
+import numpy as np
+
+from gw_waveform_overlapper import taylorf2
+from gw_waveform_overlapper.overlap_computer import combine_polarisations, \
+    get_zero_noise_psd
+from gw_waveform_overlapper.waveform import Waveform
+
+
+class TaylorF2Test(unittest.TestCase):
+
+    def setUp(self):
+        self.params = dict(
+            mass_1=10,
+            mass_2=8,
+            a_1=0.5,
+            a_2=0.3,
+            tilt_1=0,
+            tilt_2=np.pi,
+            phi_jl=0,
+            phi_12=0,
+            luminosity_distance=400,
+            theta_jn=0.9614,
+            psi=1.6831,
+            phase=0.3,
+            geocent_time=0,
+            ra=0.9978,
+            dec=-0.4476
+        )
+        self.frequency = bilby.core.utils.create_frequency_series(4096, 16)
+
+    def test_matches_lal_taylorf2(self):
+        lal_wf = Waveform.inject_signal(
+            self.params, approximant="TaylorF2", duration=16, sampling_frequency=4096)
+        wf = Waveform.inject_signal(
+            self.params, approximant=taylorf2.TAYLORF2, duration=16, sampling_frequency=4096)
+        weights = 1 / get_zero_noise_psd().power_spectral_density_interpolated(wf.frequency)
+        a = combine_polarisations(wf)
+        b = combine_polarisations(lal_wf) * (a != 0)  # LAL does not stop at ISCO
+        # maximise over time and phase
+        z = np.fft.ifft(np.conj(a) * b * weights) * len(a)
+        match = np.max(np.abs(z)) / np.sqrt(
+            np.sum(np.abs(a) ** 2 * weights) * np.sum(np.abs(b) ** 2 * weights))
+        self.assertGreater(match, 0.999)
+
+    def test_batch(self):
+        masses = np.linspace(5, 30, 7)
+        batch = dict(self.params, mass_1=masses)
+        strain = taylorf2.taylorf2_strain(self.frequency, batch)
+        self.assertEqual(strain["plus"].shape, (7, len(self.frequency)))
+        single = taylorf2.taylorf2_strain(self.frequency, dict(self.params, mass_1=masses[3]))
+        np.testing.assert_allclose(strain["cross"][3], single["cross"][0])
+
+        points = [dict(self.params, mass_1=m) for m in masses]
+        wfs = Waveform.inject_signals(points, approximant=taylorf2.TAYLORF2)
+        self.assertEqual(len(wfs), 7)
+        self.assertEqual(wfs[3].parameters, points[3])
+        np.testing.assert_allclose(
+            wfs[3].frequency_domain_signal["plus"],
+            Waveform.inject_signal(points[3], approximant=taylorf2.TAYLORF2)
+            .frequency_domain_signal["plus"]
+        )
+
+    def test_phenom_amplitude(self):
+        inspiral = taylorf2.taylorf2_strain(self.frequency, self.params)
+        phenom = taylorf2.taylorf2_strain(self.frequency, self.params, amplitude="phenom")
+        isco = 1 / (6 ** 1.5 * np.pi * 18 * 4.925491025543576e-06)
+        above_isco = self.frequency > isco * 1.1
+        self.assertTrue(np.all(inspiral["plus"][0, above_isco] == 0))
+        self.assertTrue(np.any(phenom["plus"][0, above_isco] != 0))
+        self.assertTrue(np.all(inspiral["plus"][0, self.frequency < 20] == 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
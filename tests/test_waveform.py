@@ -5,8 +5,10 @@ import unittest
 import matplotlib.pyplot as plt
 import numpy as np
 
+from gw_waveform_overlapper.overlap_computer import compute_overlap
 from gw_waveform_overlapper.waveform import Waveform, plot_multiple_waveform_objects, \
-    create_similar_waveform
+    create_similar_waveform, get_auto_duration, get_auto_sampling_frequency, get_common_grid
+from gw_waveform_overlapper.taylorf2 import TAYLORF2
 
 
 class WaveformTest(unittest.TestCase):
@@ -136,6 +138,36 @@ class WaveformTest(unittest.TestCase):
         wf = create_similar_waveform(wf, dict(phase=0))
         self.assertEqual(wf.parameters['phase'], 0)
 
+    def test_auto_grid(self):
+        wf = Waveform.inject_signal(self.params, duration='auto', sampling_frequency='auto')
+        self.assertEqual(wf.sampling_frequency, get_auto_sampling_frequency(self.params))
+        self.assertLess(len(wf.frequency), len(Waveform.inject_signal(self.params).frequency))
+        self.assertAlmostEqual(compute_overlap(wf, wf), 1)
+
+        light_params = self.params.copy()
+        light_params.update(dict(mass_1=5, mass_2=4))
+        self.assertGreater(get_auto_duration(light_params), get_auto_duration(self.params))
+        self.assertGreater(get_auto_sampling_frequency(light_params),
+                           get_auto_sampling_frequency(self.params))
+
+    def test_common_grid(self):
+        wf1, wf2 = Waveform.inject_signals_on_common_grid([self.params, self.params2])
+        np.testing.assert_array_equal(wf1.frequency, wf2.frequency)
+        self.assertEqual(wf1.sampling_frequency,
+                         get_auto_sampling_frequency(self.params2))
+        self.assertIsNotNone(compute_overlap(wf1, wf2))
+
+    def test_batched_auto_grid(self):
+        points = [self.params, self.params2]
+        duration, sampling_frequency = get_common_grid(points)
+        wfs = Waveform.inject_signals(points, approximant=TAYLORF2,
+                                      duration='auto', sampling_frequency='auto')
+        for wf in wfs:
+            self.assertEqual(wf.sampling_frequency, sampling_frequency)
+            self.assertEqual(len(wf.frequency), duration * sampling_frequency // 2 + 1)
+        wf, = Waveform.inject_signals(points[:1], approximant=TAYLORF2, duration='auto')
+        self.assertEqual(len(wf.frequency), get_auto_duration(self.params) * 2048 // 2 + 1)
+
 
 if __name__ == '__main__':
     unittest.main()
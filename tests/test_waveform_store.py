@@ -0,0 +1,73 @@
+import pickle
+import unittest
+
+import numpy as np
+
+from gw_waveform_overlapper.overlap_computer import compute_overlap
+from gw_waveform_overlapper.waveform import Waveform
+from gw_waveform_overlapper.waveform_store import WaveformStore, attach, \
+    calculate_multiple_overlaps_from_handles, calculate_multiple_fft_overlaps_from_handles, \
+    fft_overlap_from_handles
+
+
+class WaveformStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.params = dict(
+            mass_1=141.0741,
+            mass_2=113.0013,
+            a_1=0.9434,
+            a_2=0.2173,
+            tilt_1=0,
+            tilt_2=0,
+            phi_jl=0,
+            phi_12=0,
+            luminosity_distance=1782.1610,
+            theta_jn=0.9614,
+            psi=1.6831,
+            phase=5.2220,
+            geocent_time=0,
+            ra=0.9978,
+            dec=-0.4476
+        )
+        self.params2 = self.params.copy()
+        self.params2.update(dict(mass_2=20))
+        self.wf1 = Waveform.inject_signal(self.params)
+        self.wf2 = Waveform.inject_signal(self.params2)
+
+    def test_attach(self):
+        for backend in ["shm", "mmap"]:
+            with WaveformStore(backend) as store:
+                handle = store.add(self.wf1)
+                self.assertLess(len(pickle.dumps(handle)), 500)
+                wf = attach(handle)
+                np.testing.assert_array_equal(wf.frequency, self.wf1.frequency)
+                np.testing.assert_array_equal(
+                    wf.frequency_domain_signal['plus'], self.wf1.frequency_domain_signal['plus'])
+
+    def test_overlaps_from_handles(self):
+        expected = [compute_overlap(self.wf1, self.wf1), compute_overlap(self.wf1, self.wf2)]
+        for backend in ["shm", "mmap"]:
+            with WaveformStore(backend) as store:
+                h1, h2 = store.add(self.wf1), store.add(self.wf2)
+                for executor in ["serial", "process"]:
+                    overlaps = calculate_multiple_overlaps_from_handles(
+                        [h1, h1], [h1, h2], executor=executor)
+                    np.testing.assert_allclose(overlaps, expected)
+
+    def test_fft_overlaps_from_handles(self):
+        with WaveformStore() as store:
+            h1 = store.add(self.wf1)
+            shifted = Waveform.inject_signal(self.params)
+            shifted.time_shift(0.5)
+            h2 = store.add(shifted)
+            (time, phase, overlap), = calculate_multiple_fft_overlaps_from_handles(
+                [h1], [h2], executor="process")
+            self.assertLess(compute_overlap(self.wf1, shifted), 0.5)
+            self.assertAlmostEqual(overlap, 1, places=3)
+            self.assertAlmostEqual(abs(time), 0.5, places=2)
+            self.assertEqual((time, phase, overlap), fft_overlap_from_handles(h1, h2))
+
+
+if __name__ == '__main__':
+    unittest.main()